@@ -0,0 +1,36 @@
+"""composite indexes for task query shapes
+
+Revision ID: 0002_task_query_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-17 10:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002_task_query_indexes"
+down_revision: Union[str, None] = "0001_initial_schema"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # get_tasks_by_user / get_tasks_with_filters / get_tasks_by_date_range
+    op.create_index("ix_tasks_owner_id_created_at", "tasks", ["owner_id", "created_at"])
+    # sort_by=updated_at
+    op.create_index("ix_tasks_owner_id_updated_at", "tasks", ["owner_id", "updated_at"])
+    # completed filter, get_user_activity_summary (completed in period)
+    op.create_index("ix_tasks_owner_id_completed_updated_at", "tasks", ["owner_id", "completed", "updated_at"])
+    # cleanup_old_tasks scans across all owners
+    op.create_index("ix_tasks_completed_updated_at", "tasks", ["completed", "updated_at"])
+    op.execute("ANALYZE")
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tasks_completed_updated_at", table_name="tasks")
+    op.drop_index("ix_tasks_owner_id_completed_updated_at", table_name="tasks")
+    op.drop_index("ix_tasks_owner_id_updated_at", table_name="tasks")
+    op.drop_index("ix_tasks_owner_id_created_at", table_name="tasks")
@@ -0,0 +1,76 @@
+"""full-text search index for tasks
+
+Revision ID: 0003_task_search_index
+Revises: 0002_task_query_indexes
+Create Date: 2026-10-17 10:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003_task_search_index"
+down_revision: Union[str, None] = "0002_task_query_indexes"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Frozen copy of the DDL in app/search.py as of this revision
+SQLITE_UPGRADE = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        title, description,
+        content='tasks', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')",
+]
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS tasks_fts_au",
+    "DROP TRIGGER IF EXISTS tasks_fts_ad",
+    "DROP TRIGGER IF EXISTS tasks_fts_ai",
+    "DROP TABLE IF EXISTS tasks_fts",
+]
+POSTGRES_UPGRADE = [
+    """
+    CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN ((
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ))
+    """,
+]
+POSTGRES_DOWNGRADE = ["DROP INDEX IF EXISTS ix_tasks_search_vector"]
+
+
+def _run(statements: dict) -> None:
+    for statement in statements.get(op.get_bind().dialect.name, []):
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    # SQLite: FTS5 table + sync triggers; Postgres: tsvector GIN expression index
+    _run({"sqlite": SQLITE_UPGRADE, "postgresql": POSTGRES_UPGRADE})
+
+
+def downgrade() -> None:
+    _run({"sqlite": SQLITE_DOWNGRADE, "postgresql": POSTGRES_DOWNGRADE})
@@ -0,0 +1,60 @@
+"""per-user task counters
+
+Revision ID: 0004_user_task_stats
+Revises: 0003_task_search_index
+Create Date: 2026-10-17 10:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004_user_task_stats"
+down_revision: Union[str, None] = "0003_task_search_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "user_task_stats",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("total_tasks", sa.Integer(), nullable=False),
+        sa.Column("completed_tasks", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("(CURRENT_TIMESTAMP)"), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    op.create_table(
+        "user_task_daily_stats",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("created_count", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("user_id", "day"),
+    )
+    # Counters for existing tasks (frozen copy of app.task_stats.BACKFILL_SQL)
+    op.execute(
+        """
+        INSERT INTO user_task_stats (user_id, total_tasks, completed_tasks, version, updated_at)
+        SELECT owner_id, COUNT(id), SUM(CASE WHEN completed THEN 1 ELSE 0 END), 1, CURRENT_TIMESTAMP
+        FROM tasks WHERE owner_id IS NOT NULL GROUP BY owner_id
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO user_task_daily_stats (user_id, day, created_count)
+        SELECT owner_id, DATE(created_at), COUNT(id)
+        FROM tasks WHERE owner_id IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY owner_id, DATE(created_at)
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("user_task_daily_stats")
+    op.drop_table("user_task_stats")
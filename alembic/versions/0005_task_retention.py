@@ -0,0 +1,37 @@
+"""per-user task retention and cleanup checkpoints
+
+Revision ID: 0005_task_retention
+Revises: 0004_user_task_stats
+Create Date: 2026-10-17 10:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005_task_retention"
+down_revision: Union[str, None] = "0004_user_task_stats"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("users", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("task_retention_days", sa.Integer(), nullable=True))
+    op.create_table(
+        "retention_checkpoints",
+        sa.Column("name", sa.String(length=50), nullable=False),
+        sa.Column("last_id", sa.Integer(), nullable=False),
+        sa.Column("run_started_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.text("(CURRENT_TIMESTAMP)"), nullable=True),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("retention_checkpoints")
+    with op.batch_alter_table("users", schema=None) as batch_op:
+        batch_op.drop_column("task_retention_days")
@@ -0,0 +1,40 @@
+"""archive tier for aged-out tasks
+
+Revision ID: 0006_tasks_archive
+Revises: 0005_task_retention
+Create Date: 2026-10-17 10:50:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006_tasks_archive"
+down_revision: Union[str, None] = "0005_task_retention"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "tasks_archive",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(length=200), nullable=False),
+        sa.Column("description", sa.Text(), nullable=True),
+        sa.Column("completed", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("owner_id", sa.Integer(), nullable=True),
+        sa.Column("archived_at", sa.DateTime(timezone=True), server_default=sa.text("(CURRENT_TIMESTAMP)"), nullable=True),
+        sa.ForeignKeyConstraint(["owner_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_tasks_archive_owner_id_created_at", "tasks_archive", ["owner_id", "created_at"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tasks_archive_owner_id_created_at", table_name="tasks_archive")
+    op.drop_table("tasks_archive")
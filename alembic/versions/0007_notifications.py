@@ -0,0 +1,54 @@
+"""notification digest queue
+
+Revision ID: 0007_notifications
+Revises: 0006_tasks_archive
+Create Date: 2026-10-17 16:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0007_notifications"
+down_revision: Union[str, None] = "0006_tasks_archive"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "notifications",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("idempotency_key", sa.String(length=255), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("task_id", sa.Integer(), nullable=True),
+        sa.Column("task_title", sa.String(length=200), nullable=False),
+        sa.Column("notification_type", sa.String(length=50), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.Column("claim_token", sa.String(length=32), nullable=True),
+        sa.Column("claimed_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("last_error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.text("(CURRENT_TIMESTAMP)"), nullable=True),
+        sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_notifications_status_user_id_created_at", "notifications", ["status", "user_id", "created_at"], unique=False
+    )
+    # Deduplicates only undelivered rows: a later event with the same key is queued again
+    op.create_index(
+        "ux_notifications_idempotency_key_undelivered", "notifications", ["idempotency_key"], unique=True,
+        sqlite_where=sa.text("status IN ('pending', 'sending')"),
+        postgresql_where=sa.text("status IN ('pending', 'sending')"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ux_notifications_idempotency_key_undelivered", table_name="notifications")
+    op.drop_index("ix_notifications_status_user_id_created_at", table_name="notifications")
+    op.drop_table("notifications")
@@ -0,0 +1,70 @@
+"""never reuse task ids (SQLite AUTOINCREMENT)
+
+Revision ID: 0008_tasks_autoincrement
+Revises: 0007_notifications
+Create Date: 2026-10-17 18:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008_tasks_autoincrement"
+down_revision: Union[str, None] = "0007_notifications"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rebuilding tasks drops its triggers; same definitions as 0003
+FTS_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+
+def _rebuild_tasks(autoincrement: bool) -> None:
+    with op.batch_alter_table(
+        "tasks", recreate="always", table_kwargs={"sqlite_autoincrement": autoincrement}
+    ):
+        pass
+    for statement in FTS_TRIGGERS:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    # Postgres sequences never hand out an id twice; only SQLite rowids get reused
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    _rebuild_tasks(autoincrement=True)
+    # Archived ids must never come back for new tasks either
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'tasks'")
+    op.execute(
+        """
+        INSERT INTO sqlite_sequence(name, seq)
+        SELECT 'tasks', max(
+            (SELECT coalesce(max(id), 0) FROM tasks),
+            (SELECT coalesce(max(id), 0) FROM tasks_archive)
+        )
+        """
+    )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    _rebuild_tasks(autoincrement=False)
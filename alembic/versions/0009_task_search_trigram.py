@@ -0,0 +1,92 @@
+"""substring search: trigram indexes instead of word-prefix full-text
+
+Revision ID: 0009_task_search_trigram
+Revises: 0008_tasks_autoincrement
+Create Date: 2026-10-17 19:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009_task_search_trigram"
+down_revision: Union[str, None] = "0008_tasks_autoincrement"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS tasks_fts_au",
+    "DROP TRIGGER IF EXISTS tasks_fts_ad",
+    "DROP TRIGGER IF EXISTS tasks_fts_ai",
+    "DROP TABLE IF EXISTS tasks_fts",
+]
+SQLITE_TRIGRAM_TABLE = """
+    CREATE VIRTUAL TABLE tasks_fts USING fts5(
+        title, description,
+        content='tasks', content_rowid='id',
+        tokenize='trigram'
+    )
+"""
+SQLITE_WORD_TABLE = """
+    CREATE VIRTUAL TABLE tasks_fts USING fts5(
+        title, description,
+        content='tasks', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+"""
+SQLITE_REBUILD = "INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')"
+
+POSTGRES_TSVECTOR_INDEX = """
+    CREATE INDEX IF NOT EXISTS ix_tasks_search_vector ON tasks USING GIN ((
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ))
+"""
+
+
+def _sqlite_recreate(create_table: str) -> None:
+    for statement in [*SQLITE_DROP, create_table, *SQLITE_TRIGGERS, SQLITE_REBUILD]:
+        op.execute(statement)
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _sqlite_recreate(SQLITE_TRIGRAM_TABLE)
+    elif dialect == "postgresql":
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_tasks_search_trgm ON tasks "
+            "USING GIN (title gin_trgm_ops, description gin_trgm_ops)"
+        )
+        op.execute("DROP INDEX IF EXISTS ix_tasks_search_vector")
+
+
+def downgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        _sqlite_recreate(SQLITE_WORD_TABLE)
+    elif dialect == "postgresql":
+        op.execute(POSTGRES_TSVECTOR_INDEX)
+        op.execute("DROP INDEX IF EXISTS ix_tasks_search_trgm")
@@ -0,0 +1,142 @@
+"""
+Файловое хранилище артефактов экспорта (EXPORT_ARTIFACT_DIR).
+
+Артефакт — сжатый gzip файл экспорта одного пользователя. Его идентификатор —
+хэш (пользователь, формат, фильтры, версия данных из task_stats), поэтому
+повторный экспорт неизменившихся данных отдаётся с диска, а любая запись
+задач меняет версию и ведёт к новому артефакту.
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from .config import EXPORT_ARTIFACT_DIR, EXPORT_ARTIFACT_TTL_HOURS
+
+ARTIFACT_ID_PATTERN = re.compile(r"^[0-9a-f]{40}$")
+
+
+def artifact_id_for(user_id: int, export_format: str, filters: Dict[str, Any], data_version: int) -> str:
+    payload = json.dumps(
+        {"user": user_id, "format": export_format, "filters": filters, "version": data_version},
+        sort_keys=True,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def user_dir(user_id: int, root: Optional[str] = None) -> str:
+    return os.path.join(root or EXPORT_ARTIFACT_DIR, str(user_id))
+
+
+def artifact_path(user_id: int, artifact_id: str, export_format: str, root: Optional[str] = None) -> str:
+    return os.path.join(user_dir(user_id, root), f"{artifact_id}.{export_format}.gz")
+
+
+def find_artifact(user_id: int, artifact_id: str, root: Optional[str] = None) -> Optional[str]:
+    """Путь к готовому артефакту пользователя или None (чужие и незавершённые не находятся)."""
+    if not ARTIFACT_ID_PATTERN.match(artifact_id):
+        return None
+    matches = glob.glob(os.path.join(user_dir(user_id, root), f"{artifact_id}.*.gz"))
+    return matches[0] if matches else None
+
+
+def artifact_etag(path: str) -> str:
+    # The file name is content-addressed by data version; size and mtime cover a rebuild
+    stat = os.stat(path)
+    return f'"{os.path.basename(path).split(".")[0]}-{stat.st_size:x}-{int(stat.st_mtime):x}"'
+
+
+def write_artifact(path: str, chunks: Iterable[bytes]) -> int:
+    """Записать поток в артефакт атомарно (через .part) и вернуть размер."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial_path = f"{path}.{os.getpid()}.part"
+    size = 0
+    try:
+        with open(partial_path, "wb") as artifact_file:
+            for chunk in chunks:
+                artifact_file.write(chunk)
+                size += len(chunk)
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.unlink(partial_path)
+        raise
+    return size
+
+
+def pending_job(user_id: int, artifact_id: str, root: Optional[str] = None) -> Optional[str]:
+    """id Celery-задачи, которая уже строит этот артефакт."""
+    try:
+        with open(os.path.join(user_dir(user_id, root), f"{artifact_id}.job")) as job_file:
+            return job_file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_pending_job(user_id: int, artifact_id: str, job_id: Optional[str], root: Optional[str] = None) -> None:
+    marker = os.path.join(user_dir(user_id, root), f"{artifact_id}.job")
+    if job_id is None:
+        if os.path.exists(marker):
+            os.unlink(marker)
+        return
+    os.makedirs(os.path.dirname(marker), exist_ok=True)
+    with open(marker, "w") as job_file:
+        job_file.write(job_id)
+
+
+def prune_expired(user_id: int, ttl_hours: float = EXPORT_ARTIFACT_TTL_HOURS, root: Optional[str] = None) -> int:
+    """Удалить артефакты пользователя старше ttl_hours; вернуть число удалённых файлов."""
+    cutoff = time.time() - ttl_hours * 3600
+    removed = 0
+    for path in glob.glob(os.path.join(user_dir(user_id, root), "*")):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.unlink(path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
+
+
+def parse_byte_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Разобрать заголовок Range (один диапазон bytes=...) в (start, end) включительно.
+
+    None — заголовка нет или он не поддерживается (отдаётся весь файл);
+    ValueError — диапазон вне файла (416).
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, separator, end_text = header[len("bytes="):].strip().partition("-")
+    if not separator or not (start_text or end_text) or not all(
+        part.isdigit() for part in (start_text, end_text) if part
+    ):
+        # Malformed ranges are ignored (RFC 7233), not rejected
+        return None
+    if start_text:
+        start = int(start_text)
+        end = int(end_text) if end_text else size - 1
+    else:
+        # Suffix range: the last N bytes
+        suffix = int(end_text)
+        if suffix == 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(size - suffix, 0), size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Range not satisfiable for {size} bytes")
+    return start, min(end, size - 1)
+
+
+def iter_file_range(path: str, start: int, end: int, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    with open(path, "rb") as artifact_file:
+        artifact_file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = artifact_file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
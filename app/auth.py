@@ -1,26 +1,32 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+import threading
+import time
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from .config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from .database import get_db
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached, object_session
+from .config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, USER_CACHE_TTL_SECONDS, USER_CACHE_MAX_SIZE
+from .database import get_db, get_async_db
 from .models import User
 from .schemas import TokenData
+from .passwords import password_service
+from .metrics import record_cache_lookup
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing (bcrypt runs in the bounded pool of app/passwords.py)
+pwd_context = password_service.context
 
 # HTTP Bearer for JWT tokens
 security = HTTPBearer()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_service.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_service.hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -33,6 +39,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def create_user_access_token(user: User, expires_delta: Optional[timedelta] = None):
+    # "uid" lets get_current_user resolve the user from the cache without a username lookup
+    return create_access_token(data={"sub": user.username, "uid": user.id}, expires_delta=expires_delta)
+
 def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -45,12 +55,124 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
+        token_data = TokenData(username=username, user_id=payload.get("uid"))
     except JWTError:
         raise credentials_exception
     
     return token_data
 
+class UserCache:
+    """
+    Ограниченный LRU с TTL: токен (uid или username) -> снимок колонок пользователя.
+    Снимок превращается в объект сессии через merge(load=False), без SELECT.
+    Инвалидация действует только в своём процессе: другие процессы видят изменения
+    пользователя не позже чем через ttl секунд
+    """
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = max_size > 0 and ttl > 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def key_for(token: TokenData):
+        if token.user_id is not None:
+            return ("id", token.user_id)
+        return ("username", token.username)
+    
+    def get(self, key) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                record_cache_lookup("user", "auth", False)
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+        record_cache_lookup("user", "auth", True)
+        return item[0]
+    
+    def put(self, key, user: User) -> None:
+        if not self.enabled:
+            return
+        snapshot = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        with self._lock:
+            self._data[key] = (snapshot, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+    
+    def invalidate(self, user_id: Optional[int] = None, username: Optional[str] = None) -> None:
+        with self._lock:
+            for key in [key for key, (snapshot, _) in self._data.items()
+                        if snapshot["id"] == user_id or snapshot["username"] == username]:
+                del self._data[key]
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+user_cache = UserCache(max_size=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+
+def invalidate_user_cache(user_id: Optional[int] = None, username: Optional[str] = None) -> None:
+    """
+    Сбросить закэшированного пользователя (вызывается автоматически при изменении User)
+    """
+    user_cache.invalidate(user_id=user_id, username=username)
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _remember_changed_user(mapper, connection, target):
+    invalidate_user_cache(user_id=target.id, username=target.username)
+    # Invalidate again after commit so a concurrent request cannot re-cache the old row
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("changed_users", set()).add((target.id, target.username))
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id, username in session.info.pop("changed_users", ()):
+        invalidate_user_cache(user_id=user_id, username=username)
+
+def resolve_user(db: Session, token: TokenData) -> Optional[User]:
+    key = user_cache.key_for(token)
+    snapshot = user_cache.get(key)
+    if snapshot is not None and snapshot["username"] == token.username:
+        cached_user = User(**snapshot)
+        make_transient_to_detached(cached_user)
+        return db.merge(cached_user, load=False)
+    
+    if token.user_id is not None:
+        user = db.get(User, token.user_id)
+        if user is not None and user.username != token.username:
+            user = None
+    else:
+        user = db.query(User).filter(User.username == token.username).first()
+    if user is not None:
+        user_cache.put(key, user)
+    return user
+
+def user_from_token(db: Session, token: str) -> Optional[User]:
+    """
+    Активный пользователь по JWT вне заголовка Authorization (например, ?token= у WebSocket)
+    """
+    try:
+        token_data = verify_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token))
+    except HTTPException:
+        return None
+    user = resolve_user(db, token_data)
+    if user is None or user.is_active is False:
+        return None
+    return user
+
 def get_current_user(token: TokenData = Depends(verify_token), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -58,15 +180,34 @@ def get_current_user(token: TokenData = Depends(verify_token), db: Session = Dep
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    user = db.query(User).filter(User.username == token.username).first()
-    if user is None:
+    user = resolve_user(db, token)
+    if user is None or user.is_active is False:
         raise credentials_exception
     return user
 
+async def get_current_user_async(token: TokenData = Depends(verify_token), db: AsyncSession = Depends(get_async_db)):
+    user = await db.run_sync(resolve_user, token)
+    if user is None or user.is_active is False:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
 def authenticate_user(db: Session, username: str, password: str):
     user = db.query(User).filter(User.username == username).first()
     if not user:
         return False
     if not verify_password(password, user.hashed_password):
         return False
+    return user
+
+async def authenticate_user_async(db: AsyncSession, username: str, password: str):
+    result = await db.execute(select(User).where(User.username == username).limit(1))
+    user = result.scalars().first()
+    if not user:
+        return False
+    if not await password_service.verify_async(password, user.hashed_password):
+        return False
     return user 
\ No newline at end of file
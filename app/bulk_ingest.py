@@ -0,0 +1,228 @@
+"""
+Пакетная вставка задач для process_bulk_tasks и импорта из файлов.
+
+Импорт NDJSON/CSV: spool_upload потоково пишет тело запроса во временный
+файл в IMPORT_SPOOL_DIR, Celery-задача получает только путь и читает файл
+построчно через iter_import_file.
+
+Задачи вставляются чанками: один многострочный INSERT ... RETURNING и одна
+транзакция на чанк (вместе со счётчиками task_stats). Ошибка в чанке
+откатывает только его и попадает в отчёт, остальные чанки продолжаются.
+Невалидные строки отбрасываются до вставки и тоже попадают в отчёт чанка.
+"""
+import csv
+import json
+import os
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from . import task_stats
+from .cache import invalidate_owner
+from .config import BULK_INSERT_CHUNK_SIZE, BULK_RESULT_PREVIEW, IMPORT_SPOOL_DIR, IMPORT_MAX_BYTES
+from .models import Task
+
+TITLE_MAX_LENGTH = Task.__table__.c.title.type.length
+REJECTED_SAMPLE_SIZE = 10
+
+IMPORT_FORMATS = ("ndjson", "csv")
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class ImportTooLarge(Exception):
+    """Загружаемый файл превышает IMPORT_MAX_BYTES."""
+
+
+class ImportRowError(ValueError):
+    """Строка файла, которую не удалось разобрать (отклоняется при вставке)."""
+
+
+def validate_task_row(task_data: Any) -> Optional[str]:
+    """Вернуть текст ошибки для строки импорта или None, если строка валидна."""
+    if isinstance(task_data, ImportRowError):
+        return str(task_data)
+    if not isinstance(task_data, dict):
+        return "Task must be an object"
+    title = task_data.get("title")
+    if not isinstance(title, str) or not title.strip():
+        return "Each task must have a title"
+    if len(title) > TITLE_MAX_LENGTH:
+        return f"Title longer than {TITLE_MAX_LENGTH} characters"
+    description = task_data.get("description")
+    if description is not None and not isinstance(description, str):
+        return "Description must be a string"
+    return None
+
+
+def insert_chunk(db: Session, user_id: int, rows: List[Dict[str, Any]]) -> List[Any]:
+    """Вставить чанк одним INSERT ... RETURNING и обновить счётчики; коммит делает вызывающий."""
+    # Unsorted RETURNING lets SQLAlchemy batch the rows into multi-row VALUES
+    # (sort_by_parameter_order falls back to one statement per row on SQLite)
+    inserted = sorted(
+        db.execute(insert(Task).returning(Task.id, Task.title, Task.created_at, Task.completed), rows).all(),
+        key=lambda row: row.id,
+    )
+    task_stats.apply_task_rows(db, user_id, [(row.created_at, row.completed) for row in inserted])
+    return inserted
+
+
+def ingest_tasks(
+    db: Session,
+    user_id: int,
+    tasks_data: Iterable[Dict[str, Any]],
+    total: Optional[int] = None,
+    chunk_size: int = BULK_INSERT_CHUNK_SIZE,
+    on_progress: Optional[ProgressCallback] = None,
+    preview_size: int = BULK_RESULT_PREVIEW,
+) -> Dict[str, Any]:
+    """
+    Вставить задачи пользователя чанками и вернуть компактный отчёт.
+
+    tasks_data может быть генератором (импорт из файла), тогда total задаётся
+    отдельно или остаётся неизвестным. on_progress вызывается после каждого чанка.
+    """
+    report: Dict[str, Any] = {
+        "total": total,
+        "processed": 0,
+        "inserted": 0,
+        "rejected": 0,
+        "failed": 0,
+        "chunks": [],
+        "tasks": [],
+    }
+
+    def flush(chunk_index: int, start: int, rows: List[Dict[str, Any]], rejected: List[Dict[str, Any]]) -> None:
+        chunk: Dict[str, Any] = {
+            "chunk": chunk_index,
+            "start": start,
+            "size": len(rows) + len(rejected),
+            "inserted": 0,
+            "rejected": len(rejected),
+        }
+        if rejected:
+            # A sample is enough to fix the source file; the count is exact
+            chunk["rejected_rows"] = rejected[:REJECTED_SAMPLE_SIZE]
+        if rows:
+            try:
+                inserted = insert_chunk(db, user_id, rows)
+                db.commit()
+            except SQLAlchemyError as exc:
+                db.rollback()
+                chunk["error"] = str(exc.orig if getattr(exc, "orig", None) is not None else exc)
+                report["failed"] += len(rows)
+            else:
+                chunk["inserted"] = len(inserted)
+                chunk["first_id"] = inserted[0].id
+                chunk["last_id"] = inserted[-1].id
+                report["inserted"] += len(inserted)
+                for row in inserted[:max(preview_size - len(report["tasks"]), 0)]:
+                    report["tasks"].append({
+                        "id": row.id,
+                        "title": row.title,
+                        "created_at": row.created_at.isoformat() if row.created_at else None,
+                    })
+        report["processed"] += chunk["size"]
+        report["rejected"] += len(rejected)
+        report["chunks"].append(chunk)
+        if on_progress is not None:
+            on_progress(report)
+
+    try:
+        rows: List[Dict[str, Any]] = []
+        rejected: List[Dict[str, Any]] = []
+        chunk_index = 0
+        chunk_start = 0
+        for position, task_data in enumerate(tasks_data):
+            error = validate_task_row(task_data)
+            if error:
+                rejected.append({"index": position, "error": error})
+            else:
+                rows.append({
+                    "title": task_data["title"],
+                    "description": task_data.get("description", ""),
+                    "completed": False,
+                    "owner_id": user_id,
+                })
+            if len(rows) + len(rejected) >= chunk_size:
+                flush(chunk_index, chunk_start, rows, rejected)
+                chunk_index += 1
+                chunk_start = position + 1
+                rows, rejected = [], []
+        if rows or rejected:
+            flush(chunk_index, chunk_start, rows, rejected)
+    finally:
+        if report["inserted"]:
+            invalidate_owner(user_id)
+
+    if report["total"] is None:
+        report["total"] = report["processed"]
+    return report
+
+
+async def spool_upload(
+    chunks: AsyncIterator[bytes],
+    user_id: int,
+    file_format: str,
+    spool_dir: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+) -> str:
+    """
+    Записать поток тела запроса в spool-файл с постоянным расходом памяти и вернуть путь.
+
+    Файл появляется под итоговым именем только после полной записи.
+    """
+    spool_dir = spool_dir or IMPORT_SPOOL_DIR
+    max_bytes = IMPORT_MAX_BYTES if max_bytes is None else max_bytes
+    os.makedirs(spool_dir, exist_ok=True)
+    path = os.path.join(spool_dir, f"{user_id}-{uuid.uuid4().hex}.{file_format}")
+    partial_path = path + ".part"
+    written = 0
+    spool_file = await run_in_threadpool(open, partial_path, "wb")
+    try:
+        async for chunk in chunks:
+            written += len(chunk)
+            if written > max_bytes:
+                raise ImportTooLarge(f"Import exceeds {max_bytes} bytes")
+            # Disk writes stay off the event loop
+            await run_in_threadpool(spool_file.write, chunk)
+    except BaseException:
+        spool_file.close()
+        os.unlink(partial_path)
+        raise
+    spool_file.close()
+    os.replace(partial_path, path)
+    return path
+
+
+def iter_import_file(path: str, file_format: str) -> Iterator[Any]:
+    """Читать задачи из NDJSON (объект на строку) или CSV (колонки title, description) построчно."""
+    if file_format == "ndjson":
+        with open(path, encoding="utf-8-sig") as import_file:
+            for line_number, line in enumerate(import_file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield ImportRowError(f"Invalid JSON on line {line_number}")
+    elif file_format == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as import_file:
+            for row in csv.DictReader(import_file):
+                yield {"title": row.get("title"), "description": row.get("description") or ""}
+    else:
+        raise ValueError(f"Unsupported import format: {file_format}")
+
+
+def count_import_rows(path: str, file_format: str) -> int:
+    """Число строк импорта (для прогресса current/total); один дешёвый проход по файлу."""
+    if file_format == "csv":
+        with open(path, newline="", encoding="utf-8-sig") as import_file:
+            return sum(1 for _ in csv.DictReader(import_file))
+    with open(path, encoding="utf-8-sig") as import_file:
+        return sum(1 for line in import_file if line.strip())
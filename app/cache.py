@@ -0,0 +1,282 @@
+"""
+Кэш чтения для списков задач и статистики.
+
+Ключи версионируются по владельцу: любая запись в задачи пользователя
+увеличивает его счётчик поколения (invalidate_owner), и старые записи больше
+никогда не читаются — они просто доживают до TTL / вытесняются LRU.
+
+Основное хранилище — Redis (тот же сервер, что и у Celery, allkeys-lru).
+Пока настроенный Redis недоступен, кэш обходится и данные читаются из БД:
+другие процессы не видят инвалидаций этого процесса, и локальная копия
+могла бы отдавать устаревшие данные. Ограниченный LRU-кэш внутри процесса
+используется только без Redis (CACHE_REDIS_URL пуст, один процесс).
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import redis
+from fastapi.encoders import jsonable_encoder
+
+from .metrics import record_cache_lookup
+from .config import (
+    CACHE_ENABLED,
+    CACHE_LOCAL_MAX_ENTRIES,
+    CACHE_LOCAL_MAX_TTL,
+    CACHE_REDIS_RETRY_SECONDS,
+    CACHE_REDIS_TIMEOUT,
+    CACHE_REDIS_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "taskcache:v1"
+
+
+class LocalCacheBackend:
+    """
+    LRU с TTL внутри процесса (только когда Redis не настроен)
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+        with self._lock:
+            expires_at = time.monotonic() + ttl if ttl else None
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value, expires_at = self._data.get(key, ("0", None))
+            value = str(int(value) + 1)
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            return int(value)
+
+    def set_if_missing(self, key: str, value: str) -> None:
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = (value, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class TaskCache:
+    def __init__(
+        self,
+        redis_url: Optional[str],
+        enabled: bool = True,
+        local_max_entries: int = 1024,
+        local_max_ttl: int = 30,
+        redis_timeout: float = 0.1,
+        redis_retry_seconds: float = 30.0,
+    ):
+        self.enabled = enabled
+        self.local = LocalCacheBackend(local_max_entries)
+        self.local_max_ttl = local_max_ttl
+        self.redis_retry_seconds = redis_retry_seconds
+        self._redis = None
+        if redis_url:
+            self._redis = redis.Redis.from_url(
+                redis_url,
+                socket_timeout=redis_timeout,
+                socket_connect_timeout=redis_timeout,
+                decode_responses=True,
+            )
+        self._redis_down_until = 0.0
+        # Owners bumped while Redis was down; replayed once it is back
+        self._missed_bumps = set()
+        self._lock = threading.Lock()
+        self.metrics = {"hits": 0, "misses": 0, "sets": 0, "invalidations": 0, "redis_errors": 0, "bypassed": 0}
+
+    # --- backend selection -------------------------------------------------
+
+    def _redis_client(self):
+        if self._redis is None or time.monotonic() < self._redis_down_until:
+            return None
+        if self._missed_bumps:
+            with self._lock:
+                missed, self._missed_bumps = self._missed_bumps, set()
+            try:
+                for owner_id in missed:
+                    self._redis.incr(self._generation_key(owner_id))
+            except redis.RedisError as exc:
+                with self._lock:
+                    self._missed_bumps |= missed
+                self._mark_redis_down(exc)
+                return None
+        return self._redis
+
+    def _mark_redis_down(self, exc: Exception) -> None:
+        self.metrics["redis_errors"] += 1
+        if time.monotonic() >= self._redis_down_until:
+            logger.warning("Cache Redis unavailable (%s); bypassing the cache for %ss", exc, self.redis_retry_seconds)
+        self._redis_down_until = time.monotonic() + self.redis_retry_seconds
+
+    def backend_name(self) -> str:
+        if self._redis is None:
+            return "local"
+        return "redis" if time.monotonic() >= self._redis_down_until else "bypass"
+
+    # --- keys ----------------------------------------------------------------
+
+    @staticmethod
+    def _generation_key(owner_id: int) -> str:
+        return f"{KEY_PREFIX}:gen:{owner_id}"
+
+    @staticmethod
+    def _entry_key(owner_id: int, generation: int, namespace: str, params: Dict[str, Any]) -> str:
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return f"{KEY_PREFIX}:{owner_id}:{generation}:{namespace}:{digest}"
+
+    # --- generations ---------------------------------------------------------
+
+    def generation(self, owner_id: int) -> int:
+        key = self._generation_key(owner_id)
+        # Start from the clock so an evicted counter never goes back to an old value
+        initial = str(int(time.time() * 1000))
+        client = self._redis_client()
+        if client is not None:
+            try:
+                client.set(key, initial, nx=True)
+                return int(client.get(key) or initial)
+            except redis.RedisError as exc:
+                self._mark_redis_down(exc)
+        self.local.set_if_missing(key, initial)
+        return int(self.local.get(key) or initial)
+
+    def invalidate_owner(self, owner_id: int) -> None:
+        """
+        Сделать недействительными все закэшированные данные владельца
+        """
+        if not self.enabled:
+            return
+        self.metrics["invalidations"] += 1
+        key = self._generation_key(owner_id)
+        self.local.incr(key)
+        client = self._redis_client()
+        if client is not None:
+            try:
+                client.incr(key)
+                return
+            except redis.RedisError as exc:
+                self._mark_redis_down(exc)
+        if self._redis is not None:
+            with self._lock:
+                self._missed_bumps.add(owner_id)
+
+    # --- read-through --------------------------------------------------------
+
+    def get_or_load(
+        self,
+        owner_id: int,
+        namespace: str,
+        params: Dict[str, Any],
+        loader: Callable[[], Any],
+        ttl: int,
+    ) -> Any:
+        """
+        Вернуть значение из кэша или вызвать loader и сохранить результат.
+        Результат loader должен сериализоваться в JSON (через jsonable_encoder)
+        """
+        if not self.enabled:
+            return loader()
+
+        client = self._redis_client()
+        if client is None and self._redis is not None:
+            return self._bypass(loader)
+
+        # Generation is read before loading so a concurrent write is never cached as current
+        generation = self.generation(owner_id)
+        key = self._entry_key(owner_id, generation, namespace, params)
+
+        if client is not None:
+            try:
+                cached = client.get(key)
+            except redis.RedisError as exc:
+                self._mark_redis_down(exc)
+                return self._bypass(loader)
+        else:
+            cached = self.local.get(key)
+
+        record_cache_lookup("tasks", namespace, cached is not None)
+        if cached is not None:
+            self.metrics["hits"] += 1
+            return json.loads(cached)
+
+        self.metrics["misses"] += 1
+        value = jsonable_encoder(loader())
+        payload = json.dumps(value)
+        if client is not None:
+            try:
+                client.set(key, payload, ex=ttl)
+            except redis.RedisError as exc:
+                self._mark_redis_down(exc)
+                return value
+        else:
+            self.local.set(key, payload, ttl=min(ttl, self.local_max_ttl))
+        self.metrics["sets"] += 1
+        return value
+
+    def _bypass(self, loader: Callable[[], Any]) -> Any:
+        # Other processes cannot see our invalidations while Redis is down: never serve a local copy
+        self.metrics["bypassed"] += 1
+        return jsonable_encoder(loader())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.metrics["hits"] + self.metrics["misses"]
+        result = dict(self.metrics)
+        result.update({
+            "enabled": self.enabled,
+            "backend": self.backend_name(),
+            "hit_rate": round(self.metrics["hits"] / lookups, 4) if lookups else 0.0,
+            "local_entries": len(self.local._data),
+            "local_evictions": self.local.evictions,
+        })
+        client = self._redis_client()
+        if client is not None:
+            try:
+                result["redis_evicted_keys"] = client.info("stats").get("evicted_keys", 0)
+            except redis.RedisError as exc:
+                self._mark_redis_down(exc)
+        return result
+
+
+cache = TaskCache(
+    redis_url=CACHE_REDIS_URL,
+    enabled=CACHE_ENABLED,
+    local_max_entries=CACHE_LOCAL_MAX_ENTRIES,
+    local_max_ttl=CACHE_LOCAL_MAX_TTL,
+    redis_timeout=CACHE_REDIS_TIMEOUT,
+    redis_retry_seconds=CACHE_REDIS_RETRY_SECONDS,
+)
+
+
+def invalidate_owner(owner_id: int) -> None:
+    cache.invalidate_owner(owner_id)
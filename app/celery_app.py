@@ -1,5 +1,5 @@
 from celery import Celery
-from .config import DATABASE_URL
+from .config import DATABASE_URL, NOTIFICATION_FLUSH_INTERVAL_SECONDS
 import os
 
 # Celery configuration
@@ -11,7 +11,9 @@ celery_app = Celery(
     "task_manager",
     broker=CELERY_BROKER_URL,
     backend=CELERY_RESULT_BACKEND,
-    include=["app.tasks"]
+    include=["app.tasks"],
+    # update_state and final results are also pushed to the SSE/WebSocket progress streams
+    task_cls="app.progress:ProgressTask"
 )
 
 # Celery configuration
@@ -24,7 +26,10 @@ celery_app.conf.update(
     task_track_started=True,
     task_routes={
         "app.tasks.send_email_notification": {"queue": "notifications"},
+        "app.tasks.flush_notification_digests": {"queue": "notifications"},
         "app.tasks.process_bulk_tasks": {"queue": "bulk_operations"},
+        "app.tasks.import_tasks_from_file": {"queue": "bulk_operations"},
+        "app.tasks.export_tasks_to_artifact": {"queue": "bulk_operations"},
         "app.tasks.cleanup_old_tasks": {"queue": "maintenance"},
     },
     beat_schedule={
@@ -32,5 +37,12 @@ celery_app.conf.update(
             'task': 'app.tasks.cleanup_old_tasks',
             'schedule': 86400.0,  # Run daily (24 hours)
         },
+        'flush-notification-digests': {
+            'task': 'app.tasks.flush_notification_digests',
+            'schedule': NOTIFICATION_FLUSH_INTERVAL_SECONDS,
+        },
     }
-) 
\ No newline at end of file
+)
+
+# Task runtime/retry signal handlers for /metrics
+from . import metrics  # noqa: E402,F401 
\ No newline at end of file
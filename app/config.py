@@ -3,11 +3,118 @@ import os
 
 # Database
 DATABASE_URL = config("DATABASE_URL", default="sqlite:///./test.db")
+# Async API layer: DATABASE_ASYNC serves /api/tasks through AsyncSession;
+# the async URL is derived from DATABASE_URL (aiosqlite / asyncpg) unless set explicitly
+DATABASE_ASYNC = config("DATABASE_ASYNC", default=False, cast=bool)
+DATABASE_ASYNC_URL = config("DATABASE_ASYNC_URL", default="")
+# Connection pool (file SQLite and server databases); pre-ping/recycle apply to server databases only
+DB_POOL_SIZE = config("DB_POOL_SIZE", default=5, cast=int)
+DB_MAX_OVERFLOW = config("DB_MAX_OVERFLOW", default=10, cast=int)
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=30, cast=float)
+DB_POOL_RECYCLE = config("DB_POOL_RECYCLE", default=1800, cast=int)
+DB_POOL_PRE_PING = config("DB_POOL_PRE_PING", default=True, cast=bool)
+# SQLite PRAGMAs applied on every new connection (WAL lets API, worker and beat write concurrently)
+SQLITE_JOURNAL_MODE = config("SQLITE_JOURNAL_MODE", default="WAL")
+SQLITE_SYNCHRONOUS = config("SQLITE_SYNCHRONOUS", default="NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = config("SQLITE_BUSY_TIMEOUT_MS", default=5000, cast=int)
+SQLITE_MMAP_SIZE = config("SQLITE_MMAP_SIZE", default=268435456, cast=int)
+SQLITE_CACHE_SIZE = config("SQLITE_CACHE_SIZE", default=-65536, cast=int)  # negative = KiB
+
+# Bulk ingest (process_bulk_tasks): rows per INSERT ... RETURNING transaction and request cap
+BULK_INSERT_CHUNK_SIZE = config("BULK_INSERT_CHUNK_SIZE", default=1000, cast=int)
+BULK_CREATE_MAX_TASKS = config("BULK_CREATE_MAX_TASKS", default=100000, cast=int)
+BULK_RESULT_PREVIEW = config("BULK_RESULT_PREVIEW", default=100, cast=int)
+# Streaming NDJSON/CSV import: uploads are spooled here (shared by API and worker) and capped in size
+IMPORT_SPOOL_DIR = config("IMPORT_SPOOL_DIR", default="./data/imports")
+IMPORT_MAX_BYTES = config("IMPORT_MAX_BYTES", default=512 * 1024 * 1024, cast=int)
+# Streaming export: rows fetched per server-side cursor batch and serialized per write
+EXPORT_BATCH_SIZE = config("EXPORT_BATCH_SIZE", default=1000, cast=int)
+# Background exports: gzip artifacts on disk (shared by API and worker), removed after the TTL
+EXPORT_ARTIFACT_DIR = config("EXPORT_ARTIFACT_DIR", default="./data/exports")
+EXPORT_ARTIFACT_TTL_HOURS = config("EXPORT_ARTIFACT_TTL_HOURS", default=24, cast=float)
+
+# Retention (cleanup_old_tasks): default days completed tasks are kept, ids per delete batch, pause between batches
+RETENTION_DEFAULT_DAYS = config("RETENTION_DEFAULT_DAYS", default=30, cast=int)
+RETENTION_BATCH_SIZE = config("RETENTION_BATCH_SIZE", default=1000, cast=int)
+RETENTION_BATCH_SLEEP_SECONDS = config("RETENTION_BATCH_SLEEP_SECONDS", default=0.1, cast=float)
+# "archive" moves expired tasks into tasks_archive (searchable with include_archived), "delete" drops them
+RETENTION_MODE = config("RETENTION_MODE", default="archive")
+
+# Task progress push (SSE/WebSocket): Redis streams per task, blocking read window and keep-alive interval
+PROGRESS_REDIS_URL = config("PROGRESS_REDIS_URL", default="redis://localhost:6379/1")
+PROGRESS_REDIS_TIMEOUT = config("PROGRESS_REDIS_TIMEOUT", default=0.1, cast=float)
+PROGRESS_REDIS_RETRY_SECONDS = config("PROGRESS_REDIS_RETRY_SECONDS", default=30, cast=float)
+PROGRESS_STREAM_MAXLEN = config("PROGRESS_STREAM_MAXLEN", default=200, cast=int)
+PROGRESS_STREAM_TTL_SECONDS = config("PROGRESS_STREAM_TTL_SECONDS", default=3600, cast=int)
+PROGRESS_BLOCK_MS = config("PROGRESS_BLOCK_MS", default=5000, cast=int)
+PROGRESS_HEARTBEAT_SECONDS = config("PROGRESS_HEARTBEAT_SECONDS", default=15, cast=float)
+# Progress throttling in tasks: a PROGRESS update is written at most once per interval unless it moves the bar by this many percent
+PROGRESS_MIN_INTERVAL_SECONDS = config("PROGRESS_MIN_INTERVAL_SECONDS", default=1.0, cast=float)
+PROGRESS_MIN_PERCENT = config("PROGRESS_MIN_PERCENT", default=1.0, cast=float)
+
+# Batched task-status lookups: ids per request and back-off after a result backend Redis error
+TASK_STATUS_BATCH_MAX = config("TASK_STATUS_BATCH_MAX", default=100, cast=int)
+TASK_STATUS_REDIS_RETRY_SECONDS = config("TASK_STATUS_REDIS_RETRY_SECONDS", default=30, cast=float)
+
+# Worker introspection: /active-tasks and /worker-stats serve a snapshot refreshed in the background
+WORKER_STATE_INTERVAL_SECONDS = config("WORKER_STATE_INTERVAL_SECONDS", default=10, cast=float)
+WORKER_STATE_INSPECT_TIMEOUT = config("WORKER_STATE_INSPECT_TIMEOUT", default=1.0, cast=float)
+WORKER_STATE_STALE_SECONDS = config("WORKER_STATE_STALE_SECONDS", default=30, cast=float)
+
+# Notifications: per-user digest window, beat flush interval, messages per transport connection, transport (log|file|smtp|module:Class)
+NOTIFICATION_DIGEST_WINDOW_SECONDS = config("NOTIFICATION_DIGEST_WINDOW_SECONDS", default=300, cast=float)
+NOTIFICATION_FLUSH_INTERVAL_SECONDS = config("NOTIFICATION_FLUSH_INTERVAL_SECONDS", default=60, cast=float)
+NOTIFICATION_BATCH_SIZE = config("NOTIFICATION_BATCH_SIZE", default=100, cast=int)
+NOTIFICATION_MAX_USERS_PER_FLUSH = config("NOTIFICATION_MAX_USERS_PER_FLUSH", default=1000, cast=int)
+NOTIFICATION_MAX_ATTEMPTS = config("NOTIFICATION_MAX_ATTEMPTS", default=5, cast=int)
+NOTIFICATION_CLAIM_TIMEOUT_SECONDS = config("NOTIFICATION_CLAIM_TIMEOUT_SECONDS", default=600, cast=float)
+NOTIFICATION_TRANSPORT = config("NOTIFICATION_TRANSPORT", default="log")
+NOTIFICATION_SENDER = config("NOTIFICATION_SENDER", default="Task Manager <noreply@taskmanager.local>")
+NOTIFICATION_FILE_DIR = config("NOTIFICATION_FILE_DIR", default="./data/notifications")
+SMTP_HOST = config("SMTP_HOST", default="localhost")
+SMTP_PORT = config("SMTP_PORT", default=587, cast=int)
+SMTP_USERNAME = config("SMTP_USERNAME", default="")
+SMTP_PASSWORD = config("SMTP_PASSWORD", default="")
+SMTP_USE_TLS = config("SMTP_USE_TLS", default=True, cast=bool)
+SMTP_TIMEOUT = config("SMTP_TIMEOUT", default=10, cast=float)
+
+# Prometheus multiprocess directory shared by uvicorn workers and Celery (empty: in-process metrics only)
+METRICS_MULTIPROC_DIR = config("PROMETHEUS_MULTIPROC_DIR", default="")
 
 # JWT Settings
 SECRET_KEY = config("SECRET_KEY", default="your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Password hashing: bcrypt cost and the bounded worker pool (0 workers = one per CPU)
+BCRYPT_ROUNDS = config("BCRYPT_ROUNDS", default=12, cast=int)
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", default=0, cast=int)
+PASSWORD_HASH_MAX_IN_FLIGHT = config("PASSWORD_HASH_MAX_IN_FLIGHT", default=32, cast=int)
+
+# Authenticated user cache (per process); 0 disables it. Invalidation is process-local, so the TTL
+# bounds how long other workers keep accepting a user that was disabled or deleted
+USER_CACHE_TTL_SECONDS = config("USER_CACHE_TTL_SECONDS", default=5, cast=float)
+USER_CACHE_MAX_SIZE = config("USER_CACHE_MAX_SIZE", default=10000, cast=int)
+
 # App Settings
-DEBUG = config("DEBUG", default=True, cast=bool) 
\ No newline at end of file
+DEBUG = config("DEBUG", default=True, cast=bool) 
+
+# Per-request SQL observability: X-DB-* debug headers, N+1 threshold (same statement shape per request), slow DB time log
+OBSERVABILITY_ENABLED = config("OBSERVABILITY_ENABLED", default=True, cast=bool)
+OBSERVABILITY_DEBUG_HEADERS = config("OBSERVABILITY_DEBUG_HEADERS", default=DEBUG, cast=bool)
+OBSERVABILITY_N_PLUS_ONE_THRESHOLD = config("OBSERVABILITY_N_PLUS_ONE_THRESHOLD", default=5, cast=int)
+OBSERVABILITY_SLOW_REQUEST_MS = config("OBSERVABILITY_SLOW_REQUEST_MS", default=500, cast=float)
+
+# Search (substring match): "auto" uses the trigram index (SQLite FTS5 trigram / Postgres pg_trgm) when installed,
+# "like" forces unindexed ILIKE
+SEARCH_BACKEND = config("SEARCH_BACKEND", default="auto")
+
+# Read-through cache: Redis (bypassed while down), or in-process LRU when CACHE_REDIS_URL is empty
+CACHE_ENABLED = config("CACHE_ENABLED", default=True, cast=bool)
+CACHE_REDIS_URL = config("CACHE_REDIS_URL", default="redis://localhost:6379/1")
+CACHE_REDIS_TIMEOUT = config("CACHE_REDIS_TIMEOUT", default=0.1, cast=float)
+CACHE_REDIS_RETRY_SECONDS = config("CACHE_REDIS_RETRY_SECONDS", default=30, cast=float)
+CACHE_LOCAL_MAX_ENTRIES = config("CACHE_LOCAL_MAX_ENTRIES", default=1024, cast=int)
+CACHE_LOCAL_MAX_TTL = config("CACHE_LOCAL_MAX_TTL", default=30, cast=int)
+CACHE_TTL_TASKS = config("CACHE_TTL_TASKS", default=60, cast=int)
+CACHE_TTL_STATISTICS = config("CACHE_TTL_STATISTICS", default=300, cast=int)
@@ -1,10 +1,15 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, asc, func
-from typing import List, Optional, Dict, Any
+from sqlalchemy import and_, or_, desc, asc, func, literal, case, select, union_all, String
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
-from .models import User, Task
+import base64
+import json
+from .models import User, Task, ArchivedTask
 from .schemas import UserCreate, TaskCreate, TaskUpdate
 from .auth import get_password_hash
+from .search import get_search_backend, substring_filter
+from . import task_stats
+from .cache import invalidate_owner
 
 # User CRUD
 def get_user(db: Session, user_id: int) -> Optional[User]:
@@ -16,8 +21,10 @@ def get_user_by_username(db: Session, username: str) -> Optional[User]:
 def get_user_by_email(db: Session, email: str) -> Optional[User]:
     return db.query(User).filter(User.email == email).first()
 
-def create_user(db: Session, user: UserCreate) -> User:
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: UserCreate, hashed_password: Optional[str] = None) -> User:
+    # Async callers hash beforehand with password_service.hash_async
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -31,34 +38,143 @@ def create_user(db: Session, user: UserCreate) -> User:
 def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[User]:
     return db.query(User).offset(skip).limit(limit).all()
 
+# Cursor (keyset) pagination
+class InvalidCursorError(ValueError):
+    pass
+
+def encode_cursor(task: Task, sort_by: str = "id") -> str:
+    """
+    Собрать непрозрачный курсор из ключа сортировки и id последней задачи
+    """
+    value = getattr(task, sort_by)
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    payload = json.dumps({"s": sort_by, "v": value, "id": task.id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort_by: str = "id") -> Dict[str, Any]:
+    """
+    Разобрать курсор; курсор должен относиться к той же сортировке
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = payload["v"]
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["dt"])
+        task_id = int(payload["id"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursorError("Malformed cursor")
+    if payload.get("s") != sort_by:
+        raise InvalidCursorError("Cursor does not match the requested sort field")
+    return {"value": value, "id": task_id}
+
+def _keyset_value(db: Session, value: Any):
+    # SQLite stores server-side timestamps as "YYYY-MM-DD HH:MM:SS" text while
+    # bound datetimes always carry microseconds, so an equality check on a tie
+    # would never match. Bind the value in the stored text form instead.
+    if isinstance(value, datetime) and db.get_bind().dialect.name == "sqlite":
+        text_value = value.strftime("%Y-%m-%d %H:%M:%S")
+        if value.microsecond:
+            text_value += f".{value.microsecond:06d}"
+        return literal(text_value, String)
+    return value
+
+def _apply_keyset(db: Session, query, sort_column, cursor: str, sort_by: str, descending: bool, id_column=Task.id):
+    position = decode_cursor(cursor, sort_by)
+    value = _keyset_value(db, position["value"])
+    if descending:
+        return query.filter(or_(
+            sort_column < value,
+            and_(sort_column == value, id_column < position["id"])
+        ))
+    return query.filter(or_(
+        sort_column > value,
+        and_(sort_column == value, id_column > position["id"])
+    ))
+
 # Task CRUD
+TASK_FIELDS = ("id", "title", "description", "completed", "created_at", "updated_at", "owner_id")
+
+def task_to_dict(task: Task) -> Dict[str, Any]:
+    data = {field: getattr(task, field) for field in TASK_FIELDS}
+    # Rows from the hot + archive union carry an "archived" flag
+    if hasattr(task, "archived"):
+        data["archived"] = task.archived
+    return data
+
+def tasks_with_archive(db: Session, user_id: int, search: Optional[str] = None):
+    """
+    Подзапрос UNION ALL задач пользователя из tasks и tasks_archive с колонкой archived.
+    Поиск в обеих ветках — одна и та же подстрока: по триграммному индексу в tasks, ILIKE в архиве
+    """
+    hot = db.query(Task).filter(Task.owner_id == user_id)
+    if search:
+        hot, _ = get_search_backend(db, search).apply(hot, search)
+    archive = select(ArchivedTask).where(ArchivedTask.owner_id == user_id)
+    if search:
+        archive = archive.where(substring_filter(ArchivedTask, search))
+    return union_all(
+        hot.with_entities(*(getattr(Task, field) for field in TASK_FIELDS), literal(False).label("archived")).statement,
+        archive.with_only_columns(
+            *(getattr(ArchivedTask, field) for field in TASK_FIELDS), literal(True).label("archived")
+        )
+    ).subquery("all_tasks")
+
 def get_task(db: Session, task_id: int) -> Optional[Task]:
     return db.query(Task).filter(Task.id == task_id).first()
 
-def get_tasks_by_user(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[Task]:
-    return db.query(Task).filter(Task.owner_id == user_id).offset(skip).limit(limit).all()
+def get_tasks_by_user(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> List[Task]:
+    query = db.query(Task).filter(Task.owner_id == user_id)
+    if cursor:
+        # Курсор заменяет offset: глубокие страницы стоят столько же, сколько первая
+        return query.filter(Task.id > decode_cursor(cursor)["id"]).order_by(Task.id).limit(limit).all()
+    return query.order_by(Task.id).offset(skip).limit(limit).all()
 
-def create_task(db: Session, task: TaskCreate, user_id: int) -> Task:
+def create_task(db: Session, task: TaskCreate, user_id: int, *, invalidate: bool = True) -> Task:
     db_task = Task(**task.dict(), owner_id=user_id)
     db.add(db_task)
+    db.flush()
+    db.refresh(db_task)
+    task_stats.apply_task_rows(db, user_id, [(db_task.created_at, db_task.completed)])
     db.commit()
+    if invalidate:
+        invalidate_owner(user_id)
     db.refresh(db_task)
     return db_task
 
-def update_task(db: Session, task_id: int, task_update: TaskUpdate, user_id: int) -> Optional[Task]:
+def update_task(
+    db: Session, task_id: int, task_update: TaskUpdate, user_id: int, *, invalidate: bool = True
+) -> Optional[Task]:
     db_task = db.query(Task).filter(Task.id == task_id, Task.owner_id == user_id).first()
     if db_task:
+        was_completed = bool(db_task.completed)
         for key, value in task_update.dict(exclude_unset=True).items():
             setattr(db_task, key, value)
+        db.flush()
+        task_stats.apply_task_delta(db, user_id, completed=int(bool(db_task.completed)) - int(was_completed))
         db.commit()
+        if invalidate:
+            invalidate_owner(user_id)
         db.refresh(db_task)
     return db_task
 
-def delete_task(db: Session, task_id: int, user_id: int) -> bool:
+def delete_task(db: Session, task_id: int, user_id: int, *, invalidate: bool = True) -> bool:
     db_task = db.query(Task).filter(Task.id == task_id, Task.owner_id == user_id).first()
     if db_task:
+        deleted_row = (db_task.created_at, db_task.completed)
         db.delete(db_task)
+        db.flush()
+        task_stats.apply_task_rows(db, user_id, [deleted_row], sign=-1)
         db.commit()
+        if invalidate:
+            invalidate_owner(user_id)
         return True
     return False
 
@@ -72,86 +188,194 @@ def get_tasks_with_filters(
     sort_by: str = "created_at",
     sort_order: str = "desc",
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    include_archived: bool = False
 ) -> List[Task]:
     """
-    Получить задачи с фильтрацией, поиском и сортировкой
+    Получить задачи с фильтрацией, поиском и сортировкой.
+    Если передан cursor, выборка продолжается после него и skip игнорируется.
+    include_archived добавляет tasks_archive (строки с флагом archived вместо объектов Task)
     """
+    if include_archived:
+        return _get_tasks_with_archive(
+            db, user_id, completed, search, sort_by, sort_order, skip, limit, cursor
+        )
+    
     query = db.query(Task).filter(Task.owner_id == user_id)
     
     # Фильтр по статусу
     if completed is not None:
         query = query.filter(Task.completed == completed)
     
-    # Поиск по заголовку и описанию
+    # Поиск по заголовку и описанию (полнотекстовый индекс, если установлен)
+    rank = None
     if search:
-        search_filter = or_(
-            Task.title.ilike(f"%{search}%"),
-            Task.description.ilike(f"%{search}%")
-        )
-        query = query.filter(search_filter)
+        query, rank = get_search_backend(db, search).apply(query, search)
+    
+    # Сортировка (id добавлен как tie-breaker для стабильного курсора)
+    if sort_by == "relevance":
+        if cursor:
+            raise InvalidCursorError("Cursor pagination is not supported for relevance sort")
+        sort_column = rank if rank is not None else Task.created_at
+    else:
+        sort_column = getattr(Task, sort_by)
+    descending = sort_order.lower() == "desc"
+    if descending:
+        query = query.order_by(desc(sort_column), desc(Task.id))
+    else:
+        query = query.order_by(asc(sort_column), asc(Task.id))
+    
+    if cursor:
+        query = _apply_keyset(db, query, sort_column, cursor, sort_by, descending)
+        return query.limit(limit).all()
+    
+    return query.offset(skip).limit(limit).all()
+
+def _get_tasks_with_archive(
+    db: Session, user_id: int, completed: Optional[bool], search: Optional[str],
+    sort_by: str, sort_order: str, skip: int, limit: int, cursor: Optional[str]
+) -> List[Any]:
+    all_tasks = tasks_with_archive(db, user_id, search)
+    query = db.query(all_tasks)
+    if completed is not None:
+        query = query.filter(all_tasks.c.completed == completed)
     
-    # Сортировка
-    if sort_order.lower() == "desc":
-        query = query.order_by(desc(getattr(Task, sort_by)))
+    # bm25 rank is not comparable across tiers: relevance falls back to recency
+    if sort_by == "relevance":
+        if cursor:
+            raise InvalidCursorError("Cursor pagination is not supported for relevance sort")
+        sort_column = all_tasks.c.created_at
     else:
-        query = query.order_by(asc(getattr(Task, sort_by)))
+        sort_column = all_tasks.c[sort_by]
+    descending = sort_order.lower() == "desc"
+    if descending:
+        query = query.order_by(desc(sort_column), desc(all_tasks.c.id))
+    else:
+        query = query.order_by(asc(sort_column), asc(all_tasks.c.id))
     
+    if cursor:
+        query = _apply_keyset(db, query, sort_column, cursor, sort_by, descending, id_column=all_tasks.c.id)
+        return query.limit(limit).all()
     return query.offset(skip).limit(limit).all()
 
-def get_task_statistics(db: Session, user_id: int) -> Dict[str, Any]:
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+def get_task_aggregates(
+    db: Session,
+    user_id: int,
+    windows: Tuple[int, ...] = (7, 30),
+    now: Optional[datetime] = None,
+    by_day: bool = True
+) -> Dict[str, Any]:
     """
-    Получить статистику по задачам пользователя
+    Все счётчики статистики за один проход по задачам пользователя
+    (условная агрегация SUM(CASE ...) вместо отдельного COUNT на каждую метрику)
     """
-    total_tasks = db.query(Task).filter(Task.owner_id == user_id).count()
-    completed_tasks = db.query(Task).filter(
-        and_(Task.owner_id == user_id, Task.completed == True)
-    ).count()
-    pending_tasks = total_tasks - completed_tasks
+    now = now or datetime.utcnow()
+    week_ago = now - timedelta(days=7)
+    
+    columns = [
+        func.count(Task.id).label("total"),
+        _count_if(Task.completed == True).label("completed"),
+        _count_if(Task.created_at >= week_ago).label("recent_week"),
+    ]
+    
+    # Корзины по дням за последнюю неделю
+    day_buckets = []
+    day = week_ago.date()
+    while by_day and day <= now.date():
+        day_start = max(week_ago, datetime.combine(day, datetime.min.time()))
+        day_end = datetime.combine(day + timedelta(days=1), datetime.min.time())
+        columns.append(_count_if(and_(Task.created_at >= day_start, Task.created_at < day_end)).label(f"day_{len(day_buckets)}"))
+        day_buckets.append(day)
+        day += timedelta(days=1)
     
-    # Задачи за последнюю неделю
-    week_ago = datetime.utcnow() - timedelta(days=7)
-    recent_tasks = db.query(Task).filter(
-        and_(Task.owner_id == user_id, Task.created_at >= week_ago)
-    ).count()
+    # Окна активности (создано / завершено за последние N дней)
+    for days in windows:
+        start_date = now - timedelta(days=days)
+        columns.append(_count_if(Task.created_at >= start_date).label(f"created_{days}d"))
+        columns.append(_count_if(and_(Task.completed == True, Task.updated_at >= start_date)).label(f"completed_{days}d"))
     
-    # Задачи по дням недели
-    tasks_by_day = db.query(
-        func.date(Task.created_at).label('date'),
-        func.count(Task.id).label('count')
-    ).filter(
-        and_(Task.owner_id == user_id, Task.created_at >= week_ago)
-    ).group_by(func.date(Task.created_at)).all()
+    row = db.query(*columns).filter(Task.owner_id == user_id).one()
+    
+    return {
+        "total": row.total,
+        "completed": row.completed,
+        "recent_week": row.recent_week,
+        "tasks_by_day": [
+            {"date": str(day), "count": getattr(row, f"day_{i}")}
+            for i, day in enumerate(day_buckets)
+            if getattr(row, f"day_{i}")
+        ],
+        "windows": {
+            days: {"created": getattr(row, f"created_{days}d"), "completed": getattr(row, f"completed_{days}d")}
+            for days in windows
+        }
+    }
+
+def get_task_statistics(db: Session, user_id: int, aggregates: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Получить статистику по задачам пользователя.
+    recent_tasks_week и tasks_by_day — за последние 7 суток (скользящее окно UTC)
+    """
+    if aggregates is None:
+        # O(1): готовые счётчики из user_task_stats
+        aggregates = task_stats.get_user_stats(db, user_id)
+    
+    total_tasks = aggregates["total"]
+    completed_tasks = aggregates["completed"]
     
     return {
         "total_tasks": total_tasks,
         "completed_tasks": completed_tasks,
-        "pending_tasks": pending_tasks,
+        "pending_tasks": total_tasks - completed_tasks,
         "completion_rate": round((completed_tasks / total_tasks * 100), 2) if total_tasks > 0 else 0,
-        "recent_tasks_week": recent_tasks,
-        "tasks_by_day": [{"date": str(day.date), "count": day.count} for day in tasks_by_day]
+        "recent_tasks_week": aggregates["recent_week"],
+        "tasks_by_day": aggregates["tasks_by_day"]
     }
 
-def bulk_update_tasks(db: Session, task_ids: List[int], user_id: int, update_data: Dict[str, Any]) -> int:
+def bulk_update_tasks(
+    db: Session, task_ids: List[int], user_id: int, update_data: Dict[str, Any], *, invalidate: bool = True
+) -> int:
     """
     Массовое обновление задач
     """
-    updated_count = db.query(Task).filter(
-        and_(Task.id.in_(task_ids), Task.owner_id == user_id)
-    ).update(update_data, synchronize_session=False)
+    owned = and_(Task.id.in_(task_ids), Task.owner_id == user_id)
+    
+    # Сколько задач реально меняют статус — для счётчиков
+    completed_delta = 0
+    if "completed" in update_data:
+        new_completed = bool(update_data["completed"])
+        flipped = db.query(func.count(Task.id)).filter(
+            owned, Task.completed == (not new_completed)
+        ).scalar()
+        completed_delta = flipped if new_completed else -flipped
     
+    updated_count = db.query(Task).filter(owned).update(update_data, synchronize_session=False)
+    
+    if updated_count:
+        task_stats.apply_task_delta(db, user_id, completed=completed_delta)
     db.commit()
+    if invalidate:
+        invalidate_owner(user_id)
     return updated_count
 
-def bulk_delete_tasks(db: Session, task_ids: List[int], user_id: int) -> int:
+def bulk_delete_tasks(db: Session, task_ids: List[int], user_id: int, *, invalidate: bool = True) -> int:
     """
     Массовое удаление задач
     """
-    deleted_count = db.query(Task).filter(
-        and_(Task.id.in_(task_ids), Task.owner_id == user_id)
-    ).delete(synchronize_session=False)
+    owned = and_(Task.id.in_(task_ids), Task.owner_id == user_id)
+    deleted_rows = db.query(Task.created_at, Task.completed).filter(owned).all()
+    
+    deleted_count = db.query(Task).filter(owned).delete(synchronize_session=False)
     
+    if deleted_count:
+        task_stats.apply_task_rows(db, user_id, deleted_rows, sign=-1)
     db.commit()
+    if invalidate:
+        invalidate_owner(user_id)
     return deleted_count
 
 def get_tasks_by_date_range(
@@ -187,7 +411,7 @@ def mark_overdue_tasks(db: Session, user_id: int) -> int:
     
     return 0  # Placeholder
 
-def duplicate_task(db: Session, task_id: int, user_id: int) -> Optional[Task]:
+def duplicate_task(db: Session, task_id: int, user_id: int, *, invalidate: bool = True) -> Optional[Task]:
     """
     Дублировать задачу
     """
@@ -206,44 +430,61 @@ def duplicate_task(db: Session, task_id: int, user_id: int) -> Optional[Task]:
     )
     
     db.add(new_task)
+    db.flush()
+    db.refresh(new_task)
+    task_stats.apply_task_rows(db, user_id, [(new_task.created_at, new_task.completed)])
     db.commit()
+    if invalidate:
+        invalidate_owner(user_id)
     db.refresh(new_task)
     
     return new_task
 
-def get_user_activity_summary(db: Session, user_id: int, days: int = 30) -> Dict[str, Any]:
+def get_longest_task_titles(db: Session, user_id: int, limit: int = 5) -> List[Dict[str, Any]]:
+    rows = db.query(Task.title).filter(Task.owner_id == user_id).order_by(
+        desc(func.length(Task.title))
+    ).limit(limit).all()
+    return [{"title": row.title, "length": len(row.title)} for row in rows]
+
+def get_user_activity_summary(
+    db: Session,
+    user_id: int,
+    days: int = 30,
+    aggregates: Optional[Dict[str, Any]] = None,
+    longest_titles: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
     """
     Получить сводку активности пользователя
     """
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    # Общая статистика
-    total_tasks = db.query(Task).filter(Task.owner_id == user_id).count()
-    tasks_period = db.query(Task).filter(
-        and_(Task.owner_id == user_id, Task.created_at >= start_date)
-    ).count()
-    
-    completed_period = db.query(Task).filter(
-        and_(
-            Task.owner_id == user_id,
-            Task.completed == True,
-            Task.updated_at >= start_date
-        )
-    ).count()
+    if aggregates is None or days not in aggregates["windows"]:
+        aggregates = get_task_aggregates(db, user_id, windows=(days,))
+    if longest_titles is None:
+        longest_titles = get_longest_task_titles(db, user_id)
     
-    # Самые длинные заголовки задач
-    longest_titles = db.query(Task).filter(Task.owner_id == user_id).order_by(
-        desc(func.length(Task.title))
-    ).limit(5).all()
+    window = aggregates["windows"][days]
     
     return {
         "period_days": days,
-        "total_tasks_all_time": total_tasks,
-        "tasks_created_period": tasks_period,
-        "tasks_completed_period": completed_period,
-        "avg_tasks_per_day": round(tasks_period / days, 2),
-        "longest_task_titles": [
-            {"title": task.title, "length": len(task.title)} 
-            for task in longest_titles
-        ]
-    } 
\ No newline at end of file
+        "total_tasks_all_time": aggregates["total"],
+        "tasks_created_period": window["created"],
+        "tasks_completed_period": window["completed"],
+        "avg_tasks_per_day": round(window["created"] / days, 2),
+        "longest_task_titles": longest_titles
+    }
+
+def get_task_analytics(db: Session, user_id: int) -> Dict[str, Any]:
+    """
+    Статистика из счётчиков и активность за 7/30 дней из одного агрегирующего запроса
+    """
+    aggregates = get_task_aggregates(db, user_id, windows=(7, 30), by_day=False)
+    longest_titles = get_longest_task_titles(db, user_id)
+    
+    return {
+        "basic_statistics": get_task_statistics(db, user_id),
+        "activity_last_7_days": get_user_activity_summary(
+            db, user_id, days=7, aggregates=aggregates, longest_titles=longest_titles
+        ),
+        "activity_last_30_days": get_user_activity_summary(
+            db, user_id, days=30, aggregates=aggregates, longest_titles=longest_titles
+        )
+    }
@@ -0,0 +1,105 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional, Dict, Any
+from datetime import datetime
+from starlette.concurrency import run_in_threadpool
+from . import crud
+from .cache import invalidate_owner
+from .crud import decode_cursor
+from .models import User, Task
+from .schemas import UserCreate, TaskCreate, TaskUpdate
+from .passwords import password_service
+
+# Асинхронные варианты функций crud.py для AsyncSession.
+# Простые чтения выполняются нативно через select(); запись и сложные запросы
+# переиспользуют синхронную реализацию через AsyncSession.run_sync, чтобы
+# счётчики task_stats оставались в одном месте. Инвалидация кэша ходит в Redis
+# блокирующим клиентом, поэтому она выполняется после записи в threadpool.
+
+async def _invalidate_owner(user_id: int) -> None:
+    await run_in_threadpool(invalidate_owner, user_id)
+
+# User CRUD
+async def get_user(db: AsyncSession, user_id: int) -> Optional[User]:
+    return await db.get(User, user_id)
+
+async def get_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.username == username).limit(1))
+    return result.scalars().first()
+
+async def get_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.email == email).limit(1))
+    return result.scalars().first()
+
+async def create_user(db: AsyncSession, user: UserCreate, hashed_password: Optional[str] = None) -> User:
+    # bcrypt must never run on the event loop
+    if hashed_password is None:
+        hashed_password = await password_service.hash_async(user.password)
+    return await db.run_sync(crud.create_user, user, hashed_password)
+
+# Task CRUD
+async def get_task(db: AsyncSession, task_id: int) -> Optional[Task]:
+    return await db.get(Task, task_id)
+
+async def get_tasks_by_user(
+    db: AsyncSession,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> List[Task]:
+    query = select(Task).where(Task.owner_id == user_id).order_by(Task.id).limit(limit)
+    if cursor:
+        query = query.where(Task.id > decode_cursor(cursor)["id"])
+    else:
+        query = query.offset(skip)
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+async def create_task(db: AsyncSession, task: TaskCreate, user_id: int) -> Task:
+    db_task = await db.run_sync(crud.create_task, task, user_id, invalidate=False)
+    await _invalidate_owner(user_id)
+    return db_task
+
+async def update_task(db: AsyncSession, task_id: int, task_update: TaskUpdate, user_id: int) -> Optional[Task]:
+    db_task = await db.run_sync(crud.update_task, task_id, task_update, user_id, invalidate=False)
+    if db_task:
+        await _invalidate_owner(user_id)
+    return db_task
+
+async def delete_task(db: AsyncSession, task_id: int, user_id: int) -> bool:
+    deleted = await db.run_sync(crud.delete_task, task_id, user_id, invalidate=False)
+    if deleted:
+        await _invalidate_owner(user_id)
+    return deleted
+
+async def get_tasks_with_filters(db: AsyncSession, user_id: int, **filters: Any) -> List[Task]:
+    return await db.run_sync(lambda session: crud.get_tasks_with_filters(session, user_id, **filters))
+
+async def get_task_statistics(db: AsyncSession, user_id: int) -> Dict[str, Any]:
+    return await db.run_sync(crud.get_task_statistics, user_id)
+
+async def bulk_update_tasks(db: AsyncSession, task_ids: List[int], user_id: int, update_data: Dict[str, Any]) -> int:
+    updated_count = await db.run_sync(crud.bulk_update_tasks, task_ids, user_id, update_data, invalidate=False)
+    await _invalidate_owner(user_id)
+    return updated_count
+
+async def bulk_delete_tasks(db: AsyncSession, task_ids: List[int], user_id: int) -> int:
+    deleted_count = await db.run_sync(crud.bulk_delete_tasks, task_ids, user_id, invalidate=False)
+    await _invalidate_owner(user_id)
+    return deleted_count
+
+async def get_tasks_by_date_range(db: AsyncSession, user_id: int, start_date: datetime, end_date: datetime) -> List[Task]:
+    return await db.run_sync(crud.get_tasks_by_date_range, user_id, start_date, end_date)
+
+async def duplicate_task(db: AsyncSession, task_id: int, user_id: int) -> Optional[Task]:
+    new_task = await db.run_sync(crud.duplicate_task, task_id, user_id, invalidate=False)
+    if new_task:
+        await _invalidate_owner(user_id)
+    return new_task
+
+async def get_user_activity_summary(db: AsyncSession, user_id: int, days: int = 30) -> Dict[str, Any]:
+    return await db.run_sync(crud.get_user_activity_summary, user_id, days)
+
+async def get_task_analytics(db: AsyncSession, user_id: int) -> Dict[str, Any]:
+    return await db.run_sync(crud.get_task_analytics, user_id)
@@ -1,21 +1,108 @@
-from sqlalchemy import create_engine
+import asyncio
+import time
+from typing import Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from .config import DATABASE_URL
+from .config import DATABASE_URL, DATABASE_ASYNC_URL
+from .db_pool import PoolMetrics, engine_options, install_sqlite_pragmas, pool_stats
+from .observability import current_query_stats
+from .metrics import pool_observer, track_checked_out
 
-# SQLite-specific configuration
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-)
+sync_pool_metrics = PoolMetrics(on_observe=pool_observer("sync"))
+async_pool_metrics = PoolMetrics(on_observe=pool_observer("async"))
+
+# Pool settings and SQLite PRAGMAs come from db_pool (DB_POOL_*, SQLITE_* in config)
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, sync_pool_metrics))
+install_sqlite_pragmas(engine)
+track_checked_out(engine, "sync")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+class SyncDatabaseOnEventLoopError(RuntimeError):
+    """Синхронный запрос к БД из потока с работающим event loop."""
+
+def forbid_event_loop_access(sync_engine: Engine) -> None:
+    """Запрещает выполнять запросы синхронного движка внутри async-обработчиков."""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _check_event_loop(conn, cursor, statement, parameters, context, executemany):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Threadpool workers, Celery, CLI and tests: no loop, nothing to block
+            return
+        raise SyncDatabaseOnEventLoopError(
+            "Blocking database call on the event loop; use get_async_db/crud_async "
+            "in async handlers or declare the handler with plain def"
+        )
+
+def observe_queries(sync_engine: Engine) -> None:
+    """Записывает каждый SQL в статистику текущего HTTP-запроса (observability)."""
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_query(conn, cursor, statement, parameters, context, executemany):
+        if current_query_stats() is not None:
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _finish_query(conn, cursor, statement, parameters, context, executemany):
+        stats = current_query_stats()
+        started = conn.info.get("query_started")
+        if stats is not None and started:
+            stats.record(statement, time.perf_counter() - started.pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _drop_failed_query(exception_context):
+        started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+        if started:
+            started.pop()
+
+forbid_event_loop_access(engine)
+observe_queries(engine)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def to_async_url(url: str) -> str:
+    """Подбирает асинхронный драйвер для синхронного DATABASE_URL."""
+    scheme, sep, rest = url.partition("://")
+    dialect = scheme.split("+", 1)[0]
+    if dialect == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if dialect in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+_async_engine: Optional[AsyncEngine] = None
+AsyncSessionLocal = async_sessionmaker(class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def get_async_engine() -> AsyncEngine:
+    """Асинхронный движок создаётся лениво: драйвер (aiosqlite/asyncpg) нужен только в async-режиме."""
+    global _async_engine
+    if _async_engine is None:
+        async_url = DATABASE_ASYNC_URL or to_async_url(DATABASE_URL)
+        _async_engine = create_async_engine(async_url, **engine_options(async_url, async_pool_metrics, is_async=True))
+        install_sqlite_pragmas(_async_engine.sync_engine)
+        observe_queries(_async_engine.sync_engine)
+        track_checked_out(_async_engine.sync_engine, "async")
+        AsyncSessionLocal.configure(bind=_async_engine)
+    return _async_engine
+
+async def get_async_db():
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def database_pool_stats() -> dict:
+    """Метрики пулов синхронного и (если создан) асинхронного движков."""
+    stats = {"sync": pool_stats(engine)}
+    if _async_engine is not None:
+        stats["async"] = pool_stats(_async_engine.sync_engine)
+    return stats
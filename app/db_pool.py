@@ -0,0 +1,152 @@
+"""
+Настройка соединений с БД.
+
+PRAGMA для SQLite, параметры пула для серверных БД и метрики выдачи
+соединений из пула (GET /api/health/db).
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from .config import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE
+)
+
+
+class PoolMetrics:
+    """Время ожидания соединения из пула и число таймаутов."""
+
+    def __init__(self, window: int = 1024, on_observe: Optional[Callable[[float, bool], None]] = None):
+        self.on_observe = on_observe
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=window)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def observe(self, seconds: float, timed_out: bool = False) -> None:
+        if self.on_observe is not None:
+            self.on_observe(seconds, timed_out)
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.max_wait = max(self.max_wait, seconds)
+            self._recent.append(seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self._recent)
+            checkouts, timeouts, total_wait, max_wait = self.checkouts, self.timeouts, self.total_wait, self.max_wait
+
+        def percentile(p: float) -> Optional[float]:
+            if not recent:
+                return None
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))] * 1000, 3)
+
+        return {
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_mean_ms": round(total_wait / checkouts * 1000, 3) if checkouts else None,
+            "wait_p50_ms": percentile(0.5),
+            "wait_p99_ms": percentile(0.99),
+            "wait_max_ms": round(max_wait * 1000, 3),
+        }
+
+
+def instrumented_pool(pool_class, metrics: PoolMetrics):
+    """Подкласс пула, замеряющий Pool.connect() (ожидание свободного соединения, pre-ping)."""
+
+    class InstrumentedPool(pool_class):
+        def connect(self):
+            started = time.perf_counter()
+            try:
+                connection = super().connect()
+            except exc.TimeoutError:
+                metrics.observe(time.perf_counter() - started, timed_out=True)
+                raise
+            metrics.observe(time.perf_counter() - started)
+            return connection
+
+    InstrumentedPool.__name__ = f"Instrumented{pool_class.__name__}"
+    InstrumentedPool.metrics = metrics
+    return InstrumentedPool
+
+
+def _is_sqlite_memory(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(database_url: str, metrics: PoolMetrics, is_async: bool = False) -> Dict[str, Any]:
+    """Аргументы create_engine/create_async_engine для данного URL."""
+    url = make_url(database_url)
+    if _is_sqlite_memory(url):
+        # In-memory SQLite lives in a single connection: keep SQLAlchemy's default pool
+        return {"connect_args": {"check_same_thread": False}} if not is_async else {}
+
+    options: Dict[str, Any] = {
+        "poolclass": instrumented_pool(AsyncAdaptedQueuePool if is_async else QueuePool, metrics),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+    if url.get_backend_name() == "sqlite":
+        # Lock waits are governed by PRAGMA busy_timeout (install_sqlite_pragmas)
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+    else:
+        options["pool_pre_ping"] = DB_POOL_PRE_PING
+        options["pool_recycle"] = DB_POOL_RECYCLE
+    return options
+
+
+def install_sqlite_pragmas(sync_engine: Engine) -> None:
+    """WAL, synchronous, busy_timeout, mmap и размер кэша на каждом новом соединении SQLite."""
+    if sync_engine.dialect.name != "sqlite":
+        return
+    pragmas = [f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}"]
+    if not _is_sqlite_memory(sync_engine.url):
+        # WAL is persistent in the file; in-memory databases only support MEMORY
+        pragmas.append(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    pragmas += [
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={SQLITE_CACHE_SIZE}",
+    ]
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def pool_stats(sync_engine: Engine) -> Dict[str, Any]:
+    """Состояние пула и насыщенность: checked_out / (pool_size + max_overflow)."""
+    pool = sync_engine.pool
+    stats: Dict[str, Any] = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        capacity = pool.size() + max(pool._max_overflow, 0)
+        stats.update({
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "saturation": round(pool.checkedout() / capacity, 3) if capacity else None,
+        })
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.snapshot())
+    return stats
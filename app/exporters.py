@@ -0,0 +1,158 @@
+"""
+Потоковый экспорт задач пользователя (CSV, JSON, NDJSON, опционально gzip).
+
+Строки читаются из БД пачками (yield_per / серверный курсор) в отдельной
+сессии и сразу сериализуются, поэтому расход памяти не зависит от числа
+задач. Генераторы отдают bytes и подходят для StreamingResponse и для
+записи экспорта в файл. С include_archived в экспорт попадают и задачи из
+tasks_archive (колонка archived).
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Sequence
+
+from sqlalchemy import literal, select, union_all
+from sqlalchemy.orm import Session
+
+from .config import EXPORT_BATCH_SIZE
+from .models import ArchivedTask, Task
+
+EXPORT_COLUMNS = ("id", "title", "description", "completed", "created_at", "updated_at")
+EXPORT_FORMATS = ("json", "csv", "ndjson")
+EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def iter_export_rows(
+    bind: Any,
+    user_id: int,
+    completed: Optional[bool] = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    include_archived: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Строки задач пользователя (новые первыми) пачками по batch_size.
+
+    Своя сессия: генератор живёт дольше запроса, который его создал.
+    """
+    def tier_select(model, archived: bool):
+        query = select(*(getattr(model, column) for column in EXPORT_COLUMNS)).where(model.owner_id == user_id)
+        if completed is not None:
+            query = query.where(model.completed == completed)
+        if include_archived:
+            query = query.add_columns(literal(archived).label("archived"))
+        return query
+
+    if include_archived:
+        combined = union_all(tier_select(Task, False), tier_select(ArchivedTask, True)).subquery()
+        query = select(combined).order_by(combined.c.created_at.desc(), combined.c.id.desc())
+    else:
+        query = tier_select(Task, False).order_by(Task.created_at.desc(), Task.id.desc())
+
+    with Session(bind=bind) as db:
+        result = db.execute(query.execution_options(yield_per=batch_size))
+        for row in result:
+            data = {
+                "id": row.id,
+                "title": row.title,
+                "description": row.description,
+                "completed": row.completed,
+                "created_at": row.created_at.isoformat() if row.created_at else None,
+                "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+            }
+            if include_archived:
+                data["archived"] = bool(row.archived)
+            yield data
+
+
+def _flush_every(rows: Iterable[Dict[str, Any]], write_row, buffer: io.StringIO, batch_size: int) -> Iterator[bytes]:
+    for count, row in enumerate(rows, start=1):
+        write_row(row)
+        if count % batch_size == 0:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def export_csv(
+    rows: Iterable[Dict[str, Any]],
+    batch_size: int = EXPORT_BATCH_SIZE,
+    columns: Sequence[str] = EXPORT_COLUMNS,
+) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield from _flush_every(
+        rows, lambda row: writer.writerow([row[column] for column in columns]), buffer, batch_size
+    )
+
+
+def export_ndjson(rows: Iterable[Dict[str, Any]], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    yield from _flush_every(
+        rows, lambda row: buffer.write(json.dumps(row, ensure_ascii=False) + "\n"), buffer, batch_size
+    )
+
+
+def export_json(rows: Iterable[Dict[str, Any]], batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Тот же объект, что отдавал прежний /export: {"tasks": [...], "total_count", "export_date", "format"}."""
+    buffer = io.StringIO()
+    counter = {"count": 0}
+
+    def write_row(row: Dict[str, Any]) -> None:
+        buffer.write(("," if counter["count"] else "") + json.dumps(row, ensure_ascii=False))
+        counter["count"] += 1
+
+    yield b'{"tasks": ['
+    yield from _flush_every(rows, write_row, buffer, batch_size)
+    yield (
+        f'], "total_count": {counter["count"]}, '
+        f'"export_date": {json.dumps(datetime.utcnow().isoformat())}, "format": "json"}}'
+    ).encode("utf-8")
+
+
+EXPORTERS = {"csv": export_csv, "json": export_json, "ndjson": export_ndjson}
+
+
+def get_exporter(export_format: str, include_archived: bool = False) -> Callable[..., Iterator[bytes]]:
+    # JSON rows carry the "archived" key themselves; CSV needs it in the header
+    if export_format == "csv" and include_archived:
+        return partial(export_csv, columns=EXPORT_COLUMNS + ("archived",))
+    return EXPORTERS[export_format]
+
+
+def gzip_stream(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def stream_export(
+    bind: Any,
+    user_id: int,
+    export_format: str,
+    completed: Optional[bool] = None,
+    gzip: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    include_archived: bool = False,
+) -> Iterator[bytes]:
+    """Полный поток экспорта в заданном формате."""
+    rows = iter_export_rows(bind, user_id, completed, batch_size, include_archived)
+    chunks = get_exporter(export_format, include_archived)(rows, batch_size)
+    return gzip_stream(chunks) if gzip else chunks
+
+
+def export_filename(export_format: str, gzip: bool = False) -> str:
+    return f"tasks-{datetime.utcnow():%Y%m%d-%H%M%S}.{export_format}" + (".gz" if gzip else "")
@@ -1,15 +1,20 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 import uvicorn
 
-from .database import engine, get_db
-from .models import Base
-from .routers import auth, tasks, frontend, celery_tasks, advanced_tasks
-
-# Create database tables
-Base.metadata.create_all(bind=engine)
+from .database import engine, get_db, database_pool_stats
+from .observability import QueryObservabilityMiddleware, route_query_metrics
+from .metrics import PrometheusMiddleware, mark_process_dead, render_metrics
+from .cache import cache
+from .passwords import password_service, PasswordServiceBusy
+from .migrations import upgrade_database
+from .worker_state import worker_state
+from .config import DATABASE_ASYNC
+from .routers import auth, tasks, tasks_async, frontend, celery_tasks, advanced_tasks
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -29,19 +34,82 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-request SQL count/time, N+1 detection and per-route histograms (/api/health/queries)
+app.add_middleware(QueryObservabilityMiddleware)
+# Outermost: latency covers every other middleware
+app.add_middleware(PrometheusMiddleware)
+
+@app.exception_handler(PasswordServiceBusy)
+async def password_service_busy_handler(request: Request, exc: PasswordServiceBusy):
+    # Shed excess logins/registrations instead of stalling every request
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
 # Include API routers
 app.include_router(auth.router, prefix="/api")
-app.include_router(tasks.router, prefix="/api")
+# DATABASE_ASYNC switches /api/tasks to the AsyncSession implementation
+app.include_router(tasks_async.router if DATABASE_ASYNC else tasks.router, prefix="/api")
 app.include_router(celery_tasks.router, prefix="/api")
 app.include_router(advanced_tasks.router, prefix="/api")
 
 # Include frontend router (no prefix for SSR routes)
 app.include_router(frontend.router)
 
+@app.on_event("startup")
+async def apply_migrations():
+    # Schema is managed by Alembic (see alembic/versions); sync engine, so off the event loop
+    await run_in_threadpool(upgrade_database, engine)
+
+@app.on_event("startup")
+def start_worker_state_collector():
+    # /active-tasks and /worker-stats read this snapshot instead of broadcasting per request
+    worker_state.start()
+
+@app.on_event("shutdown")
+def stop_worker_state_collector():
+    worker_state.stop()
+
+@app.on_event("shutdown")
+def drop_process_metrics():
+    # Live gauges (in-flight requests, checked-out connections) of this worker stop counting
+    mark_process_dead()
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 @app.get("/api/health")
 def health_check():
     return {"status": "healthy", "message": "Task Manager API is running"}
 
+@app.get("/api/health/cache")
+def cache_health():
+    return cache.stats()
+
+@app.get("/api/health/db")
+def database_health():
+    return database_pool_stats()
+
+@app.get("/api/health/workers")
+def worker_state_health():
+    state = worker_state.snapshot()
+    return {
+        **worker_state.metrics,
+        "collected_at": state["collected_at"],
+        "age_seconds": state["age_seconds"],
+        "stale": state["stale"],
+        "error": state["error"],
+        "interval_seconds": worker_state.interval,
+    }
+
+@app.get("/api/health/queries")
+def query_health():
+    return route_query_metrics.snapshot()
+
+@app.get("/api/health/passwords")
+def password_service_health():
+    return password_service.stats()
+
 if __name__ == "__main__":
     uvicorn.run(
         "app.main:app",
@@ -0,0 +1,249 @@
+"""
+Метрики Prometheus для API и Celery (GET /metrics).
+
+Если задан PROMETHEUS_MULTIPROC_DIR, prometheus_client пишет значения каждого
+процесса (uvicorn worker'ы, дочерние процессы Celery prefork) в mmap-файлы
+этого каталога, а /metrics суммирует их. Каталог должен быть общим для API и
+worker'ов и очищаться перед их запуском. Без него метрики живут в памяти
+процесса (один uvicorn, тесты).
+
+Счётчики и гистограммы обновляются по событиям (запрос, выдача соединения из
+пула, обращение к кэшу, сигналы Celery), поэтому корректны при любом числе
+процессов. Длины очередей Celery читаются из брокера в момент scrape.
+"""
+import logging
+import os
+import time
+from typing import Dict, Iterable, Tuple
+
+from .config import METRICS_MULTIPROC_DIR
+
+# prometheus_client picks the multiprocess value class at import time
+if METRICS_MULTIPROC_DIR:
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", METRICS_MULTIPROC_DIR)
+
+import redis  # noqa: E402
+from celery.signals import task_postrun, task_prerun, task_retry, worker_process_shutdown  # noqa: E402
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import GaugeMetricFamily  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being served", ["method"], multiprocess_mode="livesum"
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out", "Connections currently checked out of the pool", ["engine"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time to get a connection from the pool", ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts", "Pool checkouts that hit pool_timeout", ["engine"]
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests", "Cache lookups by cache, namespace and result (hit/miss)", ["cache", "namespace", "result"]
+)
+CELERY_TASK_RUNTIME = Histogram(
+    "celery_task_runtime_seconds", "Celery task run time by task name and final state", ["task", "state"],
+    buckets=(0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+CELERY_TASK_RETRIES = Counter("celery_task_retries", "Celery task retries by task name", ["task"])
+NOTIFICATION_MESSAGES_SENT = Counter(
+    "notification_messages_sent", "Notification digests delivered by transport and worker", ["transport", "worker"]
+)
+# rate(messages_sent) / rate(send_seconds) = messages per second while a worker is sending
+NOTIFICATION_SEND_SECONDS = Counter(
+    "notification_send_seconds", "Time spent delivering notification digests", ["transport", "worker"]
+)
+
+
+# --- API -----------------------------------------------------------------------
+
+class PrometheusMiddleware:
+    """
+    Чистый ASGI middleware: задержка по шаблону маршрута и статусу, запросы в работе
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "")
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            in_progress.dec()
+            # Template, not the raw path, keeps label cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+            HTTP_REQUEST_DURATION.labels(method, route, str(status["code"])).observe(time.perf_counter() - started)
+
+
+def pool_observer(engine_label: str):
+    """Колбэк для PoolMetrics: ожидание соединения и таймауты в Prometheus."""
+    wait = DB_POOL_CHECKOUT_WAIT.labels(engine_label)
+    timeouts = DB_POOL_CHECKOUT_TIMEOUTS.labels(engine_label)
+
+    def observe(seconds: float, timed_out: bool) -> None:
+        if timed_out:
+            timeouts.inc()
+        else:
+            wait.observe(seconds)
+    return observe
+
+
+def track_checked_out(pool_events_target, engine_label: str) -> None:
+    """Счётчик выданных соединений по событиям пула checkout/checkin."""
+    from sqlalchemy import event
+
+    gauge = DB_POOL_CHECKED_OUT.labels(engine_label)
+
+    @event.listens_for(pool_events_target, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        gauge.inc()
+
+    @event.listens_for(pool_events_target, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        gauge.dec()
+
+
+def record_cache_lookup(cache_name: str, namespace: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache_name, namespace, "hit" if hit else "miss").inc()
+
+
+def record_notification_flush(transport: str, worker: str, messages: int, seconds: float) -> None:
+    NOTIFICATION_MESSAGES_SENT.labels(transport, worker).inc(messages)
+    NOTIFICATION_SEND_SECONDS.labels(transport, worker).inc(seconds)
+
+
+# --- Celery --------------------------------------------------------------------
+
+_task_started: Dict[str, float] = {}
+
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None and task is not None:
+        CELERY_TASK_RUNTIME.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+
+@task_retry.connect
+def _on_task_retry(sender=None, **kwargs):
+    if sender is not None:
+        CELERY_TASK_RETRIES.labels(sender.name).inc()
+
+
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**kwargs):
+    mark_process_dead()
+
+
+def mark_process_dead(pid: int = None) -> None:
+    """Убрать live-значения завершившегося процесса (uvicorn worker, дочерний процесс Celery)."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+def celery_queues() -> Iterable[str]:
+    from .celery_app import celery_app
+
+    queues = {route["queue"] for route in (celery_app.conf.task_routes or {}).values() if "queue" in route}
+    queues.add(celery_app.conf.task_default_queue)
+    return sorted(queues)
+
+
+class CeleryQueueCollector:
+    """
+    Длина очередей Celery в Redis-брокере на момент scrape (с приоритетными подочередями kombu)
+    """
+    PRIORITY_SEPARATOR = "\x06\x16"
+    PRIORITY_STEPS = (3, 6, 9)
+
+    def __init__(self, broker_url: str, timeout: float = 0.5):
+        self.client = redis.Redis.from_url(broker_url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    def _lengths(self) -> Tuple[bool, Dict[str, int]]:
+        queues = celery_queues()
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for queue in queues:
+                pipe.llen(queue)
+                for step in self.PRIORITY_STEPS:
+                    pipe.llen(f"{queue}{self.PRIORITY_SEPARATOR}{step}")
+            lengths = pipe.execute()
+        except redis.RedisError as exc:
+            logger.debug("Celery broker unavailable for queue metrics: %s", exc)
+            return False, {}
+        per_queue = len(self.PRIORITY_STEPS) + 1
+        return True, {
+            queue: sum(lengths[index * per_queue:(index + 1) * per_queue]) for index, queue in enumerate(queues)
+        }
+
+    def collect(self):
+        up, lengths = self._lengths()
+        broker_up = GaugeMetricFamily("celery_broker_up", "Whether the Celery broker answered the queue scrape")
+        broker_up.add_metric([], 1 if up else 0)
+        yield broker_up
+        queue_length = GaugeMetricFamily("celery_queue_length", "Messages waiting in a Celery queue", labels=["queue"])
+        for queue, length in lengths.items():
+            queue_length.add_metric([queue], length)
+        yield queue_length
+
+
+_queue_collector = None
+
+
+def _get_queue_collector() -> CeleryQueueCollector:
+    global _queue_collector
+    if _queue_collector is None:
+        from .celery_app import CELERY_BROKER_URL
+        _queue_collector = CeleryQueueCollector(CELERY_BROKER_URL)
+        if not MULTIPROCESS:
+            REGISTRY.register(_queue_collector)
+    return _queue_collector
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Текст для /metrics: все процессы (multiprocess) или текущий, плюс очереди Celery
+    """
+    queue_collector = _get_queue_collector()
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(queue_collector)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
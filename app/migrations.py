@@ -0,0 +1,43 @@
+import logging
+import os
+from typing import Optional
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+from .database import engine as default_engine
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+# Revision matching the schema that Base.metadata.create_all used to build
+LEGACY_BASELINE_REVISION = "0001_initial_schema"
+
+
+def get_alembic_config() -> Config:
+    cfg = Config(ALEMBIC_INI)
+    cfg.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "alembic"))
+    # Keep the application's logging configuration intact
+    cfg.attributes["configure_logger"] = False
+    return cfg
+
+
+def upgrade_database(engine: Optional[Engine] = None, revision: str = "head") -> None:
+    """
+    Применить миграции Alembic до указанной ревизии
+    """
+    engine = engine or default_engine
+    cfg = get_alembic_config()
+
+    with engine.begin() as connection:
+        cfg.attributes["connection"] = connection
+        tables = set(inspect(connection).get_table_names())
+        # Databases created by the old create_all() bootstrap have the tables
+        # but no version table: mark them as the baseline and migrate forward.
+        if "alembic_version" not in tables and {"users", "tasks"} <= tables:
+            logger.info("Stamping pre-migration database at %s", LEGACY_BASELINE_REVISION)
+            command.stamp(cfg, LEGACY_BASELINE_REVISION)
+        command.upgrade(cfg, revision)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Boolean, DateTime, Date, ForeignKey, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -12,12 +12,23 @@ class User(Base):
     hashed_password = Column(String(100), nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Days completed tasks are kept (NULL = RETENTION_DEFAULT_DAYS, 0 = keep forever)
+    task_retention_days = Column(Integer, nullable=True)
     
     # Relationship
     tasks = relationship("Task", back_populates="owner")
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Composite indexes for the hot query shapes in crud.py / tasks.py
+        Index("ix_tasks_owner_id_created_at", "owner_id", "created_at"),
+        Index("ix_tasks_owner_id_updated_at", "owner_id", "updated_at"),
+        Index("ix_tasks_owner_id_completed_updated_at", "owner_id", "completed", "updated_at"),
+        Index("ix_tasks_completed_updated_at", "completed", "updated_at"),
+        # Archived tasks keep their id, so SQLite must never hand it out again
+        {"sqlite_autoincrement": True},
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
@@ -30,4 +41,84 @@ class Task(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
     
     # Relationship
-    owner = relationship("User", back_populates="tasks") 
\ No newline at end of file
+    owner = relationship("User", back_populates="tasks")
+
+class ArchivedTask(Base):
+    """Архив завершённых задач, вынесенных из tasks очисткой (тот же id, без FTS и лишних индексов)."""
+    __tablename__ = "tasks_archive"
+    __table_args__ = (
+        Index("ix_tasks_archive_owner_id_created_at", "owner_id", "created_at"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    title = Column(String(200), nullable=False)
+    description = Column(Text, nullable=True)
+    completed = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class UserTaskStats(Base):
+    """
+    Счётчики задач пользователя, обновляемые в той же транзакции, что и задачи
+    """
+    __tablename__ = "user_task_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    total_tasks = Column(Integer, nullable=False, default=0)
+    completed_tasks = Column(Integer, nullable=False, default=0)
+    # Увеличивается при любой записи в задачи пользователя
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UserTaskDailyStats(Base):
+    """
+    Количество созданных задач по дням (дата created_at, UTC)
+    """
+    __tablename__ = "user_task_daily_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    created_count = Column(Integer, nullable=False, default=0)
+
+
+class RetentionCheckpoint(Base):
+    """Позиция прохода очистки по tasks.id, чтобы прерванный запуск продолжился с места остановки."""
+    __tablename__ = "retention_checkpoints"
+    
+    name = Column(String(50), primary_key=True)
+    last_id = Column(Integer, nullable=False, default=0)
+    run_started_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class Notification(Base):
+    """
+    Уведомление в очереди дайджеста; idempotency_key (пользователь, задача, тип) уникален только
+    среди недоставленных строк: повтор не дублирует письмо, а новое событие после отправки доходит
+    """
+    __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_status_user_id_created_at", "status", "user_id", "created_at"),
+        Index(
+            "ux_notifications_idempotency_key_undelivered", "idempotency_key", unique=True,
+            sqlite_where=text("status IN ('pending', 'sending')"),
+            postgresql_where=text("status IN ('pending', 'sending')"),
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String(255), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # No FK: the task may be deleted or archived before the digest goes out
+    task_id = Column(Integer, nullable=True)
+    task_title = Column(String(200), nullable=False)
+    notification_type = Column(String(50), nullable=False)
+    # pending -> sending (claimed by a flush) -> sent | failed
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    claim_token = Column(String(32), nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,344 @@
+"""
+Email-уведомления: идемпотентная очередь, дайджесты и пакетная отправка.
+
+enqueue_notification записывает уведомление в таблицу notifications с ключом
+идемпотентности (пользователь, задача, тип). Пока строка с этим ключом не
+доставлена (pending/sending), повторная постановка, в том числе повтор
+Celery-задачи, не создаёт второй строки; после отправки то же событие снова
+попадает в следующий дайджест.
+
+flush_due (beat, раз в NOTIFICATION_FLUSH_INTERVAL_SECONDS) выбирает
+пользователей, чьё самое старое ожидающее уведомление старше
+NOTIFICATION_DIGEST_WINDOW_SECONDS, захватывает их строки (status=sending,
+claim_token) и отправляет одно письмо-дайджест на пользователя. Одно
+соединение транспорта обслуживает пачку из NOTIFICATION_BATCH_SIZE писем.
+Отправленные строки помечаются sent одним commit на пачку. При ошибке
+транспорта сначала фиксируются уже отправленные письма пачки, а остальные
+возвращаются в pending, поэтому self.retry досылает только недоставленное.
+Захват, брошенный упавшим worker'ом, снимается через
+NOTIFICATION_CLAIM_TIMEOUT_SECONDS. Тогда письма его последней пачки могут
+уйти повторно; Message-ID у них тот же, и получатель может их отбросить.
+
+Транспорты: log (по умолчанию), file (JSON Lines, для разработки и тестов),
+smtp или свой класс "module:Class".
+"""
+import hashlib
+import importlib
+import json
+import logging
+import os
+import smtplib
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .config import (
+    NOTIFICATION_BATCH_SIZE,
+    NOTIFICATION_CLAIM_TIMEOUT_SECONDS,
+    NOTIFICATION_DIGEST_WINDOW_SECONDS,
+    NOTIFICATION_FILE_DIR,
+    NOTIFICATION_MAX_ATTEMPTS,
+    NOTIFICATION_MAX_USERS_PER_FLUSH,
+    NOTIFICATION_SENDER,
+    NOTIFICATION_TRANSPORT,
+    SMTP_HOST,
+    SMTP_PASSWORD,
+    SMTP_PORT,
+    SMTP_TIMEOUT,
+    SMTP_USE_TLS,
+    SMTP_USERNAME,
+)
+from .metrics import record_notification_flush
+from .models import Notification, User
+
+logger = logging.getLogger(__name__)
+
+UNDELIVERED_STATUSES = ("pending", "sending")
+
+NOTIFICATION_LABELS = {
+    "task_created": "Task created",
+    "task_updated": "Task updated",
+    "task_completed": "Task completed",
+    "task_deleted": "Task deleted",
+}
+
+Send = Callable[[EmailMessage], Any]
+
+
+def notification_key(user_id: int, notification_type: str, task_title: str, task_id: Optional[int] = None) -> str:
+    # Without a task id the title identifies the task; hashed to keep the key bounded
+    task_ref = f"task:{task_id}" if task_id is not None else \
+        "title:" + hashlib.sha256(task_title.encode("utf-8")).hexdigest()[:32]
+    return f"{user_id}:{task_ref}:{notification_type}"
+
+
+def enqueue_notification(
+    db: Session, user_id: int, notification_type: str, task_title: str, task_id: Optional[int] = None
+) -> Tuple[Notification, bool]:
+    """
+    Поставить уведомление в очередь дайджеста. Возвращает (уведомление, создано ли оно сейчас)
+    """
+    key = notification_key(user_id, notification_type, task_title, task_id)
+    values = {
+        "idempotency_key": key, "user_id": user_id, "task_id": task_id, "task_title": task_title[:200],
+        "notification_type": notification_type, "status": "pending", "attempts": 0,
+    }
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(Notification).values(**values).on_conflict_do_nothing(
+            index_elements=[Notification.idempotency_key],
+            index_where=Notification.status.in_(UNDELIVERED_STATUSES)
+        )
+        created = db.execute(stmt).rowcount == 1
+        db.commit()
+    else:
+        try:
+            db.add(Notification(**values))
+            db.commit()
+            created = True
+        except IntegrityError:
+            db.rollback()
+            created = False
+    # Older rows with the key are already delivered; the newest is the one just queued or its duplicate
+    notification = db.query(Notification).filter(Notification.idempotency_key == key).order_by(
+        Notification.id.desc()
+    ).first()
+    return notification, created
+
+
+def build_digest(user: User, notifications: List[Notification], sender: str = NOTIFICATION_SENDER) -> EmailMessage:
+    message = EmailMessage()
+    count = len(notifications)
+    message["From"] = sender
+    message["To"] = user.email
+    message["Subject"] = f"{count} task update{'s' if count != 1 else ''}"
+    # Same rows always produce the same Message-ID, so a re-sent digest can be deduplicated downstream
+    message["Message-ID"] = f"<digest-{user.id}-{notifications[0].id}-{notifications[-1].id}@taskmanager>"
+    lines = [f"Hello {user.username},", "", "Here is what happened with your tasks:", ""]
+    lines += [
+        f"- {NOTIFICATION_LABELS.get(item.notification_type, item.notification_type)}: {item.task_title}"
+        for item in notifications
+    ]
+    message.set_content("\n".join(lines) + "\n")
+    return message
+
+
+# --- transports -----------------------------------------------------------------
+
+class NotificationTransport:
+    """
+    Транспорт: connect() открывает одно соединение на пачку и отдаёт функцию отправки
+    """
+    name = "base"
+
+    def __init__(self):
+        self.connections = 0
+
+    @contextmanager
+    def connect(self) -> Iterator[Send]:
+        self.connections += 1
+        with self._open() as send:
+            yield send
+
+    def _open(self):
+        raise NotImplementedError
+
+
+class LogTransport(NotificationTransport):
+    name = "log"
+
+    @contextmanager
+    def _open(self) -> Iterator[Send]:
+        def send(message: EmailMessage) -> None:
+            logger.info("Notification digest to %s: %s", message["To"], message["Subject"])
+        yield send
+
+
+class FileTransport(NotificationTransport):
+    """
+    Письма построчно в JSON Lines (outbox.jsonl); файл открывается один раз на пачку
+    """
+    name = "file"
+
+    def __init__(self, directory: str = NOTIFICATION_FILE_DIR):
+        super().__init__()
+        self.path = os.path.join(directory, "outbox.jsonl")
+
+    @contextmanager
+    def _open(self) -> Iterator[Send]:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as outbox:
+            def send(message: EmailMessage) -> None:
+                outbox.write(json.dumps({
+                    "message_id": message["Message-ID"], "from": message["From"], "to": message["To"],
+                    "subject": message["Subject"], "body": message.get_content(),
+                }) + "\n")
+            yield send
+
+
+class SMTPTransport(NotificationTransport):
+    name = "smtp"
+
+    def __init__(
+        self, host: str = SMTP_HOST, port: int = SMTP_PORT, username: str = SMTP_USERNAME,
+        password: str = SMTP_PASSWORD, use_tls: bool = SMTP_USE_TLS, timeout: float = SMTP_TIMEOUT
+    ):
+        super().__init__()
+        self.host, self.port, self.timeout = host, port, timeout
+        self.username, self.password, self.use_tls = username, password, use_tls
+
+    @contextmanager
+    def _open(self) -> Iterator[Send]:
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password)
+            yield smtp.send_message
+
+
+TRANSPORTS = {"log": LogTransport, "file": FileTransport, "smtp": SMTPTransport}
+
+
+def get_transport(name: str = NOTIFICATION_TRANSPORT) -> NotificationTransport:
+    if name in TRANSPORTS:
+        return TRANSPORTS[name]()
+    if ":" in name:
+        module, _, attr = name.partition(":")
+        return getattr(importlib.import_module(module), attr)()
+    raise ValueError(f"Unknown notification transport {name!r}; use {', '.join(TRANSPORTS)} or module:Class")
+
+
+# --- flush ----------------------------------------------------------------------
+
+def _release_stale_claims(db: Session, now: datetime, claim_timeout: float) -> int:
+    released = db.query(Notification).filter(
+        Notification.status == "sending",
+        Notification.claimed_at < now - timedelta(seconds=claim_timeout)
+    ).update({"status": "pending", "claim_token": None}, synchronize_session=False)
+    db.commit()
+    if released:
+        logger.warning("Released %d notifications left claimed by an interrupted flush", released)
+    return released
+
+
+def _release_claim(db: Session, token: str, error: str, max_attempts: int) -> None:
+    # Unsent rows go back to the queue; rows out of attempts stop retrying
+    db.query(Notification).filter(Notification.claim_token == token).update({
+        "attempts": Notification.attempts + 1,
+        "status": case((Notification.attempts + 1 >= max_attempts, "failed"), else_="pending"),
+        "claim_token": None,
+        "last_error": error[:1000],
+    }, synchronize_session=False)
+    db.commit()
+
+
+def _mark_sent(db: Session, ids: List[int]) -> None:
+    if ids:
+        db.query(Notification).filter(Notification.id.in_(ids)).update(
+            {"status": "sent", "sent_at": func.now(), "claim_token": None}, synchronize_session=False
+        )
+        db.commit()
+
+
+def _fail_notifications(db: Session, ids: List[int], error: str) -> None:
+    db.query(Notification).filter(Notification.id.in_(ids)).update(
+        {"status": "failed", "claim_token": None, "last_error": error}, synchronize_session=False
+    )
+    db.commit()
+
+
+def flush_due(
+    db: Session,
+    transport: NotificationTransport,
+    now: Optional[datetime] = None,
+    window_seconds: float = NOTIFICATION_DIGEST_WINDOW_SECONDS,
+    batch_size: int = NOTIFICATION_BATCH_SIZE,
+    max_users: int = NOTIFICATION_MAX_USERS_PER_FLUSH,
+    max_attempts: int = NOTIFICATION_MAX_ATTEMPTS,
+    claim_timeout: float = NOTIFICATION_CLAIM_TIMEOUT_SECONDS,
+    worker: Optional[str] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Отправить дайджесты пользователям, у которых истекло окно накопления.
+    При ошибке транспорта неотправленные строки возвращаются в очередь, а исключение пробрасывается
+    """
+    now = now or datetime.utcnow()
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    _release_stale_claims(db, now, claim_timeout)
+
+    cutoff = now - timedelta(seconds=window_seconds)
+    due_users = [row.user_id for row in db.query(Notification.user_id).filter(
+        Notification.status == "pending"
+    ).group_by(Notification.user_id).having(
+        func.min(Notification.created_at) <= cutoff
+    ).order_by(func.min(Notification.created_at)).limit(max_users)]
+
+    report = {
+        "users": 0, "messages": 0, "notifications": 0, "failed": 0, "connections": 0,
+        "seconds": 0.0, "messages_per_second": 0.0, "transport": transport.name, "worker": worker,
+    }
+    if not due_users:
+        return report
+
+    token = uuid.uuid4().hex
+    db.query(Notification).filter(
+        Notification.status == "pending", Notification.user_id.in_(due_users)
+    ).update({"status": "sending", "claim_token": token, "claimed_at": now}, synchronize_session=False)
+    db.commit()
+    claimed = db.query(Notification).filter(Notification.claim_token == token).order_by(
+        Notification.user_id, Notification.id
+    ).all()
+    users = {user.id: user for user in db.query(User).filter(User.id.in_(due_users))}
+
+    digests: List[Tuple[List[int], EmailMessage]] = []
+    by_user: Dict[int, List[Notification]] = {}
+    for notification in claimed:
+        by_user.setdefault(notification.user_id, []).append(notification)
+    for user_id, items in by_user.items():
+        if user_id not in users:
+            report["failed"] += len(items)
+            _fail_notifications(db, [item.id for item in items], "User not found")
+            continue
+        digests.append(([item.id for item in items], build_digest(users[user_id], items)))
+    report["users"] = len(digests)
+
+    connections_before = transport.connections
+    delivered: List[int] = []
+    started = time.perf_counter()
+    try:
+        for start in range(0, len(digests), batch_size):
+            with transport.connect() as send:
+                for ids, message in digests[start:start + batch_size]:
+                    send(message)
+                    delivered.extend(ids)
+                    report["messages"] += 1
+                    report["notifications"] += len(ids)
+            # One commit per batch; a failure mid-batch still records what went out (except below)
+            _mark_sent(db, delivered)
+            delivered = []
+            if on_progress:
+                on_progress(report["messages"], len(digests))
+    except Exception as exc:
+        db.rollback()
+        _mark_sent(db, delivered)
+        _release_claim(db, token, f"{type(exc).__name__}: {exc}", max_attempts)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        report["seconds"] = round(elapsed, 3)
+        report["connections"] = transport.connections - connections_before
+        report["messages_per_second"] = round(report["messages"] / elapsed, 1) if elapsed > 0 else 0.0
+        record_notification_flush(transport.name, worker, report["messages"], elapsed)
+    return report
@@ -0,0 +1,230 @@
+"""
+Наблюдаемость запросов к БД в разрезе HTTP-запросов.
+
+QueryObservabilityMiddleware (чистый ASGI) кладёт в contextvar объект
+RequestQueryStats; события движка (database.observe_queries) дописывают в
+него каждый выполненный SQL: число запросов, время в БД, самые медленные
+запросы и счётчик по «форме» запроса. Одна и та же форма, повторённая
+OBSERVABILITY_N_PLUS_ONE_THRESHOLD и более раз за запрос, считается N+1.
+
+После ответа статистика сворачивается в гистограммы по шаблону маршрута
+(/api/health/queries). В режиме отладки итоги запроса отдаются заголовками
+X-DB-*. На запрос к БД приходится два perf_counter и обновление словаря,
+поэтому сбор включён и в продакшене.
+"""
+import bisect
+import logging
+import re
+import threading
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+from .config import (
+    OBSERVABILITY_DEBUG_HEADERS,
+    OBSERVABILITY_ENABLED,
+    OBSERVABILITY_N_PLUS_ONE_THRESHOLD,
+    OBSERVABILITY_SLOW_REQUEST_MS,
+)
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250)
+DB_TIME_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+SLOWEST_PER_REQUEST = 3
+SLOWEST_PER_ROUTE = 5
+STATEMENT_PREVIEW = 200
+
+# "IN (?, ?, ?)" and expanded VALUES tuples differ only by length: same shape
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s|:\w+|\$\d+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+|\$\d+))+\s*\)")
+
+
+@lru_cache(maxsize=2048)
+def statement_shape(statement: str) -> str:
+    return _PLACEHOLDER_LIST.sub("(?)", " ".join(statement.split()))
+
+
+def _preview(statement: str) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= STATEMENT_PREVIEW else statement[:STATEMENT_PREVIEW] + "..."
+
+
+class RequestQueryStats:
+    """
+    SQL одного HTTP-запроса
+    """
+    __slots__ = ("count", "total_seconds", "slowest", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.slowest: List[Tuple[float, str]] = []
+        self.shapes: Dict[str, int] = {}
+
+    def record(self, statement: str, seconds: float) -> None:
+        self.count += 1
+        self.total_seconds += seconds
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+        if len(self.slowest) < SLOWEST_PER_REQUEST or seconds > self.slowest[-1][0]:
+            self.slowest.append((seconds, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SLOWEST_PER_REQUEST:]
+
+    def repeated(self, threshold: int = OBSERVABILITY_N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """Формы запросов, выполненные threshold и более раз (кандидаты N+1)."""
+        return sorted(
+            ((shape, count) for shape, count in self.shapes.items() if count >= threshold),
+            key=lambda item: item[1], reverse=True
+        )
+
+
+_current_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+
+def current_query_stats() -> Optional[RequestQueryStats]:
+    return _current_stats.get()
+
+
+class RouteQueryMetrics:
+    """
+    Агрегаты по маршрутам: гистограммы числа запросов и времени в БД, N+1, медленные запросы
+    """
+
+    def __init__(self):
+        self._routes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, stats: RequestQueryStats, n_plus_one: bool) -> None:
+        db_ms = stats.total_seconds * 1000
+        with self._lock:
+            entry = self._routes.get((method, route))
+            if entry is None:
+                entry = self._routes[(method, route)] = {
+                    "requests": 0,
+                    "queries_sum": 0,
+                    "db_time_ms_sum": 0.0,
+                    "queries_buckets": [0] * (len(QUERY_COUNT_BUCKETS) + 1),
+                    "db_time_buckets": [0] * (len(DB_TIME_BUCKETS_MS) + 1),
+                    "n_plus_one_requests": 0,
+                    "slowest": [],
+                }
+            entry["requests"] += 1
+            entry["queries_sum"] += stats.count
+            entry["db_time_ms_sum"] += db_ms
+            entry["queries_buckets"][bisect.bisect_left(QUERY_COUNT_BUCKETS, stats.count)] += 1
+            entry["db_time_buckets"][bisect.bisect_left(DB_TIME_BUCKETS_MS, db_ms)] += 1
+            if n_plus_one:
+                entry["n_plus_one_requests"] += 1
+            slowest = entry["slowest"]
+            for seconds, statement in stats.slowest:
+                ms = seconds * 1000
+                if len(slowest) < SLOWEST_PER_ROUTE or ms > slowest[-1][0]:
+                    slowest.append((ms, statement))
+                    slowest.sort(key=lambda item: item[0], reverse=True)
+                    del slowest[SLOWEST_PER_ROUTE:]
+
+    @staticmethod
+    def _cumulative(buckets: List[int], bounds: Tuple[float, ...]) -> List[Dict[str, Any]]:
+        total, result = 0, []
+        for bound, count in zip(list(bounds) + ["+Inf"], buckets):
+            total += count
+            result.append({"le": bound, "count": total})
+        return result
+
+    def routes(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """Копия сырых агрегатов (для экспортёров метрик)."""
+        with self._lock:
+            return {
+                key: {**entry, "queries_buckets": list(entry["queries_buckets"]),
+                      "db_time_buckets": list(entry["db_time_buckets"]), "slowest": list(entry["slowest"])}
+                for key, entry in self._routes.items()
+            }
+
+    def snapshot(self) -> Dict[str, Any]:
+        routes = []
+        for (method, route), entry in sorted(self.routes().items(), key=lambda item: item[0][1]):
+            requests = entry["requests"]
+            routes.append({
+                "method": method,
+                "route": route,
+                "requests": requests,
+                "queries_avg": round(entry["queries_sum"] / requests, 2),
+                "db_time_ms_avg": round(entry["db_time_ms_sum"] / requests, 3),
+                "queries_histogram": self._cumulative(entry["queries_buckets"], QUERY_COUNT_BUCKETS),
+                "db_time_ms_histogram": self._cumulative(entry["db_time_buckets"], DB_TIME_BUCKETS_MS),
+                "n_plus_one_requests": entry["n_plus_one_requests"],
+                "slowest": [{"ms": round(ms, 3), "statement": _preview(statement)} for ms, statement in entry["slowest"]],
+            })
+        return {"enabled": OBSERVABILITY_ENABLED, "routes": routes}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+
+route_query_metrics = RouteQueryMetrics()
+
+
+class QueryObservabilityMiddleware:
+    """
+    Чистый ASGI middleware: статистика SQL на HTTP-запрос, заголовки X-DB-* и агрегаты по маршрутам
+    """
+
+    def __init__(
+        self,
+        app,
+        debug_headers: bool = OBSERVABILITY_DEBUG_HEADERS,
+        n_plus_one_threshold: int = OBSERVABILITY_N_PLUS_ONE_THRESHOLD,
+        slow_request_ms: float = OBSERVABILITY_SLOW_REQUEST_MS,
+        metrics: RouteQueryMetrics = route_query_metrics,
+    ):
+        self.app = app
+        self.debug_headers = debug_headers
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.slow_request_ms = slow_request_ms
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not OBSERVABILITY_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _current_stats.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # Streaming bodies may query after this point; headers cover work done so far
+                headers = MutableHeaders(scope=message)
+                headers["X-DB-Query-Count"] = str(stats.count)
+                headers["X-DB-Time-Ms"] = f"{stats.total_seconds * 1000:.3f}"
+                if stats.slowest:
+                    headers["X-DB-Slowest-Ms"] = f"{stats.slowest[0][0] * 1000:.3f}"
+                repeated = stats.repeated(self.n_plus_one_threshold)
+                if repeated:
+                    headers["X-DB-N-Plus-One"] = f"{len(repeated)} shape(s), max {repeated[0][1]}x"
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers if self.debug_headers else send)
+        finally:
+            _current_stats.reset(token)
+            self._finish(scope, stats)
+
+    def _finish(self, scope, stats: RequestQueryStats) -> None:
+        route = getattr(scope.get("route"), "path", None) or "<unmatched>"
+        method = scope.get("method", "")
+        repeated = stats.repeated(self.n_plus_one_threshold)
+        for shape, count in repeated:
+            logger.warning("Possible N+1 on %s %s: %d x %s", method, route, count, _preview(shape))
+        db_ms = stats.total_seconds * 1000
+        if db_ms >= self.slow_request_ms:
+            logger.warning(
+                "Slow DB time on %s %s: %.1f ms in %d queries; slowest: %s",
+                method, route, db_ms, stats.count,
+                "; ".join(f"{seconds * 1000:.1f} ms {_preview(statement)}" for seconds, statement in stats.slowest)
+            )
+        self.metrics.observe(method, route, stats, bool(repeated))
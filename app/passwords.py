@@ -0,0 +1,109 @@
+"""
+Хэширование паролей bcrypt в отдельном ограниченном пуле потоков.
+
+bcrypt освобождает GIL, поэтому пул потоков даёт настоящий параллелизм и не
+блокирует event loop. Число одновременных операций (в работе + в очереди)
+ограничено: при превышении бросается PasswordServiceBusy, который API
+превращает в 429, вместо того чтобы тормозить все остальные запросы.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from passlib.context import CryptContext
+
+from .config import BCRYPT_ROUNDS, PASSWORD_HASH_MAX_IN_FLIGHT, PASSWORD_HASH_WORKERS
+
+
+class PasswordServiceBusy(Exception):
+    pass
+
+
+class PasswordService:
+    def __init__(self, workers: int, max_in_flight: int, rounds: int):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self.workers = workers
+        self.max_in_flight = max_in_flight
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._running = 0
+        self.metrics = {"completed": 0, "rejected": 0, "busy_seconds": 0.0, "wait_seconds": 0.0}
+
+    def _submit(self, fn: Callable, *args: Any) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.metrics["rejected"] += 1
+            raise PasswordServiceBusy("Too many concurrent password operations")
+        with self._lock:
+            self._in_flight += 1
+        queued_at = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            with self._lock:
+                self._running += 1
+                self.metrics["wait_seconds"] += started - queued_at
+            try:
+                return fn(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._in_flight -= 1
+                    self.metrics["completed"] += 1
+                    self.metrics["busy_seconds"] += time.perf_counter() - started
+                self._slots.release()
+
+        def release_if_cancelled(future: Future) -> None:
+            # A job cancelled while still queued never reaches run(), so its slot is returned here
+            if future.cancelled():
+                with self._lock:
+                    self._in_flight -= 1
+                self._slots.release()
+
+        try:
+            future = self._executor.submit(run)
+        except BaseException:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(release_if_cancelled)
+        return future
+
+    # Sync API (sync route handlers, Celery, CLI)
+    def hash(self, password: str) -> str:
+        return self._submit(self.context.hash, password).result()
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return self._submit(self.context.verify, password, hashed_password).result()
+
+    # Async API (async route handlers): the event loop only awaits the future
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(self.context.hash, password))
+
+    async def verify_async(self, password: str, hashed_password: str) -> bool:
+        return await asyncio.wrap_future(self._submit(self.context.verify, password, hashed_password))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            result = dict(self.metrics)
+            result.update({
+                "workers": self.workers,
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "running": self._running,
+                "queue_depth": self._in_flight - self._running,
+            })
+        return result
+
+
+password_service = PasswordService(
+    workers=PASSWORD_HASH_WORKERS or os.cpu_count() or 1,
+    max_in_flight=PASSWORD_HASH_MAX_IN_FLIGHT,
+    rounds=BCRYPT_ROUNDS,
+)
@@ -0,0 +1,459 @@
+"""
+Push-канал прогресса Celery-задач (SSE и WebSocket вместо опроса task-status).
+
+Каждый update_state и итоговое состояние задачи дописываются в Redis stream
+taskprogress:v1:{task_id} (XADD, ограничен PROGRESS_STREAM_MAXLEN, живёт
+PROGRESS_STREAM_TTL_SECONDS). Идентификатор записи stream — это id события
+SSE, поэтому клиент продолжает с Last-Event-ID без пропусков.
+
+В процессе API на каждую задачу с подписчиками приходится один читатель
+(XREAD BLOCK), который раздаёт события всем подключённым клиентам. Если Redis
+недоступен, события живут в ограниченном буфере внутри процесса (как у кэша):
+этого достаточно для eager-режима и тестов, но не для отдельного worker'а.
+
+Задачи сообщают прогресс через self.progress() (ProgressReporter): промежуточные
+обновления прореживаются по времени и по изменению процента, последнее
+отложенное обновление всегда отправляется при flush.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+
+import redis
+import redis.asyncio as aioredis
+from celery import Task as CeleryTask
+from celery.states import FAILURE, PENDING, READY_STATES, SUCCESS
+from fastapi.encoders import jsonable_encoder
+
+from .config import (
+    PROGRESS_BLOCK_MS,
+    PROGRESS_HEARTBEAT_SECONDS,
+    PROGRESS_MIN_INTERVAL_SECONDS,
+    PROGRESS_MIN_PERCENT,
+    PROGRESS_REDIS_RETRY_SECONDS,
+    PROGRESS_REDIS_TIMEOUT,
+    PROGRESS_REDIS_URL,
+    PROGRESS_STREAM_MAXLEN,
+    PROGRESS_STREAM_TTL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "taskprogress:v1"
+LOCAL_MAX_TASKS = 1024
+
+Event = Tuple[str, Dict[str, Any]]
+
+
+def format_task_status(task_id: str, state: str, info: Any) -> Dict[str, Any]:
+    """
+    Тело ответа task-status для состояния и meta/результата задачи
+    """
+    if state == PENDING:
+        return {'task_id': task_id, 'state': state, 'current': 0, 'total': 1, 'status': 'Pending...'}
+    if state == FAILURE:
+        # Something went wrong in the background job
+        return {
+            'task_id': task_id, 'state': state, 'current': 1, 'total': 1,
+            'status': 'Task failed', 'error': info if isinstance(info, str) else str(info)
+        }
+    info = info if isinstance(info, dict) else {}
+    response = {
+        'task_id': task_id,
+        'state': state,
+        'current': info.get('current', 0),
+        'total': info.get('total', 1),
+        'status': info.get('status', '')
+    }
+    if 'result' in info:
+        response['result'] = info['result']
+    return response
+
+
+def is_terminal(payload: Dict[str, Any]) -> bool:
+    return payload.get('state') in READY_STATES
+
+
+def parse_event_id(event_id: Optional[str]) -> Tuple[int, int]:
+    """"ms-seq" → (ms, seq) для сравнения; пустой или испорченный id — начало stream."""
+    try:
+        ms, _, seq = (event_id or "").partition("-")
+        return int(ms), int(seq or 0)
+    except ValueError:
+        return 0, 0
+
+
+def _stream_key(task_id: str) -> str:
+    return f"{KEY_PREFIX}:{task_id}"
+
+
+class LocalProgressBackend:
+    """
+    Последние события задач внутри процесса (запасной вариант без Redis)
+    """
+
+    def __init__(self, max_tasks: int, max_events: int):
+        self.max_tasks = max_tasks
+        self.max_events = max_events
+        self._streams: "OrderedDict[str, deque[Event]]" = OrderedDict()
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+
+    def append(self, task_id: str, payload: Dict[str, Any]) -> str:
+        with self._lock:
+            self._sequence += 1
+            event_id = f"{int(time.time() * 1000)}-{self._sequence}"
+            stream = self._streams.setdefault(task_id, deque(maxlen=self.max_events))
+            stream.append((event_id, payload))
+            self._streams.move_to_end(task_id)
+            while len(self._streams) > self.max_tasks:
+                self._streams.popitem(last=False)
+            waiters = list(self._waiters)
+        # Publishers run in worker or threadpool threads; wake readers on their own loops
+        for loop, wakeup in waiters:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                self._waiters.discard((loop, wakeup))
+        return event_id
+
+    def range(self, task_id: str, after: Optional[str]) -> List[Event]:
+        position = parse_event_id(after)
+        with self._lock:
+            events = list(self._streams.get(task_id, ()))
+        return [event for event in events if parse_event_id(event[0]) > position]
+
+    def last_id(self, task_id: str) -> str:
+        with self._lock:
+            stream = self._streams.get(task_id)
+            return stream[-1][0] if stream else "0-0"
+
+    async def wait(self, task_id: str, after: str, block_ms: int) -> List[Event]:
+        events = self.range(task_id, after)
+        if events:
+            return events
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        self._waiters.add(waiter)
+        try:
+            events = self.range(task_id, after)
+            if not events:
+                try:
+                    await asyncio.wait_for(waiter[1].wait(), block_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
+                events = self.range(task_id, after)
+            return events
+        finally:
+            self._waiters.discard(waiter)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._streams.clear()
+
+
+class ProgressBroker:
+    """
+    Публикация событий (worker) и чтение stream'ов (API) с откатом на локальный буфер
+    """
+
+    def __init__(
+        self,
+        redis_url: Optional[str],
+        stream_maxlen: int = 200,
+        stream_ttl: int = 3600,
+        redis_timeout: float = 0.1,
+        redis_retry_seconds: float = 30.0,
+    ):
+        self.redis_url = redis_url
+        self.stream_maxlen = stream_maxlen
+        self.stream_ttl = stream_ttl
+        self.redis_timeout = redis_timeout
+        self.redis_retry_seconds = redis_retry_seconds
+        self.local = LocalProgressBackend(LOCAL_MAX_TASKS, stream_maxlen)
+        self._redis = None
+        if redis_url:
+            self._redis = redis.Redis.from_url(
+                redis_url,
+                socket_timeout=redis_timeout,
+                socket_connect_timeout=redis_timeout,
+                decode_responses=True,
+            )
+        self._redis_down_until = 0.0
+        self.metrics = {"published": 0, "suppressed": 0, "redis_errors": 0, "fallbacks": 0}
+
+    def redis_available(self) -> bool:
+        return self._redis is not None and time.monotonic() >= self._redis_down_until
+
+    def mark_redis_down(self, exc: Exception) -> None:
+        self.metrics["redis_errors"] += 1
+        if time.monotonic() >= self._redis_down_until:
+            logger.warning("Progress Redis unavailable (%s); using in-process events for %ss", exc, self.redis_retry_seconds)
+        self._redis_down_until = time.monotonic() + self.redis_retry_seconds
+
+    def async_client(self):
+        return aioredis.Redis.from_url(
+            self.redis_url,
+            # XREAD BLOCK holds the socket open for PROGRESS_BLOCK_MS
+            socket_timeout=PROGRESS_BLOCK_MS / 1000 + 5,
+            socket_connect_timeout=self.redis_timeout,
+            decode_responses=True,
+        )
+
+    def publish(self, task_id: str, state: str, info: Any) -> str:
+        """
+        Дописать событие в stream задачи и вернуть его id
+        """
+        payload = jsonable_encoder(format_task_status(task_id, state, info))
+        self.metrics["published"] += 1
+        if self.redis_available():
+            try:
+                pipe = self._redis.pipeline()
+                pipe.xadd(
+                    _stream_key(task_id), {"data": json.dumps(payload)},
+                    maxlen=self.stream_maxlen, approximate=True
+                )
+                pipe.expire(_stream_key(task_id), self.stream_ttl)
+                return pipe.execute()[0]
+            except redis.RedisError as exc:
+                self.mark_redis_down(exc)
+        self.metrics["fallbacks"] += 1
+        return self.local.append(task_id, payload)
+
+
+progress_broker = ProgressBroker(
+    redis_url=PROGRESS_REDIS_URL,
+    stream_maxlen=PROGRESS_STREAM_MAXLEN,
+    stream_ttl=PROGRESS_STREAM_TTL_SECONDS,
+    redis_timeout=PROGRESS_REDIS_TIMEOUT,
+    redis_retry_seconds=PROGRESS_REDIS_RETRY_SECONDS,
+)
+
+
+class ProgressReporter:
+    """
+    Прогресс задачи с прореживанием записей в result backend.
+
+    Обновление PROGRESS отправляется сразу, если это первое обновление, если
+    current достиг total, если с прошлой записи прошло min_interval секунд или
+    процент вырос на min_percent. Иначе оно откладывается и заменяется
+    следующим (suppressed); flush отправляет последнее отложенное.
+    """
+
+    def __init__(
+        self,
+        task: CeleryTask,
+        total: Optional[int] = None,
+        min_interval: float = PROGRESS_MIN_INTERVAL_SECONDS,
+        min_percent: float = PROGRESS_MIN_PERCENT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.task = task
+        self.total = total
+        self.min_interval = min_interval
+        self.min_percent = min_percent
+        self.clock = clock
+        self.emitted = 0
+        self.suppressed = 0
+        self._pending: Optional[Dict[str, Any]] = None
+        self._last_emit_at: Optional[float] = None
+        self._last_percent: Optional[float] = None
+
+    def __enter__(self) -> "ProgressReporter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.flush()
+
+    def _percent(self, current: int) -> Optional[float]:
+        return current * 100.0 / self.total if self.total else None
+
+    def update(self, current: int, total: Optional[int] = None, status: str = "", **meta: Any) -> bool:
+        """Сообщить прогресс; True — записано сразу, False — отложено."""
+        if total is not None:
+            self.total = total
+        payload = {'current': current, 'total': self.total, 'status': status, **meta}
+        now = self.clock()
+        percent = self._percent(current)
+        due = (
+            self._last_emit_at is None
+            or (self.total is not None and current >= self.total)
+            or now - self._last_emit_at >= self.min_interval
+            or (percent is not None and percent - (self._last_percent or 0.0) >= self.min_percent)
+        )
+        if not due:
+            if self._pending is not None:
+                self._suppress()
+            self._pending = payload
+            return False
+        if self._pending is not None:
+            self._suppress()
+        self._emit(payload, now, percent)
+        return True
+
+    def flush(self) -> None:
+        """Отправить отложенное обновление (итоговое состояние перед return)."""
+        if self._pending is not None:
+            self._emit(self._pending, self.clock(), self._percent(self._pending['current']))
+
+    def stats(self) -> Dict[str, int]:
+        return {'emitted': self.emitted, 'suppressed': self.suppressed}
+
+    def _suppress(self) -> None:
+        self.suppressed += 1
+        progress_broker.metrics["suppressed"] += 1
+
+    def _emit(self, payload: Dict[str, Any], now: float, percent: Optional[float]) -> None:
+        self.task.update_state(state='PROGRESS', meta=payload)
+        self._pending = None
+        self._last_emit_at = now
+        self._last_percent = percent
+        self.emitted += 1
+
+
+class ProgressTask(CeleryTask):
+    """
+    Базовый класс задач: каждое update_state и итог задачи публикуются в progress stream
+    """
+
+    def progress(self, total: Optional[int] = None, **kwargs: Any) -> ProgressReporter:
+        return ProgressReporter(self, total, **kwargs)
+
+    def update_state(self, task_id=None, state=None, meta=None, **kwargs):
+        super().update_state(task_id=task_id, state=state, meta=meta, **kwargs)
+        task_id = task_id or self.request.id
+        if task_id:
+            progress_broker.publish(task_id, state, meta)
+
+    def on_success(self, retval, task_id, args, kwargs):
+        progress_broker.publish(task_id, SUCCESS, retval)
+
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        progress_broker.publish(task_id, FAILURE, exc)
+
+
+class ProgressHub:
+    """
+    Раздача событий подписчикам одного event loop: один читатель stream на задачу
+    """
+
+    def __init__(self, broker: ProgressBroker):
+        self.broker = broker
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._readers: Dict[str, asyncio.Task] = {}
+        self._redis = None
+
+    def _client(self):
+        if not self.broker.redis_available():
+            return None
+        if self._redis is None:
+            self._redis = self.broker.async_client()
+        return self._redis
+
+    async def _range(self, task_id: str, after: Optional[str]) -> List[Event]:
+        client = self._client()
+        if client is not None:
+            try:
+                entries = await client.xrange(_stream_key(task_id), min=f"({after}" if after else "-")
+                return [(event_id, json.loads(fields["data"])) for event_id, fields in entries]
+            except redis.RedisError as exc:
+                self.broker.mark_redis_down(exc)
+        return self.broker.local.range(task_id, after)
+
+    async def last_event_id(self, task_id: str) -> str:
+        client = self._client()
+        if client is not None:
+            try:
+                entries = await client.xrevrange(_stream_key(task_id), count=1)
+                return entries[0][0] if entries else "0-0"
+            except redis.RedisError as exc:
+                self.broker.mark_redis_down(exc)
+        return self.broker.local.last_id(task_id)
+
+    async def _wait(self, task_id: str, after: str) -> List[Event]:
+        client = self._client()
+        if client is not None:
+            try:
+                streams = await client.xread({_stream_key(task_id): after}, block=PROGRESS_BLOCK_MS, count=100)
+                return [
+                    (event_id, json.loads(fields["data"]))
+                    for _, entries in streams for event_id, fields in entries
+                ]
+            except redis.RedisError as exc:
+                self.broker.mark_redis_down(exc)
+        return await self.broker.local.wait(task_id, after, PROGRESS_BLOCK_MS)
+
+    async def _read(self, task_id: str, cursor: str) -> None:
+        try:
+            while self._subscribers.get(task_id):
+                for event in await self._wait(task_id, cursor):
+                    cursor = event[0]
+                    for queue in list(self._subscribers.get(task_id, ())):
+                        queue.put_nowait(event)
+                    if is_terminal(event[1]):
+                        return
+        except Exception:
+            logger.exception("Progress reader for task %s failed", task_id)
+        finally:
+            self._readers.pop(task_id, None)
+
+    async def subscribe(
+        self, task_id: str, last_event_id: Optional[str] = None, heartbeat_seconds: float = PROGRESS_HEARTBEAT_SECONDS
+    ) -> AsyncIterator[Optional[Event]]:
+        """
+        События задачи после last_event_id: сначала сохранённые, затем новые; до итогового состояния.
+        None — простой дольше heartbeat_seconds
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(task_id, set()).add(queue)
+        try:
+            if task_id not in self._readers:
+                cursor = await self.last_event_id(task_id)
+                if task_id not in self._readers:
+                    self._readers[task_id] = asyncio.ensure_future(self._read(task_id, cursor))
+            # Registered before the backlog read, so nothing falls between the two; duplicates are skipped by id
+            last_seen = last_event_id or "0-0"
+            for event in await self._range(task_id, last_event_id):
+                last_seen = event[0]
+                yield event
+                if is_terminal(event[1]):
+                    return
+            while True:
+                if task_id not in self._readers and queue.empty():
+                    # The shared reader stopped (another task's terminal event or an error)
+                    self._readers[task_id] = asyncio.ensure_future(self._read(task_id, last_seen))
+                try:
+                    event = await asyncio.wait_for(queue.get(), heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    # No news: let the endpoint send a keep-alive
+                    yield None
+                    continue
+                if parse_event_id(event[0]) <= parse_event_id(last_seen):
+                    continue
+                last_seen = event[0]
+                yield event
+                if is_terminal(event[1]):
+                    return
+        finally:
+            subscribers = self._subscribers.get(task_id)
+            if subscribers is not None:
+                subscribers.discard(queue)
+                if not subscribers:
+                    del self._subscribers[task_id]
+
+
+_hubs: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ProgressHub]" = weakref.WeakKeyDictionary()
+
+
+def get_hub() -> ProgressHub:
+    """Хаб текущего event loop (очереди и Redis-соединения привязаны к loop)."""
+    loop = asyncio.get_running_loop()
+    hub = _hubs.get(loop)
+    if hub is None:
+        hub = _hubs[loop] = ProgressHub(progress_broker)
+    return hub
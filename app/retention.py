@@ -0,0 +1,222 @@
+"""
+Очистка завершённых задач по срокам хранения (cleanup_old_tasks).
+
+Таблица tasks проходится окнами по первичному ключу (id в (lo, lo + batch_size]),
+каждое окно переносится в tasks_archive (RETENTION_MODE=archive) или удаляется
+(RETENTION_MODE=delete) отдельной короткой транзакцией вместе со счётчиками
+task_stats и позицией прохода в retention_checkpoints. Между окнами, в
+которых что-то удалено, делается пауза, чтобы не держать SQLite-файл
+заблокированным. Прерванный проход продолжается с сохранённой позиции.
+
+Срок хранения задаётся на пользователя (users.task_retention_days):
+NULL — RETENTION_DEFAULT_DAYS, 0 — хранить всегда.
+
+    python -m app.retention --dry-run           # сколько задач было бы перенесено
+    python -m app.retention --batch-size 5000   # перенести в архив
+    python -m app.retention --mode delete       # удалить без архива
+"""
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, delete, func, insert, literal, or_, select
+from sqlalchemy.orm import Session
+
+from . import task_stats
+from .cache import invalidate_owner
+from .config import RETENTION_BATCH_SIZE, RETENTION_BATCH_SLEEP_SECONDS, RETENTION_DEFAULT_DAYS, RETENTION_MODE
+from .models import ArchivedTask, RetentionCheckpoint, Task, User
+
+CHECKPOINT_NAME = "cleanup_old_tasks"
+RETENTION_MODES = ("archive", "delete")
+ARCHIVE_COLUMNS = ("id", "title", "description", "completed", "created_at", "updated_at", "owner_id")
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+def expired_condition(db: Session, now: datetime, default_days: int = RETENTION_DEFAULT_DAYS):
+    """
+    Условие «задача просрочена» с учётом политики владельца (None — удалять нечего).
+
+    Одно сравнение updated_at на каждое различное значение task_retention_days.
+    """
+    conditions = []
+    if default_days > 0:
+        conditions.append(and_(
+            User.task_retention_days.is_(None),
+            Task.updated_at < now - timedelta(days=default_days)
+        ))
+    policies = db.execute(
+        select(User.task_retention_days).where(User.task_retention_days > 0).distinct()
+    ).scalars().all()
+    for days in policies:
+        conditions.append(and_(
+            User.task_retention_days == days,
+            Task.updated_at < now - timedelta(days=days)
+        ))
+    if not conditions:
+        return None
+    return and_(Task.completed == True, or_(*conditions))
+
+
+def _expired_ids(condition, low: int, high: int):
+    return (
+        select(Task.id)
+        .select_from(Task)
+        .outerjoin(User, User.id == Task.owner_id)
+        .where(Task.id > low, Task.id <= high, condition)
+    )
+
+
+def _load_checkpoint(db: Session) -> RetentionCheckpoint:
+    checkpoint = db.get(RetentionCheckpoint, CHECKPOINT_NAME)
+    if checkpoint is None:
+        checkpoint = RetentionCheckpoint(name=CHECKPOINT_NAME, last_id=0)
+        db.add(checkpoint)
+        db.flush()
+    return checkpoint
+
+
+def run_retention(
+    db: Session,
+    batch_size: int = RETENTION_BATCH_SIZE,
+    sleep_seconds: float = RETENTION_BATCH_SLEEP_SECONDS,
+    dry_run: bool = False,
+    default_days: int = RETENTION_DEFAULT_DAYS,
+    on_progress: Optional[ProgressCallback] = None,
+    max_batches: Optional[int] = None,
+    now: Optional[datetime] = None,
+    mode: str = RETENTION_MODE,
+) -> Dict[str, Any]:
+    """
+    Один проход очистки. max_batches ограничивает работу за запуск — следующий
+    запуск продолжит с checkpoint. dry_run только считает и не трогает checkpoint.
+    """
+    if mode not in RETENTION_MODES:
+        raise ValueError(f"Unknown retention mode: {mode}")
+    archive = mode == "archive"
+    now = now or datetime.utcnow()
+    condition = expired_condition(db, now, default_days)
+    max_id = db.execute(select(func.max(Task.id))).scalar() or 0
+
+    checkpoint = None if dry_run else _load_checkpoint(db)
+    start_id = checkpoint.last_id if checkpoint is not None else 0
+    if checkpoint is not None and not start_id:
+        checkpoint.run_started_at = now
+    db.commit()
+
+    by_user: Counter = Counter()
+    report: Dict[str, Any] = {
+        "dry_run": dry_run,
+        "mode": mode,
+        "resumed_from": start_id,
+        "max_id": max_id,
+        "last_id": start_id,
+        "batches": 0,
+        "deleted": 0,
+        "archived": 0,
+        "completed": False,
+        "by_user": {},
+    }
+
+    low = start_id
+    while low < max_id and condition is not None:
+        if max_batches is not None and report["batches"] >= max_batches:
+            break
+        high = min(low + batch_size, max_id)
+        expired = _expired_ids(condition, low, high)
+
+        if dry_run:
+            rows = db.execute(
+                select(Task.owner_id, func.count()).where(Task.id.in_(expired)).group_by(Task.owner_id)
+            ).all()
+            batch_counts = {owner_id: count for owner_id, count in rows}
+            db.rollback()
+        else:
+            if archive:
+                # INSERT ... SELECT copies stored values as-is, then exactly the copied ids
+                # are deleted in the same transaction: a task is always in one tier
+                db.execute(insert(ArchivedTask).from_select(
+                    [*ARCHIVE_COLUMNS, "archived_at"],
+                    select(*(getattr(Task, column) for column in ARCHIVE_COLUMNS), literal(now))
+                    .where(Task.id.in_(expired))
+                ))
+                expired = select(ArchivedTask.id).where(
+                    ArchivedTask.id > low, ArchivedTask.id <= high, ArchivedTask.archived_at == now
+                )
+            deleted = db.execute(
+                delete(Task)
+                .where(Task.id.in_(expired))
+                .returning(Task.owner_id, Task.created_at, Task.completed)
+                .execution_options(synchronize_session=False)
+            ).all()
+            # Counters come from RETURNING, so they match exactly what was removed
+            rows_by_owner: Dict[int, List] = {}
+            for row in deleted:
+                rows_by_owner.setdefault(row.owner_id, []).append((row.created_at, row.completed))
+            for owner_id, owner_rows in rows_by_owner.items():
+                if owner_id is not None:
+                    task_stats.apply_task_rows(db, owner_id, owner_rows, sign=-1)
+            checkpoint.last_id = high
+            db.commit()
+            for owner_id in rows_by_owner:
+                if owner_id is not None:
+                    invalidate_owner(owner_id)
+            batch_counts = {owner_id: len(owner_rows) for owner_id, owner_rows in rows_by_owner.items()}
+
+        batch_deleted = sum(batch_counts.values())
+        by_user.update(batch_counts)
+        report["batches"] += 1
+        report["deleted"] += batch_deleted
+        if archive and not dry_run:
+            report["archived"] += batch_deleted
+        report["last_id"] = high
+        report["by_user"] = {str(owner_id): count for owner_id, count in by_user.items()}
+        if on_progress is not None:
+            on_progress(report)
+        low = high
+        if batch_deleted and not dry_run and sleep_seconds > 0 and low < max_id:
+            # Give API and worker writers a window between delete transactions
+            time.sleep(sleep_seconds)
+
+    if low >= max_id or condition is None:
+        report["completed"] = True
+        if checkpoint is not None:
+            checkpoint.last_id = 0
+            checkpoint.run_started_at = None
+            db.commit()
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Archive or delete completed tasks past their retention period")
+    parser.add_argument("--dry-run", action="store_true", help="Only count what would be removed")
+    parser.add_argument("--mode", choices=RETENTION_MODES, default=RETENTION_MODE, help="Move to tasks_archive or delete")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE, help="Task ids per delete batch")
+    parser.add_argument("--sleep", type=float, default=RETENTION_BATCH_SLEEP_SECONDS, help="Pause between batches, s")
+    parser.add_argument("--max-batches", type=int, help="Stop after N batches (the next run resumes)")
+    args = parser.parse_args(argv)
+
+    def print_progress(report: Dict[str, Any]) -> None:
+        print(f"ids {report['last_id']}/{report['max_id']}: {report['deleted']} removed ({args.mode})", file=sys.stderr)
+
+    db = SessionLocal()
+    try:
+        report = run_retention(
+            db, batch_size=args.batch_size, sleep_seconds=args.sleep, dry_run=args.dry_run,
+            on_progress=print_progress, max_batches=args.max_batches, mode=args.mode
+        )
+    finally:
+        db.close()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from celery.states import READY_STATES
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
+import os
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..schemas import TaskResponse
 from ..auth import get_current_user
 from ..models import User
+from ..cache import cache
+from ..config import CACHE_TTL_TASKS, CACHE_TTL_STATISTICS
+from ..exporters import EXPORT_MEDIA_TYPES, export_filename, stream_export
+from ..artifacts import (
+    artifact_id_for, artifact_etag, find_artifact, iter_file_range, parse_byte_range, pending_job, set_pending_job
+)
+from ..task_stats import get_stats_version
+from ..celery_app import celery_app
+from ..tasks import export_tasks_to_artifact
+from ..task_status import register_task
 from ..crud import (
     get_tasks_with_filters,
     get_task_statistics,
@@ -13,7 +26,11 @@ from ..crud import (
     bulk_delete_tasks,
     get_tasks_by_date_range,
     duplicate_task,
-    get_user_activity_summary
+    get_user_activity_summary,
+    get_task_analytics as build_task_analytics,
+    encode_cursor,
+    task_to_dict,
+    InvalidCursorError
 )
 from pydantic import BaseModel
 
@@ -34,34 +51,46 @@ class DateRangeQuery(BaseModel):
 
 @router.get("/search", response_model=List[TaskResponse])
 def search_tasks(
-    search: Optional[str] = Query(None, description="Search in title and description"),
+    response: Response,
+    search: Optional[str] = Query(None, description="Case-insensitive substring search in title and description"),
     completed: Optional[bool] = Query(None, description="Filter by completion status"),
-    sort_by: str = Query("created_at", description="Sort by field"),
+    sort_by: str = Query("created_at", description="Sort by field; 'relevance' ranks search matches"),
     sort_order: str = Query("desc", description="Sort order: asc or desc"),
     skip: int = Query(0, ge=0, description="Number of tasks to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Number of tasks to return"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from X-Next-Cursor; replaces skip"),
+    include_archived: bool = Query(False, description="Also search tasks moved to the archive by retention"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Поиск и фильтрация задач с расширенными возможностями
     """
-    valid_sort_fields = ["created_at", "updated_at", "title", "completed"]
+    valid_sort_fields = ["created_at", "updated_at", "title", "completed", "relevance"]
     if sort_by not in valid_sort_fields:
         raise HTTPException(status_code=400, detail=f"Invalid sort field. Use: {valid_sort_fields}")
     
-    tasks = get_tasks_with_filters(
-        db=db,
-        user_id=current_user.id,
-        completed=completed,
-        search=search,
-        sort_by=sort_by,
-        sort_order=sort_order,
-        skip=skip,
-        limit=limit
-    )
+    params = {
+        "completed": completed, "search": search, "sort_by": sort_by, "sort_order": sort_order,
+        "skip": skip, "limit": limit, "cursor": cursor, "include_archived": include_archived
+    }
     
-    return tasks
+    def load_page():
+        tasks = get_tasks_with_filters(db=db, user_id=current_user.id, **params)
+        next_cursor = None
+        if tasks and len(tasks) == limit and sort_by != "relevance":
+            next_cursor = encode_cursor(tasks[-1], sort_by)
+        return {"tasks": [task_to_dict(task) for task in tasks], "next_cursor": next_cursor}
+    
+    try:
+        page = cache.get_or_load(current_user.id, "search", params, load_page, ttl=CACHE_TTL_TASKS)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    
+    return page["tasks"]
 
 @router.get("/statistics")
 def get_statistics(
@@ -71,7 +100,11 @@ def get_statistics(
     """
     Получить детальную статистику по задачам
     """
-    stats = get_task_statistics(db=db, user_id=current_user.id)
+    stats = cache.get_or_load(
+        current_user.id, "statistics", {},
+        lambda: get_task_statistics(db=db, user_id=current_user.id),
+        ttl=CACHE_TTL_STATISTICS
+    )
     return stats
 
 @router.put("/bulk-update")
@@ -201,61 +234,114 @@ def get_activity_summary(
     """
     Получить сводку активности пользователя за указанный период
     """
-    summary = get_user_activity_summary(
-        db=db,
-        user_id=current_user.id,
-        days=days
+    summary = cache.get_or_load(
+        current_user.id, "activity-summary", {"days": days},
+        lambda: get_user_activity_summary(db=db, user_id=current_user.id, days=days),
+        ttl=CACHE_TTL_STATISTICS
     )
     
     return summary
 
 @router.get("/export")
 def export_tasks(
-    format: str = Query("json", regex="^(json|csv)$", description="Export format: json or csv"),
+    format: str = Query("json", regex="^(json|csv|ndjson)$", description="Export format: json, csv or ndjson"),
     completed: Optional[bool] = Query(None, description="Filter by completion status"),
+    gzip: bool = Query(False, description="Compress the export with gzip"),
+    background: bool = Query(False, description="Build a gzip artifact in Celery instead of streaming"),
+    include_archived: bool = Query(False, description="Also export tasks moved to the archive by retention"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
-    Экспорт задач в различных форматах
+    Потоковый экспорт задач (без ограничения числа строк) или фоновый экспорт в артефакт
     """
-    tasks = get_tasks_with_filters(
-        db=db,
-        user_id=current_user.id,
-        completed=completed,
-        limit=10000  # Большой лимит для экспорта
+    if background:
+        return enqueue_export(db, current_user.id, format, completed, include_archived)
+    
+    filename = export_filename(format, gzip)
+    return StreamingResponse(
+        stream_export(
+            db.get_bind(), current_user.id, format, completed=completed, gzip=gzip, include_archived=include_archived
+        ),
+        media_type="application/gzip" if gzip else EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
+
+def enqueue_export(
+    db: Session, user_id: int, export_format: str, completed: Optional[bool], include_archived: bool = False
+):
+    """
+    Вернуть готовый артефакт или поставить (один раз) задачу его построения
+    """
+    # Every task write bumps the stats version, so an unchanged key means unchanged data
+    filters = {"completed": completed}
+    if include_archived:
+        filters["include_archived"] = True
+    artifact_id = artifact_id_for(user_id, export_format, filters, get_stats_version(db, user_id))
+    response = {
+        "artifact_id": artifact_id,
+        "download_url": f"/api/advanced-tasks/export/artifacts/{artifact_id}"
+    }
+    if find_artifact(user_id, artifact_id):
+        return {**response, "status": "READY"}
+    
+    job_id = pending_job(user_id, artifact_id)
+    if job_id:
+        try:
+            job_state = celery_app.AsyncResult(job_id).state
+        except Exception:
+            job_state = "PENDING"
+        if job_state not in READY_STATES:
+            return JSONResponse(status_code=202, content={**response, "task_id": job_id, "status": job_state})
+    
+    job = export_tasks_to_artifact.delay(
+        user_id=user_id, export_format=export_format, completed=completed, artifact_id=artifact_id,
+        include_archived=include_archived
+    )
+    set_pending_job(user_id, artifact_id, job.id)
+    register_task(job.id, user_id)
+    return JSONResponse(status_code=202, content={**response, "task_id": job.id, "status": "PENDING"})
+
+@router.get("/export/artifacts/{artifact_id}")
+def download_export_artifact(
+    artifact_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Скачать артефакт экспорта (поддерживаются Range и ETag / If-None-Match)
+    """
+    path = find_artifact(current_user.id, artifact_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    
+    size = os.path.getsize(path)
+    etag = artifact_etag(path)
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="tasks-export.{os.path.basename(path).split(".", 1)[1]}"'
+    }
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers=headers)
     
-    if format == "json":
-        return {
-            "tasks": [
-                {
-                    "id": task.id,
-                    "title": task.title,
-                    "description": task.description,
-                    "completed": task.completed,
-                    "created_at": task.created_at.isoformat(),
-                    "updated_at": task.updated_at.isoformat()
-                }
-                for task in tasks
-            ],
-            "total_count": len(tasks),
-            "export_date": datetime.utcnow().isoformat(),
-            "format": "json"
-        }
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag:
+        try:
+            byte_range = parse_byte_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
     
-    elif format == "csv":
-        # В реальном приложении здесь можно использовать pandas или csv модуль
-        csv_data = "id,title,description,completed,created_at,updated_at\n"
-        for task in tasks:
-            csv_data += f"{task.id},\"{task.title}\",\"{task.description or ''}\",{task.completed},{task.created_at},{task.updated_at}\n"
-        
-        return {
-            "csv_data": csv_data,
-            "total_count": len(tasks),
-            "export_date": datetime.utcnow().isoformat(),
-            "format": "csv"
-        }
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        iter_file_range(path, start, end), status_code=status_code, media_type="application/gzip", headers=headers
+    )
 
 @router.get("/analytics")
 def get_task_analytics(
@@ -265,16 +351,12 @@ def get_task_analytics(
     """
     Получить аналитику по задачам
     """
-    # Базовая статистика
-    stats = get_task_statistics(db=db, user_id=current_user.id)
-    
-    # Активность за разные периоды
-    activity_7d = get_user_activity_summary(db=db, user_id=current_user.id, days=7)
-    activity_30d = get_user_activity_summary(db=db, user_id=current_user.id, days=30)
+    # Базовая статистика и активность за 7/30 дней одним агрегирующим запросом
+    analytics = cache.get_or_load(
+        current_user.id, "analytics", {},
+        lambda: build_task_analytics(db=db, user_id=current_user.id),
+        ttl=CACHE_TTL_STATISTICS
+    )
+    analytics["generated_at"] = datetime.utcnow().isoformat()
     
-    return {
-        "basic_statistics": stats,
-        "activity_last_7_days": activity_7d,
-        "activity_last_30_days": activity_30d,
-        "generated_at": datetime.utcnow().isoformat()
-    } 
\ No newline at end of file
+    return analytics 
\ No newline at end of file
@@ -3,8 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException, status, Form
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from ..database import get_db
-from ..schemas import UserCreate, UserResponse, Token, UserLogin
-from ..auth import authenticate_user, create_access_token, get_current_user
+from ..schemas import UserCreate, UserResponse, Token, UserLogin, RetentionPolicyUpdate
+from ..auth import authenticate_user, create_user_access_token, get_current_user
 from ..crud import create_user, get_user_by_username, get_user_by_email
 from ..config import ACCESS_TOKEN_EXPIRE_MINUTES
 
@@ -39,11 +39,22 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
             headers={"WWW-Authenticate": "Bearer"},
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    access_token = create_user_access_token(user, expires_delta=access_token_expires)
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UserResponse)
 def read_users_me(current_user: UserResponse = Depends(get_current_user)):
-    return current_user 
\ No newline at end of file
+    return current_user
+
+@router.put("/me/retention", response_model=UserResponse)
+def update_retention_policy(
+    policy: RetentionPolicyUpdate,
+    current_user: UserResponse = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if policy.task_retention_days is not None and policy.task_retention_days < 0:
+        raise HTTPException(status_code=400, detail="Retention must be 0 (keep forever) or a positive number of days")
+    current_user.task_retention_days = policy.task_retention_days
+    db.commit()
+    db.refresh(current_user)
+    return current_user
@@ -1,18 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Header, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Optional
 from sqlalchemy.orm import Session
 from ..database import get_db
-from ..auth import get_current_user
+from ..auth import get_current_user, user_from_token
 from ..models import User
 from ..celery_app import celery_app
-from ..tasks import send_email_notification, process_bulk_tasks, generate_task_report, cleanup_old_tasks
+from ..config import BULK_CREATE_MAX_TASKS, TASK_STATUS_BATCH_MAX
+from ..bulk_ingest import IMPORT_FORMATS, ImportTooLarge, spool_upload
+from ..progress import format_task_status, get_hub, is_terminal
+from ..task_status import get_task_owner, get_task_statuses, register_task
+from ..worker_state import worker_state
+from ..tasks import send_email_notification, process_bulk_tasks, import_tasks_from_file, generate_task_report, cleanup_old_tasks
 from pydantic import BaseModel
+import json
+import os
 
 router = APIRouter(prefix="/celery", tags=["celery-tasks"])
 
 class BulkTaskCreate(BaseModel):
     tasks: List[Dict[str, str]]
 
+IMPORT_CONTENT_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+class TaskStatusBatch(BaseModel):
+    task_ids: List[str]
+
 class TaskProgress(BaseModel):
     task_id: str
     state: str
@@ -25,19 +44,22 @@ class TaskProgress(BaseModel):
 def trigger_email_notification(
     task_title: str,
     notification_type: str = "task_created",
+    task_id: Optional[int] = None,
     current_user: User = Depends(get_current_user)
 ):
     """
-    Запустить асинхронную отправку email уведомления
+    Поставить email уведомление в очередь дайджеста (повтор с теми же task_id/task_title и типом не дублирует письмо)
     """
     task = send_email_notification.delay(
         user_id=current_user.id,
         task_title=task_title,
-        notification_type=notification_type
+        notification_type=notification_type,
+        task_id=task_id
     )
+    register_task(task.id, current_user.id)
     
     return {
-        "message": "Email notification task started",
+        "message": "Email notification queued for digest",
         "task_id": task.id,
         "status": "PENDING"
     }
@@ -53,8 +75,8 @@ def create_bulk_tasks(
     if not bulk_data.tasks:
         raise HTTPException(status_code=400, detail="No tasks provided")
     
-    if len(bulk_data.tasks) > 100:
-        raise HTTPException(status_code=400, detail="Maximum 100 tasks allowed per bulk operation")
+    if len(bulk_data.tasks) > BULK_CREATE_MAX_TASKS:
+        raise HTTPException(status_code=400, detail=f"Maximum {BULK_CREATE_MAX_TASKS} tasks allowed per bulk operation")
     
     # Validate task data
     for task_data in bulk_data.tasks:
@@ -65,6 +87,7 @@ def create_bulk_tasks(
         user_id=current_user.id,
         tasks_data=bulk_data.tasks
     )
+    register_task(task.id, current_user.id)
     
     return {
         "message": f"Bulk task creation started for {len(bulk_data.tasks)} tasks",
@@ -73,6 +96,45 @@ def create_bulk_tasks(
         "total_tasks": len(bulk_data.tasks)
     }
 
+@router.post("/import-tasks", status_code=202)
+async def import_tasks(
+    request: Request,
+    file_format: Optional[str] = Query(None, alias="format"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Потоковый импорт задач из тела запроса (NDJSON или CSV с колонками title, description)
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    file_format = file_format or IMPORT_CONTENT_TYPES.get(content_type)
+    if file_format not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=415,
+            detail="Send application/x-ndjson or text/csv, or pass ?format=ndjson|csv"
+        )
+    
+    try:
+        path = await spool_upload(request.stream(), current_user.id, file_format)
+    except ImportTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    if os.path.getsize(path) == 0:
+        os.unlink(path)
+        raise HTTPException(status_code=400, detail="No tasks provided")
+    
+    # The broker message carries only the spool path, not the payload
+    task = await run_in_threadpool(
+        import_tasks_from_file.delay, user_id=current_user.id, path=path, file_format=file_format
+    )
+    await run_in_threadpool(register_task, task.id, current_user.id)
+    
+    return {
+        "message": "Task import started",
+        "task_id": task.id,
+        "status": "PENDING",
+        "format": file_format
+    }
+
 @router.post("/generate-report")
 def generate_user_report(
     current_user: User = Depends(get_current_user)
@@ -81,6 +143,7 @@ def generate_user_report(
     Генерация отчета по задачам пользователя
     """
     task = generate_task_report.delay(user_id=current_user.id)
+    register_task(task.id, current_user.id)
     
     return {
         "message": "Report generation started",
@@ -90,13 +153,15 @@ def generate_user_report(
 
 @router.post("/cleanup-old-tasks")
 def trigger_cleanup(
+    dry_run: bool = False,
     current_user: User = Depends(get_current_user)
 ):
     """
     Запустить очистку старых задач (только для администраторов)
     """
     # In a real app, you'd check if user is admin
-    task = cleanup_old_tasks.delay()
+    task = cleanup_old_tasks.delay(dry_run=dry_run)
+    register_task(task.id, current_user.id)
     
     return {
         "message": "Cleanup task started",
@@ -111,72 +176,139 @@ def get_task_status(task_id: str):
     """
     try:
         task_result = celery_app.AsyncResult(task_id)
-        
-        if task_result.state == 'PENDING':
-            response = {
-                'task_id': task_id,
-                'state': task_result.state,
-                'current': 0,
-                'total': 1,
-                'status': 'Pending...'
-            }
-        elif task_result.state != 'FAILURE':
-            response = {
-                'task_id': task_id,
-                'state': task_result.state,
-                'current': task_result.info.get('current', 0),
-                'total': task_result.info.get('total', 1),
-                'status': task_result.info.get('status', '')
-            }
-            if 'result' in task_result.info:
-                response['result'] = task_result.info['result']
-        else:
-            # Something went wrong in the background job
-            response = {
-                'task_id': task_id,
-                'state': task_result.state,
-                'current': 1,
-                'total': 1,
-                'status': 'Task failed',
-                'error': str(task_result.info)
-            }
-        
-        return response
-        
+        return format_task_status(task_id, task_result.state, task_result.info)
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
 
+@router.post("/task-status/batch")
+def get_task_status_batch(
+    batch: TaskStatusBatch,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Статусы нескольких задач текущего пользователя за один запрос к result backend
+    """
+    if not batch.task_ids:
+        raise HTTPException(status_code=400, detail="No task ids provided")
+    if len(batch.task_ids) > TASK_STATUS_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"Maximum {TASK_STATUS_BATCH_MAX} task ids per request")
+    
+    statuses, not_found = get_task_statuses(batch.task_ids, current_user.id)
+    return {"tasks": statuses, "not_found": not_found}
+
+def _status_snapshot(task_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        return get_task_status(task_id)
+    except HTTPException:
+        return None
+
+async def _progress_events(task_id: str, last_event_id: Optional[str]):
+    """
+    Текущее состояние (если stream пуст) и затем события прогресса до итогового
+    """
+    hub = get_hub()
+    if not last_event_id and await hub.last_event_id(task_id) == "0-0":
+        # Nothing published yet (or the stream expired): one result-backend read, not a poll loop
+        snapshot = await run_in_threadpool(_status_snapshot, task_id)
+        if snapshot is not None:
+            yield None, snapshot
+            if is_terminal(snapshot):
+                return
+    async for event in hub.subscribe(task_id, last_event_id):
+        yield event if event is not None else (None, None)
+
+async def _owns_task(db: Session, task_id: str, user_id: int) -> bool:
+    # The stream outlives the request: give the pooled connection back before it starts
+    await run_in_threadpool(db.close)
+    return await run_in_threadpool(get_task_owner, task_id) == user_id
+
+@router.get("/task-progress/{task_id}/stream")
+async def stream_task_progress(
+    task_id: str,
+    last_event_id_query: Optional[str] = Query(None, alias="last_event_id"),
+    last_event_id: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Прогресс задачи через Server-Sent Events (переподключение с Last-Event-ID)
+    """
+    if not await _owns_task(db, task_id, current_user.id):
+        # Foreign and unknown ids look the same, as in task-status/batch
+        raise HTTPException(status_code=404, detail=f"Task {task_id} not found")
+    
+    async def event_stream():
+        yield "retry: 3000\n\n"
+        async for event_id, payload in _progress_events(task_id, last_event_id or last_event_id_query):
+            if payload is None:
+                yield ": keep-alive\n\n"
+                continue
+            frame = f"id: {event_id}\n" if event_id else ""
+            yield frame + f"event: progress\ndata: {json.dumps(payload)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.websocket("/task-progress/{task_id}/ws")
+async def websocket_task_progress(
+    websocket: WebSocket,
+    task_id: str,
+    token: Optional[str] = None,
+    last_event_id: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Прогресс задачи через WebSocket; token — JWT (браузер не передаёт заголовки при рукопожатии),
+    last_event_id продолжает после уже полученного события
+    """
+    user = await run_in_threadpool(user_from_token, db, token) if token else None
+    if user is None or not await _owns_task(db, task_id, user.id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    try:
+        async for event_id, payload in _progress_events(task_id, last_event_id):
+            if payload is None:
+                await websocket.send_json({"type": "keep-alive"})
+                continue
+            await websocket.send_json({"type": "progress", "id": event_id, "data": payload})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+
 @router.get("/active-tasks")
 def get_active_tasks():
     """
-    Получить список активных задач
+    Получить список активных задач (из фонового снимка состояния worker'ов)
     """
-    try:
-        # Get active tasks from Celery
-        inspect = celery_app.control.inspect()
-        active_tasks = inspect.active()
-        
-        if not active_tasks:
-            return {"active_tasks": [], "message": "No active tasks"}
-        
-        formatted_tasks = []
-        for worker, tasks in active_tasks.items():
-            for task in tasks:
-                formatted_tasks.append({
-                    "task_id": task["id"],
-                    "name": task["name"],
-                    "worker": worker,
-                    "args": task["args"],
-                    "kwargs": task["kwargs"]
-                })
-        
-        return {
-            "active_tasks": formatted_tasks,
-            "total_active": len(formatted_tasks)
-        }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch active tasks: {str(e)}")
+    state = worker_state.snapshot()
+    freshness = {key: state[key] for key in ("collected_at", "age_seconds", "stale", "error")}
+    if state["workers"] is None:
+        raise HTTPException(status_code=503, detail={"message": "Worker state not collected yet", **freshness})
+    
+    active_tasks = state["workers"]["active"]
+    if not active_tasks:
+        return {"active_tasks": [], "message": "No active tasks", **freshness}
+    
+    formatted_tasks = []
+    for worker, tasks in active_tasks.items():
+        for task in tasks:
+            formatted_tasks.append({
+                "task_id": task["id"],
+                "name": task["name"],
+                "worker": worker,
+                "args": task["args"],
+                "kwargs": task["kwargs"]
+            })
+    
+    return {
+        "active_tasks": formatted_tasks,
+        "total_active": len(formatted_tasks),
+        **freshness
+    }
 
 @router.delete("/cancel-task/{task_id}")
 def cancel_task(task_id: str):
@@ -195,31 +327,31 @@ def cancel_task(task_id: str):
 @router.get("/worker-stats")
 def get_worker_stats():
     """
-    Получить статистику worker'ов
+    Получить статистику worker'ов (из фонового снимка состояния)
     """
-    try:
-        inspect = celery_app.control.inspect()
-        stats = inspect.stats()
-        registered = inspect.registered()
-        
-        if not stats:
-            return {"workers": [], "message": "No workers available"}
-        
-        worker_info = []
-        for worker_name, worker_stats in stats.items():
-            worker_data = {
-                "worker": worker_name,
-                "status": "online",
-                "pool": worker_stats.get("pool", {}),
-                "total_tasks": worker_stats.get("total", {}),
-                "registered_tasks": registered.get(worker_name, []) if registered else []
-            }
-            worker_info.append(worker_data)
-        
-        return {
-            "workers": worker_info,
-            "total_workers": len(worker_info)
+    state = worker_state.snapshot()
+    freshness = {key: state[key] for key in ("collected_at", "age_seconds", "stale", "error")}
+    if state["workers"] is None:
+        raise HTTPException(status_code=503, detail={"message": "Worker state not collected yet", **freshness})
+    
+    stats = state["workers"]["stats"]
+    registered = state["workers"]["registered"]
+    if not stats:
+        return {"workers": [], "message": "No workers available", **freshness}
+    
+    worker_info = []
+    for worker_name, worker_stats in stats.items():
+        worker_data = {
+            "worker": worker_name,
+            "status": "online",
+            "pool": worker_stats.get("pool", {}),
+            "total_tasks": worker_stats.get("total", {}),
+            "registered_tasks": registered.get(worker_name, [])
         }
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to fetch worker stats: {str(e)}") 
\ No newline at end of file
+        worker_info.append(worker_data)
+    
+    return {
+        "workers": worker_info,
+        "total_workers": len(worker_info),
+        **freshness
+    }
@@ -2,13 +2,30 @@ from fastapi import APIRouter, Request, Depends, Form, HTTPException, status
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.orm import Session
-from ..database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from ..database import get_db, get_async_db
 from ..schemas import UserCreate
-from ..auth import authenticate_user, create_access_token, get_current_user
-from ..crud import create_user, get_user_by_username, get_user_by_email, get_tasks_by_user
-from ..models import User
+from ..auth import create_user_access_token, get_current_user, resolve_user
+from ..passwords import password_service, PasswordServiceBusy
+from ..crud import encode_cursor, InvalidCursorError, create_user, get_user_by_username, get_user_by_email, get_tasks_by_user
 from datetime import timedelta
-from ..config import ACCESS_TOKEN_EXPIRE_MINUTES
+from typing import Any, Callable, Optional, Union
+from ..config import ACCESS_TOKEN_EXPIRE_MINUTES, DATABASE_ASYNC
+
+DASHBOARD_PAGE_SIZE = 100
+
+# Pages follow the same switch as /api/tasks: AsyncSession only when DATABASE_ASYNC is on
+get_page_db = get_async_db if DATABASE_ASYNC else get_db
+PageSession = Union[AsyncSession, Session]
+
+async def run_db(db: PageSession, fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Выполнить синхронную функцию crud/auth, не блокируя event loop
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args)
+    return await run_in_threadpool(fn, db, *args)
 
 router = APIRouter(tags=["frontend"])
 templates = Jinja2Templates(directory="app/templates")
@@ -30,9 +47,18 @@ async def login_form(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: PageSession = Depends(get_page_db)
 ):
-    user = authenticate_user(db, username, password)
+    try:
+        user = await run_db(db, get_user_by_username, username)
+        if user and not await password_service.verify_async(password, user.hashed_password):
+            user = None
+    except PasswordServiceBusy:
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": "Too many login attempts right now, please retry shortly"},
+            status_code=429
+        )
     if not user:
         return templates.TemplateResponse(
             "login.html", 
@@ -41,9 +67,7 @@ async def login_form(
     
     # Create access token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
-    )
+    access_token = create_user_access_token(user, expires_delta=access_token_expires)
     
     # Redirect to dashboard with token in cookie
     response = RedirectResponse(url="/dashboard", status_code=302)
@@ -56,16 +80,16 @@ async def register_form(
     username: str = Form(...),
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: PageSession = Depends(get_page_db)
 ):
     # Check if user already exists
-    if get_user_by_username(db, username):
+    if await run_db(db, get_user_by_username, username):
         return templates.TemplateResponse(
             "register.html", 
             {"request": request, "error": "Username already registered"}
         )
     
-    if get_user_by_email(db, email):
+    if await run_db(db, get_user_by_email, email):
         return templates.TemplateResponse(
             "register.html", 
             {"request": request, "error": "Email already registered"}
@@ -73,18 +97,23 @@ async def register_form(
     
     try:
         user_create = UserCreate(username=username, email=email, password=password)
-        create_user(db=db, user=user_create)
+        hashed_password = await password_service.hash_async(password)
+        user = await run_db(db, create_user, user_create, hashed_password)
         
         # Auto login after registration
         access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": username}, expires_delta=access_token_expires
-        )
+        access_token = create_user_access_token(user, expires_delta=access_token_expires)
         
         response = RedirectResponse(url="/dashboard", status_code=302)
         response.set_cookie(key="access_token", value=access_token, httponly=False, secure=False)
         return response
         
+    except PasswordServiceBusy:
+        return templates.TemplateResponse(
+            "register.html",
+            {"request": request, "error": "Too many registrations right now, please retry shortly"},
+            status_code=429
+        )
     except Exception as e:
         return templates.TemplateResponse(
             "register.html", 
@@ -92,7 +121,7 @@ async def register_form(
         )
 
 @router.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request, db: Session = Depends(get_db)):
+async def dashboard(request: Request, cursor: Optional[str] = None, db: PageSession = Depends(get_page_db)):
     # Get token from cookie
     token = request.cookies.get("access_token")
     if not token:
@@ -106,19 +135,23 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
         token_data = verify_token(credentials)
         
-        # Get current user
-        user = db.query(User).filter(User.username == token_data.username).first()
-        if not user:
+        # Get current user (served from the user cache when possible)
+        user = await run_db(db, resolve_user, token_data)
+        if not user or user.is_active is False:
             response = RedirectResponse(url="/login")
             response.delete_cookie(key="access_token")
             return response
         
-        # Get user's tasks
-        tasks = get_tasks_by_user(db, user_id=user.id)
+        # Get user's tasks (keyset paginated)
+        try:
+            tasks = await run_db(db, get_tasks_by_user, user.id, 0, DASHBOARD_PAGE_SIZE, cursor)
+        except InvalidCursorError:
+            return RedirectResponse(url="/dashboard")
+        next_cursor = encode_cursor(tasks[-1]) if len(tasks) == DASHBOARD_PAGE_SIZE else None
         
         return templates.TemplateResponse(
             "dashboard.html", 
-            {"request": request, "user": user, "tasks": tasks}
+            {"request": request, "user": user, "tasks": tasks, "next_cursor": next_cursor}
         )
         
     except Exception as e:
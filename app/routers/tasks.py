@@ -1,10 +1,13 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from sqlalchemy.orm import Session
 from ..database import get_db
 from ..schemas import TaskCreate, TaskUpdate, TaskResponse
 from ..auth import get_current_user
-from ..crud import create_task, get_tasks_by_user, get_task, update_task, delete_task
+from ..crud import (
+    create_task, get_tasks_by_user, get_task, update_task, delete_task,
+    encode_cursor, InvalidCursorError
+)
 from ..models import User
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
@@ -19,12 +22,20 @@ def create_user_task(
 
 @router.get("/get_tasks", response_model=List[TaskResponse])
 def read_user_tasks(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    tasks = get_tasks_by_user(db, user_id=current_user.id, skip=skip, limit=limit)
+    try:
+        tasks = get_tasks_by_user(db, user_id=current_user.id, skip=skip, limit=limit, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Next page cursor goes into a header so the response body stays a plain list
+    if tasks and len(tasks) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(tasks[-1])
     return tasks
 
 @router.get("/{task_id}", response_model=TaskResponse)
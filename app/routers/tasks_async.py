@@ -0,0 +1,74 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..database import get_async_db
+from ..schemas import TaskCreate, TaskUpdate, TaskResponse
+from ..auth import get_current_user_async
+from ..crud import encode_cursor, InvalidCursorError
+from ..crud_async import create_task, get_tasks_by_user, get_task, update_task, delete_task
+from ..models import User
+
+# Асинхронный вариант routers/tasks.py (DATABASE_ASYNC=true): те же пути и ответы,
+# но запросы идут через AsyncSession и не занимают поток из threadpool
+router = APIRouter(prefix="/tasks", tags=["tasks"])
+
+@router.post("/create_task", response_model=TaskResponse)
+async def create_user_task(
+    task: TaskCreate,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await create_task(db=db, task=task, user_id=current_user.id)
+
+@router.get("/get_tasks", response_model=List[TaskResponse])
+async def read_user_tasks(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        tasks = await get_tasks_by_user(db, user_id=current_user.id, skip=skip, limit=limit, cursor=cursor)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if tasks and len(tasks) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(tasks[-1])
+    return tasks
+
+@router.get("/{task_id}", response_model=TaskResponse)
+async def read_task(
+    task_id: int,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    db_task = await get_task(db, task_id=task_id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if db_task.owner_id != current_user.id:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+    return db_task
+
+@router.put("/{task_id}", response_model=TaskResponse)
+async def update_user_task(
+    task_id: int,
+    task: TaskUpdate,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    db_task = await update_task(db, task_id=task_id, task_update=task, user_id=current_user.id)
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return db_task
+
+@router.delete("/{task_id}")
+async def delete_user_task(
+    task_id: int,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    success = await delete_task(db, task_id=task_id, user_id=current_user.id)
+    if not success:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return {"message": "Task deleted successfully"}
@@ -14,10 +14,15 @@ class UserResponse(UserBase):
     id: int
     is_active: bool
     created_at: datetime
+    task_retention_days: Optional[int] = None
     
     class Config:
         orm_mode = True
 
+class RetentionPolicyUpdate(BaseModel):
+    # None = server default, 0 = keep completed tasks forever
+    task_retention_days: Optional[int] = None
+
 # Task Schemas
 class TaskBase(BaseModel):
     title: str
@@ -37,6 +42,7 @@ class TaskResponse(TaskBase):
     created_at: datetime
     updated_at: datetime
     owner_id: int
+    archived: bool = False
     
     class Config:
         orm_mode = True
@@ -48,6 +54,7 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     username: Optional[str] = None
+    user_id: Optional[int] = None
 
 class UserLogin(BaseModel):
     username: str
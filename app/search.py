@@ -0,0 +1,163 @@
+import weakref
+from typing import Optional, Tuple
+
+from sqlalchemy import column, func, literal_column, or_, table, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Query, Session
+
+from .config import SEARCH_BACKEND
+from .models import Task
+
+# Search is a case-insensitive substring match on title or description ("ask" finds "task"),
+# the same in every backend and in the archive tier; the indexes are trigram indexes
+TRIGRAM_MIN_LENGTH = 3
+
+# SQLite: external-content FTS5 trigram table over tasks, kept in sync by triggers
+SQLITE_FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+        title, description,
+        content='tasks', content_rowid='id',
+        tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF title, description ON tasks BEGIN
+        INSERT INTO tasks_fts(tasks_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO tasks_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END
+    """,
+    # Re-index whatever is already in tasks (also repairs a stale index)
+    "INSERT INTO tasks_fts(tasks_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP = [
+    "DROP TRIGGER IF EXISTS tasks_fts_au",
+    "DROP TRIGGER IF EXISTS tasks_fts_ad",
+    "DROP TRIGGER IF EXISTS tasks_fts_ai",
+    "DROP TABLE IF EXISTS tasks_fts",
+]
+
+# Postgres: pg_trgm GIN index, used by ILIKE '%term%' directly
+POSTGRES_FTS_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_search_trgm ON tasks USING GIN (title gin_trgm_ops, description gin_trgm_ops)",
+]
+POSTGRES_FTS_DROP = ["DROP INDEX IF EXISTS ix_tasks_search_trgm"]
+
+_fts_ready_binds = weakref.WeakSet()
+
+
+def install_search_index(connection: Connection) -> None:
+    """
+    Создать полнотекстовый индекс для диалекта соединения (тесты и create_all;
+    схему БД приложения создаёт миграция 0003)
+    """
+    ddl = {"sqlite": SQLITE_FTS_DDL, "postgresql": POSTGRES_FTS_DDL}.get(connection.dialect.name, [])
+    for statement in ddl:
+        connection.exec_driver_sql(statement)
+
+
+def drop_search_index(connection: Connection) -> None:
+    ddl = {"sqlite": SQLITE_FTS_DROP, "postgresql": POSTGRES_FTS_DROP}.get(connection.dialect.name, [])
+    for statement in ddl:
+        connection.exec_driver_sql(statement)
+
+
+def substring_filter(model, search: str):
+    """
+    Условие поиска для tasks и tasks_archive: подстрока в заголовке или описании
+    """
+    return or_(model.title.ilike(f"%{search}%"), model.description.ilike(f"%{search}%"))
+
+
+class LikeSearchBackend:
+    """
+    Запасной вариант: ILIKE без индекса (полный просмотр задач пользователя)
+    """
+    name = "like"
+
+    def apply(self, query: Query, search: str) -> Tuple[Query, Optional[object]]:
+        return query.filter(substring_filter(Task, search)), None
+
+
+class SQLiteFTSSearchBackend:
+    """
+    FTS5 trigram: подстрока как фраза из триграмм, ранжирование bm25 (заголовок весит больше описания)
+    """
+    name = "sqlite-fts5"
+    fts = table("tasks_fts", column("rowid"))
+
+    def apply(self, query: Query, search: str) -> Tuple[Query, Optional[object]]:
+        match = '"' + search.replace('"', '""') + '"'
+        query = query.join(self.fts, self.fts.c.rowid == Task.id).filter(
+            text("tasks_fts MATCH :fts_query").bindparams(fts_query=match)
+        )
+        # bm25() is lower-is-better; negate so "desc" means most relevant first
+        rank = -func.bm25(literal_column("tasks_fts"), 10.0, 1.0)
+        return query, rank
+
+
+class PostgresFTSSearchBackend:
+    """
+    pg_trgm/GIN: тот же ILIKE, но по индексу; ранжирование similarity (заголовок весит больше)
+    """
+    name = "postgres-trgm"
+
+    def apply(self, query: Query, search: str) -> Tuple[Query, Optional[object]]:
+        rank = func.similarity(Task.title, search) * 10 + func.similarity(func.coalesce(Task.description, ""), search)
+        return query.filter(substring_filter(Task, search)), rank
+
+
+_like_backend = LikeSearchBackend()
+_sqlite_backend = SQLiteFTSSearchBackend()
+_postgres_backend = PostgresFTSSearchBackend()
+
+
+def _fts_installed(bind: Engine) -> bool:
+    if bind in _fts_ready_binds:
+        return True
+    if bind.dialect.name == "sqlite":
+        with bind.connect() as conn:
+            ddl = conn.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'"
+            ).scalar()
+        # A word-tokenized table from before migration 0009 cannot answer substring queries
+        installed = ddl is not None and "trigram" in ddl
+    elif bind.dialect.name == "postgresql":
+        with bind.connect() as conn:
+            installed = conn.exec_driver_sql(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_tasks_search_trgm'"
+            ).first() is not None
+    else:
+        installed = False
+    # Only positive results are cached so a later migration is picked up
+    if installed:
+        _fts_ready_binds.add(bind)
+    return installed
+
+
+def get_search_backend(db: Session, search: str):
+    """
+    Выбрать backend поиска: SEARCH_BACKEND=auto использует триграммный индекс,
+    если он установлен для текущей БД, иначе ILIKE (результаты одинаковы)
+    """
+    # Trigram indexes cannot answer strings shorter than one trigram
+    if SEARCH_BACKEND == "like" or len(search) < TRIGRAM_MIN_LENGTH:
+        return _like_backend
+    bind = db.get_bind()
+    if not _fts_installed(bind):
+        return _like_backend
+    if bind.dialect.name == "sqlite":
+        return _sqlite_backend
+    return _postgres_backend
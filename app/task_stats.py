@@ -0,0 +1,321 @@
+"""
+Инкрементально поддерживаемые счётчики задач (user_task_stats / user_task_daily_stats).
+
+Каждый путь записи в crud.py и app/tasks.py вызывает apply_task_delta в той же
+транзакции, что и изменение задач, поэтому get_task_statistics читает готовые
+числа вместо агрегации по всей таблице tasks.
+
+Проверка и исправление расхождений:
+
+    python -m app.task_stats verify            # показать расхождения
+    python -m app.task_stats verify --repair   # пересчитать пользователей с расхождениями
+    python -m app.task_stats rebuild           # пересчитать всех
+"""
+import argparse
+import sys
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .models import Task, UserTaskDailyStats, UserTaskStats
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return date.fromisoformat(value[:10])
+    return value
+
+
+def task_rows_delta(rows: Iterable[Tuple[Any, bool]], sign: int = 1) -> Tuple[int, int, Dict[date, int]]:
+    """
+    Посчитать изменение счётчиков для набора задач (created_at, completed);
+    sign=-1 для удаляемых задач
+    """
+    total = 0
+    completed = 0
+    days = Counter()
+    for created_at, is_completed in rows:
+        total += sign
+        if is_completed:
+            completed += sign
+        if created_at is not None:
+            days[_as_date(created_at)] += sign
+    return total, completed, dict(days)
+
+
+def _upsert_daily(db: Session, user_id: int, day: date, delta: int) -> None:
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(UserTaskDailyStats).values(user_id=user_id, day=day, created_count=delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UserTaskDailyStats.user_id, UserTaskDailyStats.day],
+            set_={"created_count": UserTaskDailyStats.created_count + delta}
+        )
+        db.execute(stmt)
+        return
+    updated = db.execute(
+        update(UserTaskDailyStats)
+        .where(UserTaskDailyStats.user_id == user_id, UserTaskDailyStats.day == day)
+        .values(created_count=UserTaskDailyStats.created_count + delta)
+    ).rowcount
+    if not updated:
+        db.add(UserTaskDailyStats(user_id=user_id, day=day, created_count=delta))
+        db.flush()
+
+
+def apply_task_delta(
+    db: Session,
+    user_id: int,
+    total: int = 0,
+    completed: int = 0,
+    created_days: Optional[Dict[date, int]] = None
+) -> None:
+    """
+    Применить изменение счётчиков пользователя (без commit — это делает вызывающий код).
+    Изменения задач к этому моменту должны быть уже отправлены в БД (flush)
+    """
+    updated = db.execute(
+        update(UserTaskStats)
+        .where(UserTaskStats.user_id == user_id)
+        .values(
+            total_tasks=UserTaskStats.total_tasks + total,
+            completed_tasks=UserTaskStats.completed_tasks + completed,
+            version=UserTaskStats.version + 1
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        # Первая запись пользователя: пересчёт уже учитывает текущее изменение
+        fresh = compute_user_stats(db, user_id)
+        if _insert_stats(db, user_id, fresh):
+            _replace_daily(db, user_id, fresh["days"])
+            return
+        # A concurrent transaction created the row first: apply our change on top of it
+        apply_task_delta(db, user_id, total=total, completed=completed, created_days=created_days)
+        return
+    for day, delta in (created_days or {}).items():
+        if delta:
+            _upsert_daily(db, user_id, day, delta)
+
+
+def apply_task_rows(db: Session, user_id: int, rows: Iterable[Tuple[Any, bool]], sign: int = 1) -> None:
+    total, completed, days = task_rows_delta(rows, sign)
+    apply_task_delta(db, user_id, total=total, completed=completed, created_days=days)
+
+
+def compute_user_stats(db: Session, user_id: int) -> Dict[str, Any]:
+    """
+    Посчитать счётчики заново по таблице tasks
+    """
+    row = db.query(
+        func.count(Task.id).label("total"),
+        func.coalesce(func.sum(case((Task.completed == True, 1), else_=0)), 0).label("completed")
+    ).filter(Task.owner_id == user_id).one()
+    created_day = func.date(Task.created_at)
+    days = db.query(created_day, func.count(Task.id)).filter(
+        and_(Task.owner_id == user_id, Task.created_at.isnot(None))
+    ).group_by(created_day).all()
+    return {
+        "total_tasks": row.total,
+        "completed_tasks": row.completed,
+        "days": {_as_date(day): count for day, count in days}
+    }
+
+
+def _insert_stats(db: Session, user_id: int, fresh: Dict[str, Any]) -> bool:
+    """
+    Создать строку счётчиков; False, если она уже есть (например, её только что
+    создала параллельная транзакция)
+    """
+    values = {
+        "user_id": user_id,
+        "total_tasks": fresh["total_tasks"],
+        "completed_tasks": fresh["completed_tasks"],
+        "version": 1,
+    }
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+        stmt = insert(UserTaskStats).values(**values).on_conflict_do_nothing(index_elements=[UserTaskStats.user_id])
+        return bool(db.execute(stmt).rowcount)
+    if _load_stats(db, user_id) is not None:
+        return False
+    db.add(UserTaskStats(**values))
+    db.flush()
+    return True
+
+
+def _replace_daily(db: Session, user_id: int, days: Dict[date, int]) -> None:
+    db.query(UserTaskDailyStats).filter(UserTaskDailyStats.user_id == user_id).delete(synchronize_session=False)
+    db.add_all([
+        UserTaskDailyStats(user_id=user_id, day=day, created_count=count)
+        for day, count in days.items()
+    ])
+    db.flush()
+
+
+def rebuild_user_stats(db: Session, user_id: int) -> None:
+    """
+    Пересчитать счётчики пользователя (без commit)
+    """
+    fresh = compute_user_stats(db, user_id)
+    if not _insert_stats(db, user_id, fresh):
+        db.execute(
+            update(UserTaskStats)
+            .where(UserTaskStats.user_id == user_id)
+            .values(
+                total_tasks=fresh["total_tasks"],
+                completed_tasks=fresh["completed_tasks"],
+                version=UserTaskStats.version + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+    _replace_daily(db, user_id, fresh["days"])
+
+
+def _load_stats(db: Session, user_id: int) -> Optional[UserTaskStats]:
+    # Counters are changed with bulk UPDATEs, so never trust the identity map
+    return db.query(UserTaskStats).filter(UserTaskStats.user_id == user_id).populate_existing().first()
+
+
+def get_user_stats(db: Session, user_id: int, days: int = 7, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Прочитать счётчики и число задач, созданных за последние days суток (скользящее окно UTC).
+    Только чтение: без строки счётчиков всё считается по tasks, но ничего не записывается
+    """
+    now = now or datetime.utcnow()
+    since = now - timedelta(days=days)
+    stats = _load_stats(db, user_id)
+    if stats is None:
+        fresh = compute_user_stats(db, user_id)
+        totals = (fresh["total_tasks"], fresh["completed_tasks"], 0)
+        full_days = sorted((day, count) for day, count in fresh["days"].items() if day > since.date())
+    else:
+        totals = (stats.total_tasks, stats.completed_tasks, stats.version)
+        full_days = db.query(UserTaskDailyStats.day, UserTaskDailyStats.created_count).filter(
+            and_(UserTaskDailyStats.user_id == user_id, UserTaskDailyStats.day > since.date())
+        ).order_by(UserTaskDailyStats.day).all()
+    # The window opens mid-day, so that day's bucket is too wide: count its tail on the (owner_id, created_at) index
+    first_day_end = datetime.combine(since.date() + timedelta(days=1), datetime.min.time())
+    first_day = db.query(func.count(Task.id)).filter(
+        Task.owner_id == user_id, Task.created_at >= since, Task.created_at < first_day_end
+    ).scalar()
+    buckets = [(since.date(), first_day)] + [(_as_date(day), count) for day, count in full_days]
+    return {
+        "total": totals[0],
+        "completed": totals[1],
+        "version": totals[2],
+        "recent_week": sum(count for _, count in buckets),
+        "tasks_by_day": [{"date": str(day), "count": count} for day, count in buckets if count]
+    }
+
+
+def get_stats_version(db: Session, user_id: int) -> int:
+    version = db.query(UserTaskStats.version).filter(UserTaskStats.user_id == user_id).scalar()
+    return version or 0
+
+
+def find_drift(db: Session, user_id: int) -> List[str]:
+    """
+    Сравнить счётчики с таблицей tasks; вернуть список расхождений
+    """
+    fresh = compute_user_stats(db, user_id)
+    stats = _load_stats(db, user_id)
+    if stats is None:
+        return ["missing stats row"] if fresh["total_tasks"] else []
+    problems = []
+    if stats.total_tasks != fresh["total_tasks"]:
+        problems.append(f"total_tasks {stats.total_tasks} != {fresh['total_tasks']}")
+    if stats.completed_tasks != fresh["completed_tasks"]:
+        problems.append(f"completed_tasks {stats.completed_tasks} != {fresh['completed_tasks']}")
+    stored_days = {
+        _as_date(day): count
+        for day, count in db.query(UserTaskDailyStats.day, UserTaskDailyStats.created_count)
+        .filter(UserTaskDailyStats.user_id == user_id)
+        if count
+    }
+    if stored_days != fresh["days"]:
+        changed = sorted(set(stored_days.items()) ^ set(fresh["days"].items()))
+        problems.append(f"daily buckets differ on {len({day for day, _ in changed})} day(s)")
+    return problems
+
+
+BACKFILL_SQL = [
+    "DELETE FROM user_task_daily_stats",
+    "DELETE FROM user_task_stats",
+    """
+    INSERT INTO user_task_stats (user_id, total_tasks, completed_tasks, version, updated_at)
+    SELECT owner_id, COUNT(id), SUM(CASE WHEN completed THEN 1 ELSE 0 END), 1, CURRENT_TIMESTAMP
+    FROM tasks WHERE owner_id IS NOT NULL GROUP BY owner_id
+    """,
+    """
+    INSERT INTO user_task_daily_stats (user_id, day, created_count)
+    SELECT owner_id, DATE(created_at), COUNT(id)
+    FROM tasks WHERE owner_id IS NOT NULL AND created_at IS NOT NULL
+    GROUP BY owner_id, DATE(created_at)
+    """,
+]
+
+
+def backfill_all(connection) -> None:
+    """
+    Пересчитать счётчики всех пользователей одним набором INSERT ... SELECT
+    (заполнение данных для бенчмарков; миграция 0004 хранит свою копию SQL)
+    """
+    for statement in BACKFILL_SQL:
+        connection.exec_driver_sql(statement)
+
+
+def _user_ids(db: Session, user_id: Optional[int]) -> List[int]:
+    if user_id is not None:
+        return [user_id]
+    owners = {row[0] for row in db.query(Task.owner_id).distinct() if row[0] is not None}
+    owners |= {row[0] for row in db.query(UserTaskStats.user_id)}
+    return sorted(owners)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Verify or rebuild per-user task counters")
+    parser.add_argument("command", choices=["verify", "rebuild"])
+    parser.add_argument("--user-id", type=int, help="Only check this user")
+    parser.add_argument("--repair", action="store_true", help="Rebuild users with drift (verify only)")
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    drifted = 0
+    try:
+        for user_id in _user_ids(db, args.user_id):
+            if args.command == "rebuild":
+                rebuild_user_stats(db, user_id)
+                db.commit()
+                print(f"user {user_id}: rebuilt")
+                continue
+            problems = find_drift(db, user_id)
+            if not problems:
+                continue
+            drifted += 1
+            print(f"user {user_id}: " + "; ".join(problems))
+            if args.repair:
+                rebuild_user_stats(db, user_id)
+                db.commit()
+                print(f"user {user_id}: repaired")
+    finally:
+        db.close()
+
+    if args.command == "verify":
+        print(f"{drifted} user(s) with drift")
+        return 1 if drifted and not args.repair else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+"""
+Статусы Celery-задач пачкой и реестр владельцев задач.
+
+При постановке задачи из API её владелец записывается рядом с результатом в
+Redis result backend (taskowner:v1:{task_id}, живёт столько же, сколько
+результат). Пакетный запрос статусов читает владельцев и метаданные
+результатов одним конвейером из двух MGET и отдаёт только задачи
+вызывающего пользователя.
+
+Если result backend не Redis или Redis недоступен, владельцы берутся из
+ограниченного реестра внутри процесса, а статусы — по одному через AsyncResult.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis
+
+from .celery_app import celery_app
+from .config import TASK_STATUS_REDIS_RETRY_SECONDS
+from .progress import format_task_status
+
+logger = logging.getLogger(__name__)
+
+OWNER_KEY_PREFIX = "taskowner:v1"
+LOCAL_MAX_OWNERS = 10000
+
+_local_owners: "OrderedDict[str, int]" = OrderedDict()
+_local_lock = threading.Lock()
+_redis_down_until = 0.0
+
+
+def _owner_key(task_id: str) -> str:
+    return f"{OWNER_KEY_PREFIX}:{task_id}"
+
+
+def _result_ttl() -> int:
+    expires = celery_app.conf.result_expires
+    if isinstance(expires, timedelta):
+        return int(expires.total_seconds())
+    return int(expires or 86400)
+
+
+def _backend_client():
+    """Redis-клиент result backend'а или None (другой backend / Redis недавно недоступен)."""
+    backend = celery_app.backend
+    if not hasattr(backend, "get_key_for_task") or time.monotonic() < _redis_down_until:
+        return None
+    return getattr(backend, "client", None)
+
+
+def _mark_redis_down(exc: Exception) -> None:
+    global _redis_down_until
+    if time.monotonic() >= _redis_down_until:
+        logger.warning(
+            "Result backend Redis unavailable (%s); task owners kept in-process for %ss",
+            exc, TASK_STATUS_REDIS_RETRY_SECONDS
+        )
+    _redis_down_until = time.monotonic() + TASK_STATUS_REDIS_RETRY_SECONDS
+
+
+def register_task(task_id: str, owner_id: int) -> None:
+    """
+    Запомнить владельца поставленной задачи
+    """
+    with _local_lock:
+        _local_owners[task_id] = owner_id
+        _local_owners.move_to_end(task_id)
+        while len(_local_owners) > LOCAL_MAX_OWNERS:
+            _local_owners.popitem(last=False)
+    client = _backend_client()
+    if client is not None:
+        try:
+            client.set(_owner_key(task_id), owner_id, ex=_result_ttl())
+        except redis.RedisError as exc:
+            _mark_redis_down(exc)
+
+
+def _local_owner(task_id: str) -> Optional[int]:
+    with _local_lock:
+        return _local_owners.get(task_id)
+
+
+def get_task_owner(task_id: str) -> Optional[int]:
+    """
+    Владелец задачи из реестра (None — задачу ставил не API или запись истекла)
+    """
+    client = _backend_client()
+    if client is not None:
+        try:
+            owner = client.get(_owner_key(task_id))
+        except redis.RedisError as exc:
+            _mark_redis_down(exc)
+        else:
+            if owner is not None:
+                return int(owner)
+    return _local_owner(task_id)
+
+
+def _single_status(task_id: str) -> Dict[str, Any]:
+    task_result = celery_app.AsyncResult(task_id)
+    return format_task_status(task_id, task_result.state, task_result.info)
+
+
+def get_task_statuses(task_ids: List[str], owner_id: int) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Статусы задач владельца в порядке запроса и список id, не найденных у него
+    (чужие и неизвестные не различаются)
+    """
+    task_ids = list(OrderedDict.fromkeys(task_ids))
+    client = _backend_client()
+    if client is not None:
+        backend = celery_app.backend
+        try:
+            # Owners and result metadata in one round trip
+            pipe = client.pipeline(transaction=False)
+            pipe.mget([_owner_key(task_id) for task_id in task_ids])
+            pipe.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+            owners, metas = pipe.execute()
+        except redis.RedisError as exc:
+            _mark_redis_down(exc)
+        else:
+            statuses, not_found = [], []
+            for task_id, owner, meta in zip(task_ids, owners, metas):
+                owner = int(owner) if owner is not None else _local_owner(task_id)
+                if owner != owner_id:
+                    not_found.append(task_id)
+                    continue
+                if meta is None:
+                    # Celery reports unknown and queued tasks alike as PENDING
+                    statuses.append(format_task_status(task_id, "PENDING", None))
+                    continue
+                meta = backend.decode_result(meta)
+                statuses.append(format_task_status(task_id, meta["status"], meta["result"]))
+            return statuses, not_found
+
+    statuses, not_found = [], []
+    for task_id in task_ids:
+        if _local_owner(task_id) != owner_id:
+            not_found.append(task_id)
+            continue
+        try:
+            statuses.append(_single_status(task_id))
+        except Exception:
+            statuses.append(format_task_status(task_id, "PENDING", None))
+    return statuses, not_found
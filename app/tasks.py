@@ -1,130 +1,234 @@
 from celery import current_task
+from celery.exceptions import Retry
 from .celery_app import celery_app
 from .database import SessionLocal
-from .models import Task, User
-from datetime import datetime, timedelta
+from .models import Task, User, ArchivedTask
+from .bulk_ingest import ingest_tasks, iter_import_file, count_import_rows
+from .exporters import get_exporter, iter_export_rows, gzip_stream
+from .artifacts import artifact_path, write_artifact, set_pending_job, prune_expired
+from .config import EXPORT_BATCH_SIZE
+from .retention import run_retention
+from .notifications import enqueue_notification, flush_due, get_transport
+from sqlalchemy import func
+from datetime import datetime
+import os
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
 @celery_app.task(bind=True)
-def send_email_notification(self, user_id: int, task_title: str, notification_type: str):
+def send_email_notification(self, user_id: int, task_title: str, notification_type: str, task_id: int = None):
     """
-    Асинхронная отправка email уведомлений
+    Поставить email уведомление в очередь дайджеста (идемпотентно по пользователю, задаче и типу)
     """
+    db = SessionLocal()
     try:
-        # Simulate email sending delay
-        for i in range(5):
-            time.sleep(1)
-            self.update_state(
-                state='PROGRESS',
-                meta={
-                    'current': i + 1, 
-                    'total': 5, 
-                    'status': f'Sending email notification... {i+1}/5'
-                }
-            )
-        
-        # Here you would integrate with actual email service (SendGrid, AWS SES, etc.)
-        logger.info(f"Email notification sent to user {user_id} for task '{task_title}'")
-        
-        return {
-            'current': 5,
-            'total': 5,
-            'status': f'Email notification sent successfully for task: {task_title}',
-            'result': f'Notification sent to user {user_id}'
-        }
+        notification, created = enqueue_notification(db, user_id, notification_type, task_title, task_id)
     except Exception as exc:
-        logger.error(f"Email notification failed: {str(exc)}")
+        logger.error(f"Email notification enqueue failed: {str(exc)}")
         raise self.retry(exc=exc, countdown=60, max_retries=3)
+    finally:
+        db.close()
+    
+    return {
+        'current': 1,
+        'total': 1,
+        'status': f'Notification {"queued for digest" if created else "already queued"} for task: {task_title}',
+        'result': {'notification_id': notification.id, 'duplicate': not created}
+    }
+
+@celery_app.task(bind=True)
+def flush_notification_digests(self):
+    """
+    Отправить дайджесты уведомлений пользователям, у которых истекло окно накопления
+    """
+    progress = self.progress()
+    
+    def report_progress(sent, total):
+        progress.update(sent, total=total, status=f'Sent {sent}/{total} notification digests')
+    
+    worker = self.request.hostname or None
+    db = SessionLocal()
+    try:
+        report = flush_due(db, get_transport(), worker=worker, on_progress=report_progress)
+    except Exception as exc:
+        # Delivered digests are already marked sent: the retry only picks up the rest
+        logger.error(f"Notification flush failed: {str(exc)}")
+        raise self.retry(exc=exc, countdown=30, max_retries=3)
+    finally:
+        progress.flush()
+        db.close()
+    
+    if report['messages']:
+        logger.info(
+            f"Sent {report['messages']} notification digests ({report['notifications']} notifications) "
+            f"in {report['seconds']}s: {report['messages_per_second']} messages/s on {report['worker']}"
+        )
+    return {
+        'current': report['messages'],
+        'total': report['users'],
+        'status': 'Notification digests sent',
+        'report': report,
+        'progress_updates': progress.stats()
+    }
+
+def _ingest_with_progress(task, user_id: int, tasks_data, total_tasks: int):
+    """
+    Вставка чанками с прогрессом PROGRESS по чанкам; повтор только если ничего не закоммичено
+    """
+    committed = {'inserted': 0}
+    progress = task.progress(total=total_tasks)
+    
+    def report_progress(report):
+        committed['inserted'] = report['inserted']
+        progress.update(
+            report['processed'],
+            status=f'Inserted {report["inserted"]}/{total_tasks} tasks '
+                   f'(chunk {len(report["chunks"])}, {report["failed"] + report["rejected"]} failed)'
+        )
+    
+    db = SessionLocal()
+    try:
+        report = ingest_tasks(db, user_id, tasks_data, total=total_tasks, on_progress=report_progress)
+        progress.flush()
+        report['progress_updates'] = progress.stats()
+        return report
+    except Exception as exc:
+        logger.error(f"Bulk task processing failed: {str(exc)}")
+        # Chunk errors are reported, not raised; retry only if nothing was committed yet,
+        # otherwise a retry would insert the committed chunks twice
+        if committed['inserted']:
+            raise
+        raise task.retry(exc=exc, countdown=60, max_retries=3)
+    finally:
+        progress.flush()
+        db.close()
+
+def _bulk_result(report, total_tasks: int, status: str):
+    return {
+        'current': total_tasks,
+        'total': total_tasks,
+        'status': status,
+        'result': f'Successfully processed {report["inserted"]} tasks',
+        'inserted': report['inserted'],
+        'rejected': report['rejected'],
+        'failed': report['failed'],
+        'chunks': [chunk for chunk in report['chunks'] if chunk.get('error') or chunk['rejected']],
+        'chunk_count': len(report['chunks']),
+        'tasks': report['tasks'],
+        'progress_updates': report['progress_updates']
+    }
 
 @celery_app.task(bind=True)
 def process_bulk_tasks(self, user_id: int, tasks_data: list):
     """
-    Массовая обработка задач
+    Массовая обработка задач: вставка чанками, прогресс по чанкам
     """
+    total_tasks = len(tasks_data)
+    report = _ingest_with_progress(self, user_id, tasks_data, total_tasks)
+    return _bulk_result(report, total_tasks, 'Bulk task processing completed')
+
+@celery_app.task(bind=True)
+def import_tasks_from_file(self, user_id: int, path: str, file_format: str):
+    """
+    Импорт задач из spool-файла NDJSON/CSV (в сообщении брокера только путь)
+    """
+    total_tasks = count_import_rows(path, file_format)
     try:
-        db = SessionLocal()
-        processed_tasks = []
-        total_tasks = len(tasks_data)
+        report = _ingest_with_progress(self, user_id, iter_import_file(path, file_format), total_tasks)
+    except Retry:
+        # Keep the file for the retry
+        raise
+    except Exception:
+        os.unlink(path)
+        raise
+    os.unlink(path)
+    return _bulk_result(report, total_tasks, 'Task import completed')
+
+@celery_app.task(bind=True)
+def export_tasks_to_artifact(
+    self, user_id: int, export_format: str, completed, artifact_id: str, include_archived: bool = False
+):
+    """
+    Фоновый экспорт задач в сжатый артефакт (прогресс в формате task-status)
+    """
+    path = artifact_path(user_id, artifact_id, export_format)
+    db = SessionLocal()
+    try:
+        total_rows = 0
+        for model in (Task, ArchivedTask) if include_archived else (Task,):
+            query = db.query(func.count(model.id)).filter(model.owner_id == user_id)
+            if completed is not None:
+                query = query.filter(model.completed == completed)
+            total_rows += query.scalar()
         
-        for i, task_data in enumerate(tasks_data):
-            # Update progress
-            self.update_state(
-                state='PROGRESS',
-                meta={
-                    'current': i + 1,
-                    'total': total_tasks,
-                    'status': f'Processing task {i+1}/{total_tasks}: {task_data.get("title", "Unnamed")}'
-                }
-            )
+        if not os.path.exists(path):
+            exported = {'rows': 0}
             
-            # Create task
-            new_task = Task(
-                title=task_data['title'],
-                description=task_data.get('description', ''),
-                owner_id=user_id
-            )
-            db.add(new_task)
-            db.commit()
-            db.refresh(new_task)
+            def counted_rows():
+                with self.progress(total=total_rows) as progress:
+                    for row in iter_export_rows(db.get_bind(), user_id, completed, include_archived=include_archived):
+                        exported['rows'] += 1
+                        if exported['rows'] % EXPORT_BATCH_SIZE == 0:
+                            progress.update(exported['rows'], status=f'Exported {exported["rows"]}/{total_rows} tasks')
+                        yield row
             
-            processed_tasks.append({
-                'id': new_task.id,
-                'title': new_task.title,
-                'created_at': new_task.created_at.isoformat()
-            })
-            
-            # Simulate processing time
-            time.sleep(0.5)
-        
+            write_artifact(path, gzip_stream(get_exporter(export_format, include_archived)(counted_rows())))
+            prune_expired(user_id)
+    finally:
         db.close()
-        
-        return {
-            'current': total_tasks,
-            'total': total_tasks,
-            'status': 'Bulk task processing completed',
-            'result': f'Successfully processed {len(processed_tasks)} tasks',
-            'tasks': processed_tasks
+        set_pending_job(user_id, artifact_id, None)
+    
+    return {
+        'current': total_rows,
+        'total': total_rows,
+        'status': 'Export ready',
+        'result': {
+            'artifact_id': artifact_id,
+            'format': export_format,
+            'size': os.path.getsize(path),
+            'download_url': f'/api/advanced-tasks/export/artifacts/{artifact_id}'
         }
-        
-    except Exception as exc:
-        db.close()
-        logger.error(f"Bulk task processing failed: {str(exc)}")
-        raise self.retry(exc=exc, countdown=60, max_retries=3)
+    }
 
-@celery_app.task
-def cleanup_old_tasks():
+@celery_app.task(bind=True)
+def cleanup_old_tasks(self, dry_run: bool = False):
     """
-    Очистка старых завершенных задач (старше 30 дней)
+    Перенос в архив (или удаление) завершенных задач старше срока хранения
+    (пачками по id, с возобновлением)
     """
+    progress = self.progress()
+    
+    def report_progress(report):
+        action = "Archived" if report['mode'] == 'archive' else "Deleted"
+        progress.update(
+            report['last_id'],
+            total=report['max_id'],
+            status=f'{"Would remove" if dry_run else action} {report["deleted"]} tasks '
+                   f'(ids up to {report["last_id"]}/{report["max_id"]})'
+        )
+    
+    db = SessionLocal()
     try:
-        db = SessionLocal()
-        cutoff_date = datetime.utcnow() - timedelta(days=30)
-        
-        # Find old completed tasks
-        old_tasks = db.query(Task).filter(
-            Task.completed == True,
-            Task.updated_at < cutoff_date
-        ).all()
-        
-        deleted_count = len(old_tasks)
-        
-        # Delete old tasks
-        for task in old_tasks:
-            db.delete(task)
-        
-        db.commit()
-        db.close()
-        
-        logger.info(f"Cleaned up {deleted_count} old completed tasks")
-        return f"Successfully cleaned up {deleted_count} old tasks"
-        
+        report = run_retention(db, dry_run=dry_run, on_progress=report_progress)
     except Exception as exc:
-        db.close()
         logger.error(f"Cleanup task failed: {str(exc)}")
-        raise exc
+        raise
+    finally:
+        progress.flush()
+        db.close()
+    
+    verb = "would clean up" if dry_run else ("archived" if report['mode'] == 'archive' else "cleaned up")
+    logger.info(f"Retention run {verb} {report['deleted']} old completed tasks")
+    return {
+        'current': report['max_id'],
+        'total': report['max_id'],
+        'status': 'Cleanup completed',
+        'result': f'Successfully {verb} {report["deleted"]} old tasks',
+        'report': report,
+        'progress_updates': progress.stats()
+    }
 
 @celery_app.task(bind=True)
 def generate_task_report(self, user_id: int):
@@ -133,12 +237,10 @@ def generate_task_report(self, user_id: int):
     """
     try:
         db = SessionLocal()
+        progress = self.progress(total=4)
         
         # Update progress
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 1, 'total': 4, 'status': 'Fetching user tasks...'}
-        )
+        progress.update(1, status='Fetching user tasks...')
         
         user = db.query(User).filter(User.id == user_id).first()
         if not user:
@@ -147,10 +249,7 @@ def generate_task_report(self, user_id: int):
         tasks = db.query(Task).filter(Task.owner_id == user_id).all()
         
         # Update progress
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 2, 'total': 4, 'status': 'Analyzing task data...'}
-        )
+        progress.update(2, status='Analyzing task data...')
         
         time.sleep(1)  # Simulate processing
         
@@ -160,10 +259,7 @@ def generate_task_report(self, user_id: int):
         pending_tasks = total_tasks - completed_tasks
         
         # Update progress
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 3, 'total': 4, 'status': 'Generating report...'}
-        )
+        progress.update(3, status='Generating report...')
         
         time.sleep(1)  # Simulate report generation
         
@@ -194,10 +290,7 @@ def generate_task_report(self, user_id: int):
         db.close()
         
         # Update progress - completed
-        self.update_state(
-            state='PROGRESS',
-            meta={'current': 4, 'total': 4, 'status': 'Report generated successfully'}
-        )
+        progress.update(4, status='Report generated successfully')
         
         return {
             'current': 4,
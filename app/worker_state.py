@@ -0,0 +1,107 @@
+"""
+Снимок состояния Celery worker'ов для /active-tasks и /worker-stats.
+
+Фоновый поток раз в WORKER_STATE_INTERVAL_SECONDS делает inspect (active,
+stats, registered) и сохраняет результат в памяти процесса. Эндпоинты
+отдают последний снимок без обращения к брокеру, с его возрастом и флагом
+stale. Ошибка опроса не стирает прошлый снимок, а записывается рядом с ним.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from .config import WORKER_STATE_INSPECT_TIMEOUT, WORKER_STATE_INTERVAL_SECONDS, WORKER_STATE_STALE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def _celery_inspect(timeout: float):
+    from .celery_app import celery_app
+    return celery_app.control.inspect(timeout=timeout)
+
+
+class WorkerStateCollector:
+    def __init__(
+        self,
+        interval: float = WORKER_STATE_INTERVAL_SECONDS,
+        stale_after: float = WORKER_STATE_STALE_SECONDS,
+        inspect_timeout: float = WORKER_STATE_INSPECT_TIMEOUT,
+        inspect_factory: Callable[[float], Any] = _celery_inspect,
+    ):
+        self.interval = interval
+        self.stale_after = stale_after
+        self.inspect_timeout = inspect_timeout
+        self.inspect_factory = inspect_factory
+        self.metrics = {"collections": 0, "errors": 0, "last_duration_seconds": 0.0}
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._collected_at: Optional[float] = None
+        self._last_error: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def collect_once(self) -> None:
+        """
+        Опросить worker'ов один раз и обновить снимок
+        """
+        started = time.monotonic()
+        try:
+            inspect = self.inspect_factory(self.inspect_timeout)
+            snapshot = {
+                "active": inspect.active() or {},
+                "stats": inspect.stats() or {},
+                "registered": inspect.registered() or {},
+            }
+        except Exception as exc:
+            self.metrics["errors"] += 1
+            logger.warning("Worker inspection failed: %s", exc)
+            with self._lock:
+                self._last_error = str(exc)
+            return
+        finally:
+            self.metrics["last_duration_seconds"] = round(time.monotonic() - started, 3)
+        self.metrics["collections"] += 1
+        with self._lock:
+            self._snapshot = snapshot
+            self._collected_at = time.time()
+            self._last_error = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.collect_once()
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="worker-state-collector", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=self.inspect_timeout * 3 + 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Последний снимок и его свежесть (поток сбора запускается при первом обращении)
+        """
+        self.start()
+        with self._lock:
+            snapshot, collected_at, error = self._snapshot, self._collected_at, self._last_error
+        age = round(time.time() - collected_at, 3) if collected_at is not None else None
+        return {
+            "workers": snapshot,
+            "collected_at": datetime.utcfromtimestamp(collected_at).isoformat() if collected_at else None,
+            "age_seconds": age,
+            "stale": age is None or age > self.stale_after,
+            "error": error,
+        }
+
+
+worker_state = WorkerStateCollector()
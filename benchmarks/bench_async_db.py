@@ -0,0 +1,119 @@
+"""
+Пропускная способность /api/tasks в синхронном и асинхронном режимах БД.
+
+    python -m benchmarks.bench_async_db --requests 2000 --concurrency 32
+
+Оба варианта роутера (routers/tasks.py и routers/tasks_async.py) поднимаются
+в процессе поверх одной заполненной SQLite-базы и нагружаются через httpx
+с заданным числом одновременных запросов; доля записей задаётся --write-ratio.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import create_access_token, user_cache
+from app.database import get_async_db, get_db
+from app.db_pool import PoolMetrics, engine_options, install_sqlite_pragmas, pool_stats
+from app.migrations import upgrade_database
+from app.routers import tasks, tasks_async
+
+from .bench_indexes import summarize
+from .seed import seed_database
+
+
+def build_app(router) -> FastAPI:
+    bench_app = FastAPI()
+    bench_app.include_router(router, prefix="/api")
+    return bench_app
+
+
+async def run_load(bench_app: FastAPI, tokens: List[str], total: int, concurrency: int, write_ratio: float) -> Dict[str, Any]:
+    write_every = int(1 / write_ratio) if write_ratio > 0 else 0
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: List[float] = []
+
+    async with httpx.AsyncClient(app=bench_app, base_url="http://bench") as http:
+        async def call(i: int) -> None:
+            headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+            async with semaphore:
+                start = time.perf_counter()
+                if write_every and i % write_every == 0:
+                    response = await http.post("/api/tasks/create_task", json={"title": f"bench {i}"}, headers=headers)
+                else:
+                    response = await http.get("/api/tasks/get_tasks", params={"limit": 20}, headers=headers)
+                samples.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+
+        started = time.perf_counter()
+        await asyncio.gather(*(call(i) for i in range(total)))
+        elapsed = time.perf_counter() - started
+
+    result = summarize(samples)
+    result["requests_per_second"] = round(total / elapsed, 1)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    parser.add_argument("--db", help="SQLite file to use (default: temporary file)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-async-"), "bench.db")
+    url = f"sqlite:///{path}"
+    engine = create_engine(url, **engine_options(url, PoolMetrics()))
+    install_sqlite_pragmas(engine)
+    upgrade_database(engine)
+    user_ids = seed_database(engine, users=args.users, tasks=args.tasks)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    async_url = f"sqlite+aiosqlite:///{path}"
+    async_engine = create_async_engine(async_url, **engine_options(async_url, PoolMetrics(), is_async=True))
+    install_sqlite_pragmas(async_engine.sync_engine)
+    AsyncSessionFactory = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+    def bench_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def bench_async_db():
+        async with AsyncSessionFactory() as db:
+            yield db
+
+    tokens = [create_access_token({"sub": f"bench_user_{n}", "uid": uid}) for n, uid in enumerate(user_ids)]
+
+    async def run_all() -> Dict[str, Any]:
+        results = {}
+        for mode, router in (("sync", tasks.router), ("async", tasks_async.router)):
+            bench_app = build_app(router)
+            bench_app.dependency_overrides = {get_db: bench_db, get_async_db: bench_async_db}
+            user_cache.clear()
+            await run_load(bench_app, tokens, min(200, args.requests), args.concurrency, 0)  # warm-up
+            results[mode] = await run_load(bench_app, tokens, args.requests, args.concurrency, args.write_ratio)
+            results[mode]["pool"] = pool_stats(engine if mode == "sync" else async_engine.sync_engine)
+        await async_engine.dispose()
+        return results
+
+    results = asyncio.run(run_all())
+    dataset = {"tasks": args.tasks, "users": args.users, "db": path, "concurrency": args.concurrency, "write_ratio": args.write_ratio}
+    print(json.dumps({"dataset": dataset, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
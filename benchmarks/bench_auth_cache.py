@@ -0,0 +1,97 @@
+"""
+Нагрузочный бенчмарк /api/tasks/get_tasks с кэшем пользователей и без него.
+
+    python -m benchmarks.bench_auth_cache --requests 2000 --concurrency 8
+
+Приложение запускается в процессе (TestClient) поверх заполненной SQLite-базы;
+для каждого режима выводятся RPS, p50/p99 и число SQL-запросов на запрос.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.auth import create_access_token, user_cache
+from app.database import get_db
+from app.main import app
+from app.migrations import upgrade_database
+
+from .bench_indexes import summarize
+from .seed import seed_database
+
+
+def run_load(client: TestClient, tokens: List[str], total: int, concurrency: int) -> Dict[str, Any]:
+    def call(i: int) -> float:
+        start = time.perf_counter()
+        response = client.get(
+            "/api/tasks/get_tasks",
+            params={"limit": 20},
+            headers={"Authorization": f"Bearer {tokens[i % len(tokens)]}"},
+        )
+        assert response.status_code == 200, response.text
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(call, range(total)))
+    elapsed = time.perf_counter() - started
+    result = summarize(samples)
+    result["requests_per_second"] = round(total / elapsed, 1)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--db", help="SQLite file to use (default: temporary file)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-auth-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    upgrade_database(engine)
+    user_ids = seed_database(engine, users=args.users, tasks=args.tasks)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    def bench_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = bench_db
+    tokens = [create_access_token({"sub": f"bench_user_{n}", "uid": uid}) for n, uid in enumerate(user_ids)]
+
+    queries = {"count": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def count_query(*_):
+        queries["count"] += 1
+
+    results = {}
+    # No context manager: startup migrations would target the configured DATABASE_URL
+    client = TestClient(app)
+    for mode, ttl in (("without_cache", 0), ("with_cache", 300)):
+        user_cache.clear()
+        user_cache.ttl = ttl
+        user_cache.enabled = ttl > 0
+        run_load(client, tokens, min(200, args.requests), args.concurrency)  # warm-up
+        queries["count"] = 0
+        results[mode] = run_load(client, tokens, args.requests, args.concurrency)
+        results[mode]["queries_per_request"] = round(queries["count"] / args.requests, 2)
+
+    print(json.dumps({"dataset": {"tasks": args.tasks, "users": args.users, "db": path}, **results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Бенчмарк составных индексов tasks: p50/p99 до и после.
+
+    python -m benchmarks.bench_indexes --tasks 1000000 --users 100
+
+Схема создаётся миграциями, затем индексы из 0002_task_query_indexes
+удаляются ("before") и создаются заново ("after") на тех же данных.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.crud import get_task_statistics, get_tasks_with_filters
+from app.migrations import upgrade_database
+from app.models import Task
+
+from .seed import seed_database
+
+COMPOSITE_INDEXES = [index for index in Task.__table__.indexes if len(index.columns) > 1]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {
+        "runs": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+    }
+
+
+def build_cases(user_ids: List[int]) -> Dict[str, Callable]:
+    return {
+        "get_tasks_with_filters[created_at desc]": lambda db, uid: get_tasks_with_filters(db, uid, limit=50),
+        "get_tasks_with_filters[completed=False, updated_at desc]": lambda db, uid: get_tasks_with_filters(
+            db, uid, completed=False, sort_by="updated_at", limit=50
+        ),
+        "get_tasks_with_filters[skip=5000]": lambda db, uid: get_tasks_with_filters(db, uid, skip=5000, limit=50),
+        "get_task_statistics": lambda db, uid: get_task_statistics(db, uid),
+    }
+
+
+def run_cases(Session, user_ids: List[int], runs: int, seed: int) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, case in build_cases(user_ids).items():
+        rng = random.Random(seed)
+        samples = []
+        db = Session()
+        try:
+            for _ in range(runs):
+                user_id = rng.choice(user_ids)
+                start = time.perf_counter()
+                case(db, user_id)
+                samples.append(time.perf_counter() - start)
+                db.expunge_all()
+        finally:
+            db.close()
+        results[name] = summarize(samples)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="SQLite file to use (default: temporary file)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-indexes-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    upgrade_database(engine)
+    user_ids = seed_database(engine, users=args.users, tasks=args.tasks, seed=args.seed)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    with engine.begin() as conn:
+        for index in COMPOSITE_INDEXES:
+            index.drop(bind=conn)
+        conn.execute(text("ANALYZE"))
+    before = run_cases(Session, user_ids, args.runs, args.seed)
+
+    with engine.begin() as conn:
+        for index in COMPOSITE_INDEXES:
+            index.create(bind=conn)
+        conn.execute(text("ANALYZE"))
+    after = run_cases(Session, user_ids, args.runs, args.seed)
+
+    print(json.dumps({
+        "dataset": {"tasks": args.tasks, "users": args.users, "db": path},
+        "before": before,
+        "after": after,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Бенчмарк статистики: число запросов и задержка /analytics до и после
+перехода на условную агрегацию.
+
+    python -m benchmarks.bench_statistics --tasks 1000000 --users 100
+
+"before" — прежние реализации (отдельный COUNT на каждую метрику),
+"after" — crud.get_task_analytics. Результаты обеих версий сверяются.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+from sqlalchemy import and_, create_engine, desc, event, func
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.crud import get_task_aggregates, get_task_analytics, get_task_statistics
+from app.migrations import upgrade_database
+from app.models import Task
+
+from .bench_indexes import summarize
+from .seed import seed_database
+
+
+def legacy_task_statistics(db: Session, user_id: int) -> Dict[str, Any]:
+    total_tasks = db.query(Task).filter(Task.owner_id == user_id).count()
+    completed_tasks = db.query(Task).filter(and_(Task.owner_id == user_id, Task.completed == True)).count()
+    week_ago = datetime.utcnow() - timedelta(days=7)
+    recent_tasks = db.query(Task).filter(and_(Task.owner_id == user_id, Task.created_at >= week_ago)).count()
+    tasks_by_day = db.query(
+        func.date(Task.created_at).label("date"),
+        func.count(Task.id).label("count")
+    ).filter(and_(Task.owner_id == user_id, Task.created_at >= week_ago)).group_by(func.date(Task.created_at)).all()
+    return {
+        "total_tasks": total_tasks,
+        "completed_tasks": completed_tasks,
+        "pending_tasks": total_tasks - completed_tasks,
+        "completion_rate": round((completed_tasks / total_tasks * 100), 2) if total_tasks > 0 else 0,
+        "recent_tasks_week": recent_tasks,
+        "tasks_by_day": [{"date": str(day.date), "count": day.count} for day in tasks_by_day],
+    }
+
+
+def legacy_activity_summary(db: Session, user_id: int, days: int) -> Dict[str, Any]:
+    start_date = datetime.utcnow() - timedelta(days=days)
+    total_tasks = db.query(Task).filter(Task.owner_id == user_id).count()
+    tasks_period = db.query(Task).filter(and_(Task.owner_id == user_id, Task.created_at >= start_date)).count()
+    completed_period = db.query(Task).filter(
+        and_(Task.owner_id == user_id, Task.completed == True, Task.updated_at >= start_date)
+    ).count()
+    longest_titles = db.query(Task).filter(Task.owner_id == user_id).order_by(desc(func.length(Task.title))).limit(5).all()
+    return {
+        "period_days": days,
+        "total_tasks_all_time": total_tasks,
+        "tasks_created_period": tasks_period,
+        "tasks_completed_period": completed_period,
+        "avg_tasks_per_day": round(tasks_period / days, 2),
+        "longest_task_titles": [{"title": t.title, "length": len(t.title)} for t in longest_titles],
+    }
+
+
+def legacy_task_analytics(db: Session, user_id: int) -> Dict[str, Any]:
+    return {
+        "basic_statistics": legacy_task_statistics(db, user_id),
+        "activity_last_7_days": legacy_activity_summary(db, user_id, 7),
+        "activity_last_30_days": legacy_activity_summary(db, user_id, 30),
+    }
+
+
+def _comparable(analytics: Dict[str, Any]) -> Dict[str, Any]:
+    # Ties in title length may come back in a different order
+    result = json.loads(json.dumps(analytics))
+    for key in ("activity_last_7_days", "activity_last_30_days"):
+        result[key]["longest_task_titles"] = sorted(t["length"] for t in result[key]["longest_task_titles"])
+    # basic_statistics now comes from calendar-day counters; checked separately
+    del result["basic_statistics"]
+    return result
+
+
+def measure(engine, Session, fn, user_ids, runs: int, seed: int) -> Dict[str, Any]:
+    queries = {"count": 0}
+
+    def count_query(*args):
+        queries["count"] += 1
+
+    event.listen(engine, "before_cursor_execute", count_query)
+    rng = random.Random(seed)
+    samples = []
+    db = Session()
+    try:
+        for _ in range(runs):
+            user_id = rng.choice(user_ids)
+            start = time.perf_counter()
+            fn(db, user_id)
+            samples.append(time.perf_counter() - start)
+            db.expunge_all()
+    finally:
+        db.close()
+        event.remove(engine, "before_cursor_execute", count_query)
+    result = summarize(samples)
+    result["queries_per_call"] = queries["count"] / runs
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="SQLite file to use (default: temporary file)")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="bench-statistics-"), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    upgrade_database(engine)
+    user_ids = seed_database(engine, users=args.users, tasks=args.tasks, seed=args.seed)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    with Session() as db:
+        for user_id in user_ids[:5]:
+            legacy = legacy_task_analytics(db, user_id)
+            assert _comparable(legacy) == _comparable(get_task_analytics(db, user_id)), user_id
+            single_pass = get_task_statistics(db, user_id, aggregates=get_task_aggregates(db, user_id, windows=()))
+            assert legacy["basic_statistics"] == single_pass, user_id
+
+    print(json.dumps({
+        "dataset": {"tasks": args.tasks, "users": args.users, "db": path},
+        "before": measure(engine, Session, legacy_task_analytics, user_ids, args.runs, args.seed),
+        "after": measure(engine, Session, get_task_analytics, user_ids, args.runs, args.seed),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+Микробенчмарки горячих функций app/crud.py с планами запросов.
+
+    python -m benchmarks.crud_micro --sizes 1000,100000,1000000 --users 100
+    python -m benchmarks.crud_micro --sizes 100000 --cases get_tasks_with_filters --fail-on-scan
+
+Для каждого размера набора данных создаётся своя SQLite-база (seed.py), и каждая
+функция вызывается напрямую, без HTTP, --runs раз для случайных пользователей.
+SQL, который функция выполняет, перехватывается событием движка и прогоняется
+через EXPLAIN QUERY PLAN с теми же параметрами. В отчёт попадают тайминги,
+число запросов и план каждого из них с флагами full_scan (SCAN таблицы без
+индекса) и temp_btree (сортировка или группировка не покрыта индексом).
+С --fail-on-scan полный просмотр таблицы в любом плане даёт код выхода 1.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.crud import (
+    bulk_update_tasks,
+    get_task_statistics,
+    get_tasks_by_date_range,
+    get_tasks_with_filters,
+    get_user_activity_summary,
+)
+from app.migrations import upgrade_database
+
+from .bench_indexes import summarize
+from .seed import WORDS, seed_database
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+SORT_FIELDS = ("created_at", "updated_at", "title", "completed", "relevance")
+BULK_UPDATE_IDS = 50
+SQL_PREVIEW = 300
+
+Case = Callable[[Session, Dict[str, Any], random.Random, int], Any]
+
+
+def build_cases() -> Dict[str, Case]:
+    """
+    Имя случая -> вызов crud-функции (db, пользователь, rng, номер прогона)
+    """
+    cases: Dict[str, Case] = {}
+    for sort_by in SORT_FIELDS:
+        # Relevance only ranks search matches; the other sorts list the user's page
+        search = (lambda rng: rng.choice(WORDS)) if sort_by == "relevance" else (lambda rng: None)
+        cases[f"get_tasks_with_filters[sort_by={sort_by}]"] = (
+            lambda db, user, rng, run, sort_by=sort_by, search=search: get_tasks_with_filters(
+                db, user["id"], search=search(rng), sort_by=sort_by, limit=50
+            )
+        )
+    cases["get_tasks_with_filters[completed=False, search]"] = lambda db, user, rng, run: get_tasks_with_filters(
+        db, user["id"], completed=False, search=rng.choice(WORDS), limit=50
+    )
+    cases["get_task_statistics"] = lambda db, user, rng, run: get_task_statistics(db, user["id"])
+    # Alternate the value so every run really flips rows and counters
+    cases["bulk_update_tasks[completed]"] = lambda db, user, rng, run: bulk_update_tasks(
+        db, user["task_ids"], user["id"], {"completed": run % 2 == 0}
+    )
+    cases["get_tasks_by_date_range[7 days]"] = lambda db, user, rng, run: get_tasks_by_date_range(
+        db, user["id"], datetime.utcnow() - timedelta(days=7), datetime.utcnow()
+    )
+    cases["get_user_activity_summary[30 days]"] = lambda db, user, rng, run: get_user_activity_summary(
+        db, user["id"], days=30
+    )
+    return cases
+
+
+class StatementRecorder:
+    """
+    Собирает уникальные SQL-запросы (с параметрами первого вызова) между start() и stop()
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.recording = False
+        self.count = 0
+        self.statements: Dict[str, Any] = {}
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.recording:
+            return
+        self.count += 1
+        if not executemany:
+            self.statements.setdefault(statement, parameters)
+
+    def start(self) -> None:
+        self.count = 0
+        self.statements = {}
+        self.recording = True
+
+    def stop(self) -> None:
+        self.recording = False
+
+    def close(self) -> None:
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+def explain(engine, statement: str, parameters) -> Dict[str, Any]:
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).all()
+    plan = [row[-1] for row in rows]
+    return {
+        "sql": " ".join(statement.split())[:SQL_PREVIEW],
+        "plan": plan,
+        # "SCAN t USING INDEX" walks an index; FTS virtual tables and the schema catalog are not table scans
+        "full_scan": any(
+            step.startswith("SCAN ") and " USING " not in step and "VIRTUAL TABLE" not in step
+            and not step.startswith("SCAN sqlite_") for step in plan
+        ),
+        "temp_btree": any("USE TEMP B-TREE" in step for step in plan),
+    }
+
+
+def load_users(engine, task_ids: int = BULK_UPDATE_IDS) -> List[Dict[str, Any]]:
+    with engine.connect() as conn:
+        user_ids = conn.execute(
+            text("SELECT id FROM users WHERE username LIKE 'bench_user_%' ORDER BY id")
+        ).scalars().all()
+        return [
+            {
+                "id": user_id,
+                "task_ids": conn.execute(
+                    text("SELECT id FROM tasks WHERE owner_id = :uid ORDER BY id LIMIT :n"),
+                    {"uid": user_id, "n": task_ids},
+                ).scalars().all(),
+            }
+            for user_id in user_ids
+        ]
+
+
+def prepare_database(path: str, size: int, users: int, skew: float, seed: int) -> Dict[str, Any]:
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    upgrade_database(engine)
+    started = time.perf_counter()
+    existing = load_users(engine)
+    if not existing:
+        seed_database(engine, users=users, tasks=size, skew=skew, seed=seed)
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        existing = load_users(engine)
+    return {"engine": engine, "users": existing, "seed_seconds": round(time.perf_counter() - started, 2)}
+
+
+def run_case(engine, Session, case: Case, users: List[Dict[str, Any]], runs: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    recorder = StatementRecorder(engine)
+    samples = []
+    db = Session()
+    try:
+        # First call pays one-off costs (statement compilation, search backend probe)
+        case(db, rng.choice(users), rng, 0)
+        db.expunge_all()
+        recorder.start()
+        case(db, rng.choice(users), rng, 1)
+        recorder.stop()
+        db.expunge_all()
+        for run in range(runs):
+            user = rng.choice(users)
+            start = time.perf_counter()
+            case(db, user, rng, run + 2)
+            samples.append(time.perf_counter() - start)
+            db.expunge_all()
+    finally:
+        db.close()
+        recorder.close()
+    result = summarize(samples)
+    result["queries_per_call"] = recorder.count
+    result["plans"] = [explain(engine, statement, parameters) for statement, parameters in recorder.statements.items()]
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="Comma-separated task counts"
+    )
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--skew", type=float, default=0.0, help="Zipf exponent of tasks per user (0 = even)")
+    parser.add_argument("--runs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cases", help="Only run cases whose name contains this substring")
+    parser.add_argument("--db-dir", help="Keep one seeded SQLite file per size here and reuse it")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--fail-on-scan", action="store_true", help="Exit 1 if any plan scans a whole table")
+    args = parser.parse_args(argv)
+
+    directory = args.db_dir or tempfile.mkdtemp(prefix="crud-micro-")
+    os.makedirs(directory, exist_ok=True)
+    cases = {name: case for name, case in build_cases().items() if not args.cases or args.cases in name}
+
+    report: Dict[str, Any] = {
+        "dataset": {"users": args.users, "skew": args.skew, "runs": args.runs, "seed": args.seed, "db_dir": directory},
+        "sizes": {},
+    }
+    scans = []
+    for size in (int(value) for value in args.sizes.split(",")):
+        prepared = prepare_database(
+            os.path.join(directory, f"crud_micro_{size}_{args.users}u.db"), size, args.users, args.skew, args.seed
+        )
+        Session = sessionmaker(bind=prepared["engine"], autoflush=False)
+        results = {}
+        for name, case in cases.items():
+            results[name] = run_case(prepared["engine"], Session, case, prepared["users"], args.runs, args.seed)
+            scans.extend(
+                f"{size} {name}: {plan['sql']}" for plan in results[name]["plans"] if plan["full_scan"]
+            )
+        report["sizes"][str(size)] = {"seed_seconds": prepared["seed_seconds"], "cases": results}
+        prepared["engine"].dispose()
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    for scan in scans:
+        print(f"full table scan: {scan}", file=sys.stderr)
+    return 1 if scans and args.fail_on_scan else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
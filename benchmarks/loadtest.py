@@ -0,0 +1,413 @@
+"""
+Воспроизводимый нагрузочный тест всего API с отчётом в JSON и сравнением с эталоном.
+
+    python -m benchmarks.loadtest --users 100 --tasks 1000000 --skew 1.0 --output baseline.json
+    python -m benchmarks.loadtest --db bench.db --reuse-db --baseline baseline.json --threshold 10
+    python -m benchmarks.loadtest --report current.json --baseline baseline.json
+
+База SQLite заполняется seed.py (число задач на пользователя — по Zipf с --skew).
+Приложение из app.main поднимается в процессе и нагружается через httpx смесью
+сценариев (--mix). План запросов строится заранее из --seed, поэтому два прогона
+с одинаковыми параметрами выполняют одни и те же запросы. Celery работает в
+eager-режиме с брокером и backend'ом в памяти: ни Redis, ни worker не нужны.
+
+Отчёт: пропускная способность и p50/p95/p99 по каждому сценарию и в целом.
+С --baseline рост задержки или падение пропускной способности больше
+--threshold процентов печатается в stderr, а код выхода становится 1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import tasks as celery_tasks
+from app.auth import create_access_token, user_cache
+from app.celery_app import celery_app
+from app.database import get_async_db, get_db
+from app.db_pool import PoolMetrics, engine_options, install_sqlite_pragmas
+from app.main import app
+from app.migrations import upgrade_database
+from app.passwords import password_service
+
+from .bench_indexes import percentile
+from .seed import WORDS, seed_database
+
+REPORT_VERSION = 1
+BENCH_PASSWORD = "bench-password"
+TASK_IDS_PER_USER = 50
+LATENCY_METRICS = ("p50_ms", "p95_ms", "p99_ms")
+DEFAULT_COMPARE_METRICS = LATENCY_METRICS + ("requests_per_second",)
+# Absolute error-rate growth (0.01 = one percentage point) that counts as a regression
+ERROR_RATE_TOLERANCE = 0.01
+
+# Scenario name -> weight in the request mix
+DEFAULT_MIX = {
+    "tasks.list": 25,
+    "tasks.get": 10,
+    "tasks.create": 5,
+    "tasks.update": 5,
+    "search": 15,
+    "statistics": 10,
+    "analytics": 5,
+    "export": 2,
+    "celery.bulk_create": 2,
+    "login": 1,
+}
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+def _bearer(user: Dict[str, Any]) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {user['token']}"}
+
+
+def _owned_task(rng: random.Random, user: Dict[str, Any]) -> int:
+    # Users without tasks get 404s, which the scenario reports as errors
+    return rng.choice(user["task_ids"]) if user["task_ids"] else 0
+
+
+# Each scenario turns (rng, user) into one HTTP request; any 4xx/5xx response counts as an error
+SCENARIOS: Dict[str, Callable[[random.Random, Dict[str, Any]], Request]] = {
+    "tasks.list": lambda rng, user: (
+        "GET", "/api/tasks/get_tasks", {"params": {"limit": 20}, "headers": _bearer(user)}
+    ),
+    "tasks.get": lambda rng, user: (
+        "GET", f"/api/tasks/{_owned_task(rng, user)}", {"headers": _bearer(user)}
+    ),
+    "tasks.create": lambda rng, user: (
+        "POST", "/api/tasks/create_task",
+        {"json": {"title": " ".join(rng.sample(WORDS, 3)), "description": "load test"}, "headers": _bearer(user)}
+    ),
+    "tasks.update": lambda rng, user: (
+        "PUT", f"/api/tasks/{_owned_task(rng, user)}",
+        {"json": {"completed": rng.random() < 0.5}, "headers": _bearer(user)}
+    ),
+    "search": lambda rng, user: (
+        "GET", "/api/advanced-tasks/search",
+        {"params": {"search": rng.choice(WORDS), "limit": 20}, "headers": _bearer(user)}
+    ),
+    "statistics": lambda rng, user: (
+        "GET", "/api/advanced-tasks/statistics", {"headers": _bearer(user)}
+    ),
+    "analytics": lambda rng, user: (
+        "GET", "/api/advanced-tasks/analytics", {"headers": _bearer(user)}
+    ),
+    "export": lambda rng, user: (
+        "GET", "/api/advanced-tasks/export",
+        {"params": {"format": rng.choice(["json", "csv", "ndjson"]), "completed": "true"}, "headers": _bearer(user)}
+    ),
+    "celery.bulk_create": lambda rng, user: (
+        "POST", "/api/celery/bulk-create-tasks",
+        {"json": {"tasks": [{"title": f"bulk {n}"} for n in range(10)]}, "headers": _bearer(user)}
+    ),
+    "login": lambda rng, user: (
+        "POST", "/api/auth/login", {"data": {"username": user["username"], "password": BENCH_PASSWORD}}
+    ),
+}
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """
+    "tasks.list=30,search=10" -> {"tasks.list": 30, "search": 10}
+    """
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r}; known: {', '.join(SCENARIOS)}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def build_plan(users: List[Dict[str, Any]], mix: Dict[str, int], total: int, seed: int) -> List[Tuple[str, Request]]:
+    """
+    Последовательность запросов, полностью определяемая seed
+    """
+    rng = random.Random(seed)
+    names = [name for name, weight in mix.items() if weight > 0]
+    weights = [mix[name] for name in names]
+    plan = []
+    for _ in range(total):
+        name = rng.choices(names, weights)[0]
+        plan.append((name, SCENARIOS[name](rng, rng.choice(users))))
+    return plan
+
+
+def summarize(samples: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    if not samples:
+        return {"requests": 0, "errors": 0}
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4),
+        "requests_per_second": round(len(samples) / elapsed, 2),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+async def run_plan(plan: List[Tuple[str, Request]], concurrency: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: Dict[str, List[float]] = {}
+    errors: Counter = Counter()
+    statuses: Dict[str, Counter] = {}
+
+    async with httpx.AsyncClient(app=app, base_url="http://loadtest", timeout=None) as http:
+        async def call(name: str, request: Request) -> None:
+            method, path, kwargs = request
+            async with semaphore:
+                started = time.perf_counter()
+                response = await http.request(method, path, **kwargs)
+                elapsed = time.perf_counter() - started
+            samples.setdefault(name, []).append(elapsed)
+            statuses.setdefault(name, Counter())[response.status_code] += 1
+            if response.status_code >= 400:
+                errors[name] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(call(name, request) for name, request in plan))
+        elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name in sorted(samples):
+        endpoints[name] = summarize(samples[name], errors[name], elapsed)
+        endpoints[name]["statuses"] = {str(code): count for code, count in sorted(statuses[name].items())}
+    everything = [sample for values in samples.values() for sample in values]
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "total": summarize(everything, sum(errors.values()), elapsed),
+        "endpoints": endpoints,
+    }
+
+
+def compare_reports(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    threshold: float = 10.0,
+    metrics=DEFAULT_COMPARE_METRICS,
+    min_delta_ms: float = 1.0,
+) -> List[Dict[str, Any]]:
+    """
+    Построчное сравнение двух отчётов. Регрессия — рост задержки больше threshold %
+    (и не меньше min_delta_ms), падение requests_per_second больше threshold % или
+    рост доли ошибок больше ERROR_RATE_TOLERANCE
+    """
+    base_rows = {"total": baseline["total"], **baseline["endpoints"]}
+    current_rows = {"total": current["total"], **current["endpoints"]}
+    rows = []
+    for name in base_rows:
+        base, cur = base_rows[name], current_rows.get(name)
+        if not base.get("requests") or not cur or not cur.get("requests"):
+            continue
+        for metric in metrics:
+            before, after = base[metric], cur[metric]
+            change = (after - before) / before * 100 if before else 0.0
+            if metric in LATENCY_METRICS:
+                regression = change > threshold and after - before >= min_delta_ms
+            else:
+                # Throughput: a drop is the regression
+                regression = -change > threshold
+            rows.append({
+                "endpoint": name, "metric": metric, "baseline": before, "current": after,
+                "change_pct": round(change, 1), "regression": regression,
+            })
+        rows.append({
+            "endpoint": name, "metric": "error_rate", "baseline": base["error_rate"], "current": cur["error_rate"],
+            "change_pct": None, "regression": cur["error_rate"] - base["error_rate"] > ERROR_RATE_TOLERANCE,
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict[str, Any]], stream=sys.stderr) -> None:
+    for row in rows:
+        change = "" if row["change_pct"] is None else f"{row['change_pct']:+.1f}%"
+        flag = "REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['endpoint']:<20} {row['metric']:<20} {row['baseline']:>12} {row['current']:>12} {change:>8} {flag}",
+            file=stream,
+        )
+
+
+def _environment() -> Dict[str, Any]:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        revision = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "sqlite": sqlite3.sqlite_version,
+        "cpu_count": os.cpu_count(),
+        "git_revision": revision,
+    }
+
+
+def use_in_memory_celery(Session) -> None:
+    """
+    Celery без брокера: задачи выполняются в вызывающем потоке, результаты — в памяти
+    """
+    celery_app.conf.update(
+        task_always_eager=True,
+        task_eager_propagates=True,
+        broker_url="memory://",
+        result_backend="cache+memory://",
+    )
+    # Task bodies open their own sessions
+    celery_tasks.SessionLocal = Session
+
+
+def load_users(engine, with_task_ids: int = TASK_IDS_PER_USER) -> List[Dict[str, Any]]:
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT id, username FROM users WHERE username LIKE 'bench_user_%' ORDER BY id"
+        )).all()
+        users = []
+        for user_id, username in rows:
+            task_ids = conn.execute(
+                text("SELECT id FROM tasks WHERE owner_id = :uid ORDER BY id LIMIT :n"),
+                {"uid": user_id, "n": with_task_ids},
+            ).scalars().all()
+            users.append({
+                "id": user_id,
+                "username": username,
+                "token": create_access_token({"sub": username, "uid": user_id}),
+                "task_ids": list(task_ids),
+            })
+    return users
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "loadtest.db")
+    url = f"sqlite:///{path}"
+    engine = create_engine(url, **engine_options(url, PoolMetrics()))
+    install_sqlite_pragmas(engine)
+    upgrade_database(engine)
+
+    seed_started = time.perf_counter()
+    users = load_users(engine) if args.reuse_db else []
+    reused = bool(users)
+    if not reused:
+        seed_database(
+            engine, users=args.users, tasks=args.tasks, skew=args.skew, seed=args.seed,
+            password_hash=password_service.hash(BENCH_PASSWORD),
+        )
+        users = load_users(engine)
+    seed_seconds = time.perf_counter() - seed_started
+
+    Session = sessionmaker(bind=engine, autoflush=False)
+    async_url = f"sqlite+aiosqlite:///{path}"
+    async_engine = create_async_engine(async_url, **engine_options(async_url, PoolMetrics(), is_async=True))
+    install_sqlite_pragmas(async_engine.sync_engine)
+    AsyncSessionFactory = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+    def bench_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def bench_async_db():
+        async with AsyncSessionFactory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = bench_db
+    app.dependency_overrides[get_async_db] = bench_async_db
+    use_in_memory_celery(Session)
+    user_cache.clear()
+
+    async def run_all() -> Dict[str, Any]:
+        if args.warmup:
+            await run_plan(build_plan(users, args.mix, args.warmup, args.seed + 1), args.concurrency)
+        result = await run_plan(build_plan(users, args.mix, args.requests, args.seed), args.concurrency)
+        await async_engine.dispose()
+        return result
+
+    result = asyncio.run(run_all())
+    return {
+        "version": REPORT_VERSION,
+        "dataset": {
+            "db": path, "users": len(users), "tasks": args.tasks, "skew": args.skew,
+            "reused": reused, "seed_seconds": round(seed_seconds, 2),
+        },
+        "load": {
+            "requests": args.requests, "warmup": args.warmup, "concurrency": args.concurrency,
+            "seed": args.seed, "mix": args.mix,
+        },
+        "environment": _environment(),
+        **result,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--tasks", type=int, default=100_000)
+    parser.add_argument("--skew", type=float, default=1.0, help="Zipf exponent of tasks per user (0 = even)")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX), help="scenario=weight,...")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="SQLite file to use (default: temporary file)")
+    parser.add_argument("--reuse-db", action="store_true", help="Skip seeding if --db already has bench users")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--report", help="Compare an existing report instead of running the load")
+    parser.add_argument("--baseline", help="Report to compare against; exit code 1 on regression")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed regression, percent")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Ignore latency changes below this")
+    parser.add_argument(
+        "--metrics", default=",".join(DEFAULT_COMPARE_METRICS), help="Report fields to compare"
+    )
+    args = parser.parse_args(argv)
+
+    if args.report:
+        with open(args.report) as f:
+            report = json.load(f)
+    else:
+        report = run(args)
+        payload = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(payload + "\n")
+        else:
+            print(payload)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("dataset", {}).get("tasks") != report.get("dataset", {}).get("tasks") or \
+            baseline.get("load", {}).get("mix") != report.get("load", {}).get("mix"):
+        print("warning: baseline was recorded with a different dataset or mix", file=sys.stderr)
+    rows = compare_reports(
+        baseline, report, args.threshold, tuple(args.metrics.split(",")), args.min_delta_ms
+    )
+    print_comparison(rows)
+    regressions = [row for row in rows if row["regression"]]
+    print(f"{len(regressions)} regression(s) above {args.threshold}%", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
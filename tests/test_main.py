@@ -1,15 +1,27 @@
+import asyncio
 import pytest
+from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 from app.main import app
-from app.database import get_db, Base
+from app.database import get_db, get_async_db, Base, forbid_event_loop_access, observe_queries, SyncDatabaseOnEventLoopError
+from app.routers import tasks_async
+from app.db_pool import PoolMetrics, engine_options, install_sqlite_pragmas, pool_stats
 from app.models import User, Task
+from app.search import drop_search_index, install_search_index
 
 # Create test database
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
 engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+forbid_event_loop_access(engine)
+observe_queries(engine)
+# TestClient runs every request on a fresh event loop, so async connections are not pooled
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 def override_get_db():
     try:
@@ -18,7 +30,12 @@ def override_get_db():
     finally:
         db.close()
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_async_db] = override_get_async_db
 
 # Create test client
 client = TestClient(app)
@@ -26,7 +43,13 @@ client = TestClient(app)
 @pytest.fixture(scope="module")
 def setup_database():
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # The FTS table is not in the metadata, so drop_all leaves it behind in test.db
+        drop_search_index(conn)
+        install_search_index(conn)
     yield
+    with engine.begin() as conn:
+        drop_search_index(conn)
     Base.metadata.drop_all(bind=engine)
 
 def test_health_check():
@@ -87,4 +110,1042 @@ def test_create_task_without_auth():
         "title": "Test Task",
         "description": "Test Description"
     })
-    assert response.status_code == 403 
\ No newline at end of file
+    assert response.status_code == 403 
+def get_auth_headers(username: str) -> dict:
+    client.post("/api/auth/register", json={
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "testpassword"
+    })
+    response = client.post("/api/auth/login", data={
+        "username": username,
+        "password": "testpassword"
+    })
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_cursor_pagination(setup_database):
+    headers = get_auth_headers("cursortest")
+    for i in range(5):
+        client.post("/api/tasks/create_task", json={"title": f"Task {i}"}, headers=headers)
+    
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/tasks/get_tasks", params=params, headers=headers)
+        assert response.status_code == 200
+        seen.extend(task["id"] for task in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    
+    assert len(seen) == 5
+    assert seen == sorted(seen)
+
+def test_search_cursor_pagination_with_ties(setup_database):
+    headers = get_auth_headers("searchcursor")
+    for i in range(5):
+        client.post("/api/tasks/create_task", json={"title": "Same title"}, headers=headers)
+    
+    first = client.get("/api/advanced-tasks/search", params={"limit": 3, "sort_by": "title"}, headers=headers)
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get(
+        "/api/advanced-tasks/search",
+        params={"limit": 3, "sort_by": "title", "cursor": cursor},
+        headers=headers
+    )
+    ids = [t["id"] for t in first.json()] + [t["id"] for t in second.json()]
+    assert len(ids) == len(set(ids)) == 5
+
+def test_invalid_cursor(setup_database):
+    headers = get_auth_headers("badcursor")
+    response = client.get("/api/tasks/get_tasks", params={"cursor": "garbage"}, headers=headers)
+    assert response.status_code == 400
+
+def test_full_text_search(setup_database):
+    headers = get_auth_headers("searchtest")
+    client.post("/api/tasks/create_task", json={"title": "Deploy release", "description": "Ship it"}, headers=headers)
+    client.post("/api/tasks/create_task", json={"title": "Budget", "description": "deploy costs"}, headers=headers)
+    client.post("/api/tasks/create_task", json={"title": "Unrelated"}, headers=headers)
+    
+    response = client.get(
+        "/api/advanced-tasks/search",
+        params={"search": "depl", "sort_by": "relevance"},
+        headers=headers
+    )
+    assert response.status_code == 200
+    titles = [task["title"] for task in response.json()]
+    # Match in both fields, title match ranked first
+    assert titles == ["Deploy release", "Budget"]
+    
+    client.put(f"/api/tasks/{response.json()[1]['id']}", json={"description": "other"}, headers=headers)
+    response = client.get("/api/advanced-tasks/search", params={"search": "deploy"}, headers=headers)
+    assert [task["title"] for task in response.json()] == ["Deploy release"]
+
+def test_search_matches_substrings_in_both_tiers(setup_database):
+    from datetime import datetime, timedelta
+    from sqlalchemy import update
+    from app import retention
+    headers = get_auth_headers("midword")
+    ids = {
+        title: client.post("/api/tasks/create_task", json={"title": title}, headers=headers).json()["id"]
+        for title in ("Masked tasking", "Taskforce minutes", "Unrelated")
+    }
+    db = TestingSessionLocal()
+    try:
+        db.execute(update(Task).where(Task.id == ids["Taskforce minutes"])
+                   .values(completed=True, updated_at=datetime.utcnow() - timedelta(days=40)))
+        db.commit()
+        retention.run_retention(db, sleep_seconds=0, default_days=30, mode="archive")
+    finally:
+        db.close()
+
+    def titles(search, **params):
+        response = client.get("/api/advanced-tasks/search", params={"search": search, **params}, headers=headers)
+        return sorted(task["title"] for task in response.json())
+
+    # Mid-word and case-insensitive, via the trigram index and below the trigram length alike
+    assert titles("ask") == ["Masked tasking"]
+    assert titles("SK") == ["Masked tasking"]
+    assert titles("ask", include_archived="true") == ["Masked tasking", "Taskforce minutes"]
+    assert titles("orce min", include_archived="true") == ["Taskforce minutes"]
+
+def test_task_counters_follow_writes(setup_database):
+    from app import task_stats
+    headers = get_auth_headers("countertest")
+    ids = [
+        client.post("/api/tasks/create_task", json={"title": f"Task {i}"}, headers=headers).json()["id"]
+        for i in range(4)
+    ]
+    client.put(f"/api/tasks/{ids[0]}", json={"completed": True}, headers=headers)
+    client.put("/api/advanced-tasks/bulk-update", json={"task_ids": ids[1:3], "completed": True}, headers=headers)
+    client.delete(f"/api/tasks/{ids[1]}", headers=headers)
+    client.post(f"/api/advanced-tasks/duplicate/{ids[0]}", headers=headers)
+    client.request("DELETE", "/api/advanced-tasks/bulk-delete", json={"task_ids": [ids[3]]}, headers=headers)
+    
+    stats = client.get("/api/advanced-tasks/statistics", headers=headers).json()
+    assert stats["total_tasks"] == 3
+    assert stats["completed_tasks"] == 2
+    assert stats["recent_tasks_week"] == 3
+    
+    db = TestingSessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "countertest").first()
+        assert task_stats.find_drift(db, user.id) == []
+    finally:
+        db.close()
+
+def test_task_counters_use_rolling_week_and_read_only_fallback(setup_database):
+    from datetime import datetime
+    from sqlalchemy import update
+    from app import task_stats
+    from app.models import UserTaskStats
+    headers = get_auth_headers("rollingweek")
+    ids = [client.post("/api/tasks/create_task", json={"title": f"Week {i}"}, headers=headers).json()["id"]
+           for i in range(3)]
+    now = datetime(2026, 10, 17, 12, 0)
+    db = TestingSessionLocal()
+    try:
+        owner_id = db.get(Task, ids[0]).owner_id
+        # 7 days before "now" is 2026-10-10 12:00: the first task falls just outside on the same calendar day
+        for task_id, created_at in zip(ids, [datetime(2026, 10, 10, 11), datetime(2026, 10, 10, 13),
+                                             datetime(2026, 10, 16, 9)]):
+            db.execute(update(Task).where(Task.id == task_id).values(created_at=created_at))
+        task_stats.rebuild_user_stats(db, owner_id)
+        db.commit()
+        expected = {"recent_week": 2, "tasks_by_day": [{"date": "2026-10-10", "count": 1},
+                                                       {"date": "2026-10-16", "count": 1}]}
+        stats = task_stats.get_user_stats(db, owner_id, now=now)
+        assert {key: stats[key] for key in expected} == expected and stats["total"] == 3
+
+        # Without a counter row the read computes from tasks and writes nothing
+        db.query(UserTaskStats).filter(UserTaskStats.user_id == owner_id).delete()
+        db.commit()
+        stats = task_stats.get_user_stats(db, owner_id, now=now)
+        assert {key: stats[key] for key in expected} == expected and (stats["total"], stats["version"]) == (3, 0)
+        assert not db.new and not db.dirty
+        db.rollback()
+        assert db.query(UserTaskStats).filter(UserTaskStats.user_id == owner_id).count() == 0
+
+        # The next write recreates the row from tasks (INSERT ... ON CONFLICT DO NOTHING)
+        task_stats.apply_task_rows(db, owner_id, [(now, False)])
+        assert db.query(UserTaskStats.total_tasks).filter(UserTaskStats.user_id == owner_id).scalar() == 3
+        db.rollback()
+    finally:
+        db.close()
+
+def test_cached_reads_are_invalidated_by_writes(setup_database, monkeypatch):
+    from app.cache import cache
+    # No Redis configured: the single-process local cache
+    monkeypatch.setattr(cache, "_redis", None)
+    headers = get_auth_headers("cachetest")
+    client.post("/api/tasks/create_task", json={"title": "First"}, headers=headers)
+    
+    assert len(client.get("/api/advanced-tasks/search", headers=headers).json()) == 1
+    assert client.get("/api/advanced-tasks/statistics", headers=headers).json()["total_tasks"] == 1
+    before = client.get("/api/health/cache").json()
+    assert len(client.get("/api/advanced-tasks/search", headers=headers).json()) == 1
+    assert client.get("/api/health/cache").json()["hits"] == before["hits"] + 1
+    
+    client.post("/api/tasks/create_task", json={"title": "Second"}, headers=headers)
+    assert len(client.get("/api/advanced-tasks/search", headers=headers).json()) == 2
+    assert client.get("/api/advanced-tasks/statistics", headers=headers).json()["total_tasks"] == 2
+
+def test_cache_is_bypassed_while_redis_is_down():
+    import redis
+    from app.cache import TaskCache
+
+    class DownRedis:
+        def __getattr__(self, name):
+            def fail(*args, **kwargs):
+                raise redis.ConnectionError("down")
+            return fail
+
+    down = TaskCache("redis://localhost:6379/1", redis_retry_seconds=60)
+    down._redis = DownRedis()
+    loads = []
+    for _ in range(3):
+        assert down.get_or_load(1, "tasks", {}, lambda: loads.append(1) or {"n": len(loads)}, ttl=60) == {"n": len(loads)}
+    # Every read hit the database and nothing was kept in-process for other workers to miss
+    assert len(loads) == 3 and not [key for key in down.local._data if ":gen:" not in key]
+    assert (down.metrics["bypassed"], down.metrics["hits"], down.backend_name()) == (3, 0, "bypass")
+
+def test_user_cache_and_invalidation(setup_database):
+    from app.auth import user_cache
+    headers = get_auth_headers("usercachetest")
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    hits = user_cache.hits
+    assert client.get("/api/auth/me", headers=headers).json()["username"] == "usercachetest"
+    assert user_cache.hits == hits + 1
+    
+    db = TestingSessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "usercachetest").first()
+        user.is_active = False
+        db.commit()
+    finally:
+        db.close()
+    
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+def test_user_cache_staleness_is_bounded_by_ttl(setup_database, monkeypatch):
+    import time
+    from app.auth import user_cache
+    from app.config import USER_CACHE_TTL_SECONDS
+    assert USER_CACHE_TTL_SECONDS <= 5
+    monkeypatch.setattr(user_cache, "ttl", 0.2)
+    headers = get_auth_headers("userttltest")
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+
+    # A Core UPDATE fires no ORM events, like a change made by another worker process
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE users SET is_active = 0 WHERE username = 'userttltest'"))
+    assert client.get("/api/auth/me", headers=headers).status_code == 200
+    time.sleep(0.25)
+    assert client.get("/api/auth/me", headers=headers).status_code == 401
+
+def test_password_service_sheds_excess_load(setup_database):
+    from app.passwords import password_service
+    slots = []
+    while password_service._slots.acquire(blocking=False):
+        slots.append(True)
+    try:
+        response = client.post("/api/auth/login", data={"username": "logintest", "password": "testpassword"})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        for _ in slots:
+            password_service._slots.release()
+    assert client.get("/api/health/passwords").json()["rejected"] >= 1
+
+
+def test_password_service_releases_cancelled_queued_jobs():
+    import threading
+    from app.passwords import PasswordService
+    service = PasswordService(workers=1, max_in_flight=2, rounds=4)
+    hashed = service.hash("secret")
+    gate = threading.Event()
+    blocker = service._submit(gate.wait)
+
+    async def cancel_queued_verify():
+        queued = asyncio.ensure_future(service.verify_async("secret", hashed))
+        await asyncio.sleep(0.05)
+        assert service.stats()["queue_depth"] == 1
+        # The client went away while the job was still waiting for the single worker
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+    asyncio.run(cancel_queued_verify())
+    gate.set()
+    blocker.result()
+    stats = service.stats()
+    assert (stats["in_flight"], stats["running"], stats["queue_depth"]) == (0, 0, 0)
+    # Both slots are usable again
+    assert [service._submit(lambda: True) for _ in range(2)][-1].result() is True
+
+def test_async_tasks_router(setup_database):
+    async_app = FastAPI()
+    async_app.include_router(tasks_async.router, prefix="/api")
+    async_app.dependency_overrides = dict(app.dependency_overrides)
+    async_client = TestClient(async_app)
+    headers = get_auth_headers("asyncrouteruser")
+
+    created = async_client.post("/api/tasks/create_task", json={"title": "Async task"}, headers=headers)
+    assert created.status_code == 200
+    task_id = created.json()["id"]
+
+    updated = async_client.put(f"/api/tasks/{task_id}", json={"completed": True}, headers=headers)
+    assert updated.json()["completed"] is True
+    listed = async_client.get("/api/tasks/get_tasks", headers=headers)
+    assert [task["id"] for task in listed.json()] == [task_id]
+    # Sync and async routers share the same data and counters
+    assert client.get("/api/advanced-tasks/statistics", headers=headers).json()["completed_tasks"] == 1
+    assert async_client.delete(f"/api/tasks/{task_id}", headers=headers).status_code == 200
+    assert async_client.get(f"/api/tasks/{task_id}", headers=headers).status_code == 404
+
+def test_sync_database_on_event_loop_is_rejected(setup_database):
+    async def blocking_handler():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    with pytest.raises(SyncDatabaseOnEventLoopError):
+        asyncio.run(blocking_handler())
+    # Frontend pages run on the event loop and must not query the sync engine there
+    client.post("/register", data={"username": "asyncpage", "email": "asyncpage@example.com", "password": "secret"})
+    response = client.post("/login", data={"username": "asyncpage", "password": "secret"}, follow_redirects=False)
+    assert response.status_code == 302
+    client.cookies.set("access_token", response.cookies["access_token"])
+    try:
+        assert "asyncpage" in client.get("/dashboard").text
+    finally:
+        client.cookies.clear()
+
+def test_async_writes_invalidate_cache_off_the_event_loop(setup_database, monkeypatch):
+    from app import crud_async
+    from app.config import DATABASE_ASYNC
+    from app.routers import frontend
+    from app.schemas import TaskCreate
+    calls = []
+
+    def record_invalidation(user_id):
+        try:
+            asyncio.get_running_loop()
+            calls.append((user_id, "event loop"))
+        except RuntimeError:
+            calls.append((user_id, "threadpool"))
+
+    monkeypatch.setattr(crud_async, "invalidate_owner", record_invalidation)
+    monkeypatch.setattr("app.crud.invalidate_owner", record_invalidation)
+    headers = get_auth_headers("asyncinvalidate")
+    owner_id = client.get("/api/auth/me", headers=headers).json()["id"]
+
+    async def write():
+        async with TestingAsyncSessionLocal() as db:
+            task = await crud_async.create_task(db, TaskCreate(title="Invalidate me"), owner_id)
+            await crud_async.delete_task(db, task.id, owner_id)
+
+    asyncio.run(write())
+    assert calls == [(owner_id, "threadpool"), (owner_id, "threadpool")]
+    # Pages pick their session dependency from the same switch as /api/tasks
+    assert frontend.get_page_db is (get_async_db if DATABASE_ASYNC else get_db)
+
+def test_sqlite_connection_tuning(tmp_path):
+    url = f"sqlite:///{tmp_path / 'tuned.db'}"
+    tuned_engine = create_engine(url, **engine_options(url, PoolMetrics()))
+    install_sqlite_pragmas(tuned_engine)
+    with tuned_engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        stats = pool_stats(tuned_engine)
+        assert stats["checked_out"] == 1
+        assert stats["saturation"] > 0
+    stats = pool_stats(tuned_engine)
+    assert stats["checkouts"] == 1 and stats["timeouts"] == 0
+    assert stats["checked_out"] == 0
+    tuned_engine.dispose()
+
+    health = client.get("/api/health/db").json()
+    assert health["sync"]["pool"] == "InstrumentedQueuePool"
+
+def test_bulk_ingest_reports_failures_per_chunk(setup_database, monkeypatch):
+    from sqlalchemy.exc import OperationalError
+    from app import bulk_ingest, task_stats
+    headers = get_auth_headers("bulkingest")
+    rows = [{"title": f"Bulk {i}"} for i in range(10)]
+    rows[3] = {"title": ""}
+
+    real_insert_chunk = bulk_ingest.insert_chunk
+    calls = {"count": 0}
+
+    def flaky_insert_chunk(db, user_id, chunk_rows):
+        calls["count"] += 1
+        if calls["count"] == 2:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        return real_insert_chunk(db, user_id, chunk_rows)
+
+    monkeypatch.setattr(bulk_ingest, "insert_chunk", flaky_insert_chunk)
+    progress = []
+    db = TestingSessionLocal()
+    try:
+        user = db.query(User).filter(User.username == "bulkingest").first()
+        report = bulk_ingest.ingest_tasks(
+            db, user.id, rows, chunk_size=4, on_progress=lambda r: progress.append(r["processed"])
+        )
+        assert progress == [4, 8, 10]
+        assert (report["inserted"], report["rejected"], report["failed"]) == (5, 1, 4)
+        assert report["chunks"][0]["rejected_rows"] == [{"index": 3, "error": "Each task must have a title"}]
+        assert "database is locked" in report["chunks"][1]["error"]
+        assert [task["title"] for task in report["tasks"]] == ["Bulk 0", "Bulk 1", "Bulk 2", "Bulk 8", "Bulk 9"]
+        assert task_stats.find_drift(db, user.id) == []
+    finally:
+        db.close()
+    stats = client.get("/api/advanced-tasks/statistics", headers=headers).json()
+    assert stats["total_tasks"] == 5
+
+def test_streaming_import_spools_body_for_worker(setup_database, tmp_path, monkeypatch):
+    from app import bulk_ingest
+    from app.routers import celery_tasks
+    monkeypatch.setattr(bulk_ingest, "IMPORT_SPOOL_DIR", str(tmp_path))
+    queued = []
+
+    class QueuedTask:
+        id = "import-task-id"
+
+    monkeypatch.setattr(celery_tasks.import_tasks_from_file, "delay", lambda **kwargs: queued.append(kwargs) or QueuedTask())
+    headers = get_auth_headers("importer")
+    body = '{"title": "From file 1"}\n\nnot json\n{"title": "From file 2", "description": "d"}\n'
+
+    def chunked_body():
+        for start in range(0, len(body), 7):
+            yield body[start:start + 7].encode()
+
+    response = client.post(
+        "/api/celery/import-tasks",
+        content=chunked_body(),
+        headers={**headers, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 202
+    assert response.json()["task_id"] == "import-task-id"
+    job = queued[0]
+    assert job["file_format"] == "ndjson" and open(job["path"]).read() == body
+    assert bulk_ingest.count_import_rows(job["path"], "ndjson") == 3
+
+    db = TestingSessionLocal()
+    try:
+        report = bulk_ingest.ingest_tasks(db, job["user_id"], bulk_ingest.iter_import_file(job["path"], "ndjson"))
+    finally:
+        db.close()
+    assert (report["inserted"], report["rejected"]) == (2, 1)
+    assert report["chunks"][0]["rejected_rows"] == [{"index": 1, "error": "Invalid JSON on line 3"}]
+
+    csv_response = client.post(
+        "/api/celery/import-tasks?format=csv", content=b"title,description\nCSV task,desc\n", headers=headers
+    )
+    assert csv_response.status_code == 202
+    assert list(bulk_ingest.iter_import_file(queued[1]["path"], "csv")) == [{"title": "CSV task", "description": "desc"}]
+    assert client.post("/api/celery/import-tasks", content=b"x", headers=headers).status_code == 415
+
+def test_streaming_export_formats(setup_database):
+    import csv, gzip, io, json
+    headers = get_auth_headers("exporter")
+    tricky = 'Quote "this", then\nnew line'
+    client.post("/api/tasks/create_task", json={"title": tricky, "description": "a,b"}, headers=headers)
+    client.post("/api/tasks/create_task", json={"title": "Plain"}, headers=headers)
+
+    response = client.get("/api/advanced-tasks/export", params={"format": "csv"}, headers=headers)
+    assert response.headers["content-type"].startswith("text/csv")
+    assert "attachment" in response.headers["content-disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert {row["title"] for row in rows} == {tricky, "Plain"}
+    assert [row["description"] for row in rows if row["title"] == tricky] == ["a,b"]
+
+    exported = client.get("/api/advanced-tasks/export", headers=headers).json()
+    assert exported["total_count"] == 2 and exported["format"] == "json"
+    assert {task["title"] for task in exported["tasks"]} == {tricky, "Plain"}
+
+    response = client.get("/api/advanced-tasks/export", params={"format": "ndjson", "gzip": True}, headers=headers)
+    assert response.headers["content-type"] == "application/gzip"
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert [json.loads(line)["title"] for line in lines] == ["Plain", tricky]
+
+def test_background_export_artifact_dedup_and_download(setup_database, tmp_path, monkeypatch):
+    import gzip, json
+    from app import artifacts, tasks as celery_jobs
+    monkeypatch.setattr(artifacts, "EXPORT_ARTIFACT_DIR", str(tmp_path))
+    monkeypatch.setattr(celery_jobs, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(celery_jobs.export_tasks_to_artifact, "update_state", lambda **kwargs: None)
+    jobs = []
+
+    class QueuedJob:
+        def __init__(self, kwargs):
+            self.id = f"export-{len(jobs)}"
+            jobs.append(kwargs)
+
+    monkeypatch.setattr(celery_jobs.export_tasks_to_artifact, "delay", lambda **kwargs: QueuedJob(kwargs))
+    headers = get_auth_headers("artifactuser")
+    client.post("/api/tasks/create_task", json={"title": "Archived one"}, headers=headers)
+    params = {"format": "ndjson", "background": True}
+
+    queued = client.get("/api/advanced-tasks/export", params=params, headers=headers)
+    assert queued.status_code == 202 and queued.json()["task_id"] == "export-0"
+    # Same user, filters and data version: the in-flight job is reused
+    monkeypatch.setattr(celery_jobs.celery_app, "AsyncResult", lambda job_id: type("R", (), {"state": "PROGRESS"})())
+    assert client.get("/api/advanced-tasks/export", params=params, headers=headers).json()["task_id"] == "export-0"
+    result = celery_jobs.export_tasks_to_artifact.run(**jobs[0])
+    assert result["result"]["artifact_id"] == queued.json()["artifact_id"]
+
+    ready = client.get("/api/advanced-tasks/export", params=params, headers=headers)
+    assert ready.status_code == 200 and ready.json()["status"] == "READY" and len(jobs) == 1
+    url = ready.json()["download_url"]
+    full = client.get(url, headers=headers)
+    assert [json.loads(line)["title"] for line in gzip.decompress(full.content).decode().splitlines()] == ["Archived one"]
+    etag = full.headers["etag"]
+    assert client.get(url, headers={**headers, "If-None-Match": etag}).status_code == 304
+    partial = client.get(url, headers={**headers, "Range": "bytes=2-9"})
+    assert partial.status_code == 206 and partial.content == full.content[2:10]
+    assert partial.headers["content-range"] == f"bytes 2-9/{len(full.content)}"
+    assert client.get(url, headers={**headers, "Range": "bytes=-4"}).content == full.content[-4:]
+    assert client.get(url, headers={**headers, "Range": f"bytes={len(full.content)}-"}).status_code == 416
+    assert client.get(url, headers=get_auth_headers("otherartifactuser")).status_code == 404
+
+    # A write bumps the data version, so the next export is a new artifact
+    client.post("/api/tasks/create_task", json={"title": "Newer"}, headers=headers)
+    assert client.get("/api/advanced-tasks/export", params=params, headers=headers).status_code == 202
+    assert len(jobs) == 2
+
+def test_retention_batches_policies_and_resume(setup_database):
+    from datetime import datetime, timedelta
+    from sqlalchemy import update
+    from app import retention, task_stats
+    owners, owner_ids = {}, {}
+    for username, days in (("retaindefault", None), ("retainforever", 0), ("retainweek", 7)):
+        headers = get_auth_headers(username)
+        if days is not None:
+            response = client.put("/api/auth/me/retention", json={"task_retention_days": days}, headers=headers)
+            assert response.json()["task_retention_days"] == days
+        created = [client.post("/api/tasks/create_task", json={"title": f"{username} {i}"}, headers=headers).json()
+                   for i in range(4)]
+        owners[username] = [task["id"] for task in created]
+        owner_ids[username] = created[0]["owner_id"]
+
+    now = datetime.utcnow()
+    db = TestingSessionLocal()
+    try:
+        def age(task_ids, days, completed=True):
+            db.execute(update(Task).where(Task.id.in_(task_ids)).values(completed=completed, updated_at=now - timedelta(days=days)))
+        age(owners["retaindefault"][:2], 40)                 # expired under the 30-day default
+        age(owners["retaindefault"][2:3], 10)                # too recent
+        age(owners["retaindefault"][3:], 40, completed=False)  # never delete pending tasks
+        age(owners["retainforever"], 400)
+        age(owners["retainweek"][:3], 10)
+        db.commit()
+        for owner_id in owner_ids.values():
+            task_stats.rebuild_user_stats(db, owner_id)
+        db.commit()
+
+        dry = retention.run_retention(db, batch_size=2, dry_run=True, default_days=30, now=now)
+        assert dry["deleted"] == 5 and dry["completed"]
+        assert db.query(Task).filter(Task.id.in_(owners["retaindefault"])).count() == 4
+
+        first_id = min(owners["retaindefault"])
+        db.merge(retention.RetentionCheckpoint(name=retention.CHECKPOINT_NAME, last_id=first_id - 1))
+        db.commit()
+        partial = retention.run_retention(db, batch_size=2, sleep_seconds=0, default_days=30, now=now, max_batches=1)
+        assert (partial["deleted"], partial["completed"]) == (2, False)
+        resumed = retention.run_retention(db, batch_size=2, sleep_seconds=0, default_days=30, now=now)
+        assert resumed["resumed_from"] == partial["last_id"] and resumed["completed"]
+        assert resumed["deleted"] == 3
+
+        remaining = {task.id for task in db.query(Task).filter(Task.id.in_(sum(owners.values(), [])))}
+        assert remaining == set(owners["retaindefault"][2:]) | set(owners["retainforever"]) | {owners["retainweek"][3]}
+        assert db.get(retention.RetentionCheckpoint, retention.CHECKPOINT_NAME).last_id == 0
+        assert all(task_stats.find_drift(db, owner_id) == [] for owner_id in owner_ids.values())
+    finally:
+        db.close()
+
+
+def test_retention_archive_is_searchable_and_exportable(setup_database):
+    import csv
+    import io
+    from datetime import datetime, timedelta
+    from sqlalchemy import update
+    from app import retention, task_stats
+    from app.models import ArchivedTask
+    headers = get_auth_headers("archiver")
+    created = [client.post("/api/tasks/create_task", json={"title": f"report {i}"}, headers=headers).json()
+               for i in range(3)]
+    old_ids = [created[0]["id"], created[1]["id"]]
+
+    now = datetime.utcnow()
+    db = TestingSessionLocal()
+    try:
+        db.execute(update(Task).where(Task.id.in_(old_ids)).values(completed=True, updated_at=now - timedelta(days=40)))
+        db.commit()
+        task_stats.rebuild_user_stats(db, created[0]["owner_id"])
+        db.commit()
+        report = retention.run_retention(db, sleep_seconds=0, default_days=30, now=now, mode="archive")
+        assert (report["deleted"], report["archived"]) == (2, 2)
+        assert db.query(Task).filter(Task.id.in_(old_ids)).count() == 0
+        archived = db.query(ArchivedTask).filter(ArchivedTask.owner_id == created[0]["owner_id"]).all()
+        assert sorted(task.id for task in archived) == old_ids
+        assert all(task.title.startswith("report") and task.completed for task in archived)
+    finally:
+        db.close()
+
+    hot_only = client.get("/api/advanced-tasks/search?search=report", headers=headers).json()
+    assert [task["id"] for task in hot_only] == [created[2]["id"]]
+    assert hot_only[0]["archived"] is False
+
+    response = client.get("/api/advanced-tasks/search?search=report&include_archived=true&sort_by=created_at&sort_order=asc&limit=2",
+                          headers=headers)
+    page = response.json()
+    assert [(task["id"], task["archived"]) for task in page] == [(old_ids[0], True), (old_ids[1], True)]
+    rest = client.get(f"/api/advanced-tasks/search?search=report&include_archived=true&sort_by=created_at&sort_order=asc"
+                      f"&limit=2&cursor={response.headers['X-Next-Cursor']}", headers=headers).json()
+    assert [(task["id"], task["archived"]) for task in rest] == [(created[2]["id"], False)]
+
+    exported = client.get("/api/advanced-tasks/export?format=ndjson", headers=headers).text.splitlines()
+    assert len(exported) == 1
+    exported = client.get("/api/advanced-tasks/export?format=csv&include_archived=true", headers=headers).text
+    rows = list(csv.DictReader(io.StringIO(exported)))
+    assert {row["id"]: row["archived"] for row in rows} == {
+        str(old_ids[0]): "True", str(old_ids[1]): "True", str(created[2]["id"]): "False"
+    }
+
+def test_retention_archive_never_reuses_task_ids(setup_database):
+    from datetime import datetime, timedelta
+    from sqlalchemy import update
+    from app import retention
+    from app.models import ArchivedTask
+    headers = get_auth_headers("rearchiver")
+    now = datetime.utcnow()
+
+    def archive_newest():
+        newest = client.post("/api/tasks/create_task", json={"title": "cycle"}, headers=headers).json()["id"]
+        db = TestingSessionLocal()
+        try:
+            db.execute(update(Task).where(Task.id == newest).values(completed=True, updated_at=now - timedelta(days=40)))
+            db.commit()
+            report = retention.run_retention(db, sleep_seconds=0, default_days=30, now=now, mode="archive")
+            assert report["archived"] == 1
+        finally:
+            db.close()
+        return newest
+
+    first = archive_newest()
+    # The max-id row is gone from tasks; a plain rowid table would hand its id out again
+    second = archive_newest()
+    assert second > first
+
+    db = TestingSessionLocal()
+    try:
+        archived = db.query(ArchivedTask).filter(ArchivedTask.title == "cycle").all()
+        assert sorted(task.id for task in archived) == [first, second]
+    finally:
+        db.close()
+    live = client.post("/api/tasks/create_task", json={"title": "cycle"}, headers=headers).json()["id"]
+    listed = client.get("/api/advanced-tasks/search?search=cycle&include_archived=true", headers=headers).json()
+    assert sorted(task["id"] for task in listed) == [first, second, live]
+
+def test_task_progress_push_resumes_from_last_event_id(setup_database):
+    import json
+    from app.progress import ProgressTask, progress_broker
+    from app.task_status import register_task
+    from app.tasks import process_bulk_tasks
+    assert isinstance(process_bulk_tasks, ProgressTask)
+    headers = get_auth_headers("progresswatcher")
+    owner_id = client.get("/api/auth/me", headers=headers).json()["id"]
+    token = headers["Authorization"].split(" ", 1)[1]
+
+    task_id = "progress-push-test"
+    register_task(task_id, owner_id)
+    first = progress_broker.publish(task_id, "PROGRESS", {"current": 1, "total": 3, "status": "1/3"})
+    progress_broker.publish(task_id, "PROGRESS", {"current": 2, "total": 3, "status": "2/3"})
+    final = progress_broker.publish(task_id, "SUCCESS", {"current": 3, "total": 3, "status": "done", "result": {"ok": True}})
+
+    def read_sse(extra_headers=None):
+        with client.stream("GET", f"/api/celery/task-progress/{task_id}/stream",
+                           headers={**headers, **(extra_headers or {})}) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            frames = [frame for frame in response.read().decode().split("\n\n") if "data: " in frame]
+        return [
+            (frame.split("id: ")[1].split("\n")[0], json.loads(frame.split("data: ")[1])) for frame in frames
+        ]
+
+    events = read_sse()
+    assert [payload["current"] for _, payload in events] == [1, 2, 3]
+    assert events[0][0] == first and events[-1] == (final, {
+        "task_id": task_id, "state": "SUCCESS", "current": 3, "total": 3, "status": "done", "result": {"ok": True}
+    })
+    resumed = read_sse({"Last-Event-ID": first})
+    assert [payload["current"] for _, payload in resumed] == [2, 3]
+
+    live_id = "progress-live-test"
+    register_task(live_id, owner_id)
+    progress_broker.publish(live_id, "STARTED", {"current": 0, "total": 2})
+    with client.websocket_connect(f"/api/celery/task-progress/{live_id}/ws?token={token}") as websocket:
+        started = websocket.receive_json()
+        assert started["type"] == "progress" and started["data"]["state"] == "STARTED"
+        # Published while the socket is open: pushed without polling
+        progress_broker.publish(live_id, "PROGRESS", {"current": 1, "total": 2, "status": "half"})
+        assert websocket.receive_json()["data"]["status"] == "half"
+        progress_broker.publish(live_id, "FAILURE", ValueError("boom"))
+        failure = websocket.receive_json()
+        assert failure["data"]["state"] == "FAILURE" and failure["data"]["error"] == "boom"
+
+def test_task_progress_push_requires_owner(setup_database):
+    from starlette.websockets import WebSocketDisconnect
+    from app.progress import progress_broker
+    from app.task_status import register_task
+    owner_headers = get_auth_headers("progressowner")
+    owner_id = client.get("/api/auth/me", headers=owner_headers).json()["id"]
+    intruder_token = get_auth_headers("progressintruder")["Authorization"].split(" ", 1)[1]
+    task_id = "progress-private-test"
+    register_task(task_id, owner_id)
+    progress_broker.publish(task_id, "SUCCESS", {"current": 1, "total": 1, "status": "done"})
+
+    url = f"/api/celery/task-progress/{task_id}"
+    assert client.get(f"{url}/stream").status_code == 403
+    foreign = client.get(f"{url}/stream", headers={"Authorization": f"Bearer {intruder_token}"})
+    assert foreign.status_code == 404
+    for query in ("", f"?token={intruder_token}", "?token=not-a-jwt"):
+        with pytest.raises(WebSocketDisconnect) as rejected:
+            with client.websocket_connect(f"{url}/ws{query}"):
+                pass
+        assert rejected.value.code == 1008
+
+def test_progress_reporter_coalesces_updates(setup_database, monkeypatch):
+    from app.progress import ProgressReporter
+    from app import tasks as celery_jobs
+
+    class RecordingTask:
+        def __init__(self):
+            self.states = []
+
+        def update_state(self, state=None, meta=None):
+            self.states.append((state, meta))
+
+    clock = {"now": 0.0}
+    task = RecordingTask()
+    with ProgressReporter(task, total=100000, min_interval=1.0, min_percent=1.0, clock=lambda: clock["now"]) as progress:
+        for item in range(1, 100001):
+            clock["now"] += 0.00001  # 100k items in one second: the percent delta drives the writes
+            progress.update(item, status=f"{item} done")
+    assert 100 <= progress.emitted <= 102
+    assert progress.emitted + progress.suppressed == 100000
+    assert task.states[-1] == ("PROGRESS", {"current": 100000, "total": 100000, "status": "100000 done"})
+    assert all(state == "PROGRESS" for state, _ in task.states)
+
+    # Slow, unknown-total work: the interval alone bounds writes, and flush sends the last value
+    task = RecordingTask()
+    progress = ProgressReporter(task, min_interval=10, clock=lambda: clock["now"])
+    for item in range(1, 51):
+        clock["now"] = item
+        progress.update(item, status="scanning")
+    progress.flush()
+    assert [meta["current"] for _, meta in task.states] == [1, 11, 21, 31, 41, 50]
+    assert progress.stats() == {"emitted": 6, "suppressed": 44}
+
+    states = []
+    monkeypatch.setattr(celery_jobs, "SessionLocal", TestingSessionLocal)
+    monkeypatch.setattr(celery_jobs.process_bulk_tasks, "update_state", lambda **kwargs: states.append(kwargs["meta"]))
+    get_auth_headers("progressowner")
+    db = TestingSessionLocal()
+    owner_id = db.query(User).filter(User.username == "progressowner").one().id
+    db.close()
+    result = celery_jobs.process_bulk_tasks(owner_id, [{"title": f"t{i}"} for i in range(2500)])
+    assert states[-1]["current"] == states[-1]["total"] == 2500
+    assert result["progress_updates"]["emitted"] == len(states)
+    assert set(states[0]) == {"current", "total", "status"}
+
+def test_task_status_batch_uses_one_pipeline_and_scopes_owner(setup_database, monkeypatch):
+    import itertools
+    import json
+    from app import task_status
+    from app.config import TASK_STATUS_BATCH_MAX
+    from app.routers import celery_tasks
+
+    class FakePipeline:
+        def __init__(self, client):
+            self.client, self.commands = client, []
+
+        def mget(self, keys):
+            self.commands.append(keys)
+
+        def execute(self):
+            self.client.round_trips += 1
+            return [[self.client.data.get(key) for key in keys] for keys in self.commands]
+
+    class FakeRedis:
+        def __init__(self):
+            self.data, self.round_trips = {}, 0
+
+        def set(self, key, value, ex=None):
+            self.data[key] = str(value).encode()
+
+        def pipeline(self, transaction=True):
+            return FakePipeline(self)
+
+    fake = FakeRedis()
+    monkeypatch.setattr(task_status, "_backend_client", lambda: fake)
+    job_ids = (f"job-{n}" for n in itertools.count())
+    monkeypatch.setattr(celery_tasks.generate_task_report, "delay",
+                        lambda **kwargs: type("Queued", (), {"id": next(job_ids)})())
+
+    owner_headers, other_headers = get_auth_headers("batchowner"), get_auth_headers("batchother")
+    mine = [client.post("/api/celery/generate-report", headers=owner_headers).json()["task_id"] for _ in range(3)]
+    theirs = client.post("/api/celery/generate-report", headers=other_headers).json()["task_id"]
+
+    def store(task_id, status, result):
+        key = celery_tasks.celery_app.backend.get_key_for_task(task_id)
+        fake.data[key] = json.dumps({"status": status, "result": result, "traceback": None,
+                                     "children": [], "date_done": None, "task_id": task_id}).encode()
+    store(mine[0], "PROGRESS", {"current": 2, "total": 4, "status": "Analyzing task data..."})
+    store(mine[1], "FAILURE", {"exc_type": "ValueError", "exc_message": ["User 7 not found"], "exc_module": "builtins"})
+    store(theirs, "SUCCESS", {"current": 4, "total": 4, "status": "done", "result": {"secret": True}})
+
+    fake.round_trips = 0
+    response = client.post("/api/celery/task-status/batch", headers=owner_headers,
+                           json={"task_ids": [mine[0], mine[1], mine[2], theirs, "unknown", mine[0]]})
+    assert response.status_code == 200
+    body = response.json()
+    assert fake.round_trips == 1
+    assert body["not_found"] == [theirs, "unknown"]
+    assert body["tasks"] == [
+        {"task_id": mine[0], "state": "PROGRESS", "current": 2, "total": 4, "status": "Analyzing task data..."},
+        {"task_id": mine[1], "state": "FAILURE", "current": 1, "total": 1, "status": "Task failed",
+         "error": "User 7 not found"},
+        {"task_id": mine[2], "state": "PENDING", "current": 0, "total": 1, "status": "Pending..."},
+    ]
+
+    assert client.post("/api/celery/task-status/batch", json={"task_ids": mine}).status_code == 403
+    assert client.post("/api/celery/task-status/batch", headers=owner_headers, json={"task_ids": []}).status_code == 400
+    too_many = {"task_ids": [str(n) for n in range(TASK_STATUS_BATCH_MAX + 1)]}
+    assert client.post("/api/celery/task-status/batch", headers=owner_headers, json=too_many).status_code == 400
+
+def test_worker_endpoints_serve_background_snapshot(monkeypatch):
+    from app.routers import celery_tasks
+    from app.worker_state import WorkerStateCollector
+
+    calls = {"inspect": 0, "fail": False}
+
+    class FakeInspect:
+        def active(self):
+            if calls["fail"]:
+                raise ConnectionError("broker down")
+            return {"celery@w1": [{"id": "t1", "name": "app.tasks.process_bulk_tasks", "args": [], "kwargs": {}}]}
+
+        def stats(self):
+            return {"celery@w1": {"pool": {"max-concurrency": 4}, "total": {"app.tasks.process_bulk_tasks": 3}}}
+
+        def registered(self):
+            return {"celery@w1": ["app.tasks.process_bulk_tasks"]}
+
+    def factory(timeout):
+        calls["inspect"] += 1
+        return FakeInspect()
+
+    collector = WorkerStateCollector(interval=3600, stale_after=60, inspect_factory=factory)
+    monkeypatch.setattr(celery_tasks, "worker_state", collector)
+    try:
+        import time
+        assert client.get("/api/celery/active-tasks").status_code in (200, 503)  # first call starts the collector
+        deadline = time.monotonic() + 5
+        while collector.metrics["collections"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        inspections = calls["inspect"]
+        for _ in range(5):
+            active = client.get("/api/celery/active-tasks").json()
+            workers = client.get("/api/celery/worker-stats").json()
+        assert calls["inspect"] == inspections  # requests never broadcast to workers
+        assert active["total_active"] == 1 and active["active_tasks"][0]["worker"] == "celery@w1"
+        assert active["stale"] is False and active["error"] is None and active["age_seconds"] < 60
+        assert workers["workers"][0]["registered_tasks"] == ["app.tasks.process_bulk_tasks"]
+
+        calls["fail"] = True
+        collector.collect_once()
+        collector._collected_at -= 120
+        active = client.get("/api/celery/active-tasks").json()
+        assert active["total_active"] == 1  # last good snapshot is kept
+        assert active["stale"] is True and active["error"] == "broker down"
+    finally:
+        collector.stop()
+
+
+def test_query_observability_headers_histograms_and_n_plus_one(setup_database):
+    from app.observability import QueryObservabilityMiddleware, RouteQueryMetrics, route_query_metrics
+    headers = get_auth_headers("observed")
+    client.post("/api/tasks/create_task", json={"title": "observed"}, headers=headers)
+    route_query_metrics.reset()
+
+    response = client.get("/api/tasks/get_tasks", headers=headers)
+    assert int(response.headers["X-DB-Query-Count"]) >= 1
+    assert float(response.headers["X-DB-Time-Ms"]) > 0
+    assert "X-DB-N-Plus-One" not in response.headers
+    routes = {(row["method"], row["route"]): row for row in client.get("/api/health/queries").json()["routes"]}
+    listing = routes[("GET", "/api/tasks/get_tasks")]
+    assert listing["requests"] == 1 and listing["queries_histogram"][-1] == {"le": "+Inf", "count": 1}
+    assert listing["slowest"] and listing["n_plus_one_requests"] == 0
+
+    metrics = RouteQueryMetrics()
+    probe = FastAPI()
+    probe.add_middleware(QueryObservabilityMiddleware, debug_headers=True, n_plus_one_threshold=5, metrics=metrics)
+
+    @probe.get("/owners/{owner_id}/tasks")
+    def lazy_listing(owner_id: int):
+        db = TestingSessionLocal()
+        try:
+            ids = [row.id for row in db.query(Task.id).filter(Task.owner_id == owner_id)]
+            # One lookup per row, plus an IN query whose placeholder count varies
+            for task_id in ids * 6:
+                db.get(Task, task_id)
+                db.expunge_all()
+            db.query(Task).filter(Task.id.in_(ids + [0])).all()
+            return {"ok": True}
+        finally:
+            db.close()
+
+    probe_client = TestClient(probe)
+    owner_id = client.get("/api/auth/me", headers=headers).json()["id"]
+    response = probe_client.get(f"/owners/{owner_id}/tasks")
+    assert response.headers["X-DB-Query-Count"] == "8"
+    assert response.headers["X-DB-N-Plus-One"] == "1 shape(s), max 6x"
+    [route] = metrics.snapshot()["routes"]
+    assert (route["route"], route["n_plus_one_requests"], route["queries_avg"]) == ("/owners/{owner_id}/tasks", 1, 8)
+
+
+def test_prometheus_metrics_endpoint(setup_database):
+    from celery.signals import task_postrun, task_prerun, task_retry
+    from prometheus_client import REGISTRY
+    from app.tasks import process_bulk_tasks
+    headers = get_auth_headers("scraped")
+    client.get("/api/tasks/get_tasks", headers=headers)
+    client.get("/api/tasks/get_tasks", headers=headers)
+
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/tasks/get_tasks",status="200"}' in body
+    assert 'cache_requests_total{cache="user",namespace="auth",result="hit"}' in body
+    assert 'db_pool_checkout_wait_seconds_bucket' in body
+    # No broker here: the scrape still succeeds and says so
+    assert "celery_broker_up 0.0" in body
+
+    labels = {"task": process_bulk_tasks.name, "state": "SUCCESS"}
+    runs = REGISTRY.get_sample_value("celery_task_runtime_seconds_count", labels) or 0
+    retries = REGISTRY.get_sample_value("celery_task_retries_total", {"task": process_bulk_tasks.name}) or 0
+    task_prerun.send(sender=process_bulk_tasks, task_id="metrics-1", task=process_bulk_tasks)
+    task_retry.send(sender=process_bulk_tasks, request=None, reason="flaky")
+    task_postrun.send(sender=process_bulk_tasks, task_id="metrics-1", task=process_bulk_tasks, state="SUCCESS")
+    assert REGISTRY.get_sample_value("celery_task_runtime_seconds_count", labels) == runs + 1
+    assert REGISTRY.get_sample_value("celery_task_retries_total", {"task": process_bulk_tasks.name}) == retries + 1
+
+
+def test_loadtest_plan_is_reproducible_and_compare_flags_regressions():
+    from benchmarks.loadtest import DEFAULT_MIX, build_plan, compare_reports
+    users = [{"id": n, "username": f"bench_user_{n}", "token": f"t{n}", "task_ids": [n * 10]} for n in range(3)]
+    assert build_plan(users, DEFAULT_MIX, 50, seed=7) == build_plan(users, DEFAULT_MIX, 50, seed=7)
+
+    row = {"requests": 100, "error_rate": 0.0, "requests_per_second": 200.0, "p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 0.5}
+    baseline = {"total": row, "endpoints": {"search": row}}
+    current = {
+        "total": {**row, "requests_per_second": 150.0},
+        # p99 grows 100% but by half a millisecond: noise, not a regression
+        "endpoints": {"search": {**row, "p95_ms": 23.0, "p99_ms": 1.0, "error_rate": 0.05}},
+    }
+    flagged = {(r["endpoint"], r["metric"]) for r in compare_reports(baseline, current, threshold=10) if r["regression"]}
+    assert flagged == {("total", "requests_per_second"), ("search", "p95_ms"), ("search", "error_rate")}
+    assert not any(r["regression"] for r in compare_reports(baseline, baseline))
+
+
+def test_crud_micro_records_statements_and_flags_scans(setup_database):
+    from benchmarks.crud_micro import StatementRecorder, build_cases, explain
+    headers = get_auth_headers("micro")
+    client.post("/api/tasks/create_task", json={"title": "micro"}, headers=headers)
+    user_id = client.get("/api/auth/me", headers=headers).json()["id"]
+
+    recorder = StatementRecorder(engine)
+    db = TestingSessionLocal()
+    try:
+        recorder.start()
+        build_cases()["get_tasks_with_filters[sort_by=created_at]"](db, {"id": user_id, "task_ids": []}, None, 0)
+        recorder.stop()
+    finally:
+        db.close()
+        recorder.close()
+    [(statement, parameters)] = recorder.statements.items()
+    assert recorder.count == 1
+    plan = explain(engine, statement, parameters)
+    assert not plan["full_scan"] and any("ix_tasks_owner_id_created_at" in step for step in plan["plan"])
+    assert explain(engine, "SELECT id FROM tasks WHERE description = ?", ("x",))["full_scan"]
+
+
+def test_notifications_are_deduplicated_batched_and_never_double_sent(setup_database, tmp_path, monkeypatch):
+    import json
+    from contextlib import contextmanager
+    from datetime import datetime, timedelta
+    from app import tasks as celery_jobs
+    from app.models import Notification
+    from app.notifications import FileTransport, flush_due
+    monkeypatch.setattr(celery_jobs, "SessionLocal", TestingSessionLocal)
+    get_auth_headers("notified_a")
+    get_auth_headers("notified_b")
+    db = TestingSessionLocal()
+    user_a, user_b = (db.query(User).filter(User.username == name).one().id for name in ("notified_a", "notified_b"))
+
+    first = celery_jobs.send_email_notification(user_a, "Write report", "task_created", task_id=1)
+    # A Celery retry or a repeated API call carries the same (user, task, type)
+    again = celery_jobs.send_email_notification(user_a, "Write report", "task_created", task_id=1)
+    assert again["result"] == {"notification_id": first["result"]["notification_id"], "duplicate": True}
+    celery_jobs.send_email_notification(user_a, "Write report", "task_completed", task_id=1)
+    celery_jobs.send_email_notification(user_b, "Plan sprint", "task_created")
+    assert db.query(Notification).count() == 3
+
+    transport = FileTransport(str(tmp_path))
+    assert flush_due(db, transport, window_seconds=300)["messages"] == 0  # still inside the digest window
+    later = datetime.utcnow() + timedelta(seconds=301)
+    report = flush_due(db, transport, now=later, window_seconds=300, batch_size=1)
+    assert (report["users"], report["messages"], report["notifications"], report["connections"]) == (2, 2, 3, 2)
+    outbox = [json.loads(line) for line in open(transport.path)]
+    digest_a = next(message for message in outbox if message["to"] == "notified_a@example.com")
+    assert digest_a["subject"] == "2 task updates" and "Task completed: Write report" in digest_a["body"]
+
+    class FlakyTransport(FileTransport):
+        # Delivers the first digest of the batch, then the connection drops
+        @contextmanager
+        def _open(self):
+            with super()._open() as send:
+                def flaky_send(message):
+                    if self.sent:
+                        raise ConnectionError("SMTP connection lost")
+                    send(message)
+                    self.sent += 1
+                yield flaky_send
+
+    flaky = FlakyTransport(str(tmp_path))
+    flaky.sent = 0
+    celery_jobs.send_email_notification(user_a, "Write report", "task_updated", task_id=1)
+    celery_jobs.send_email_notification(user_b, "Plan sprint", "task_completed")
+    with pytest.raises(ConnectionError):
+        flush_due(db, flaky, now=later, window_seconds=300)
+    db.expire_all()
+    pending = db.query(Notification).filter(Notification.status != "sent").all()
+    assert [(row.status, row.attempts, row.claim_token) for row in pending] == [("pending", 1, None)]
+
+    # The retry delivers only what was left; delivered rows are never picked up again
+    assert flush_due(db, transport, now=later, window_seconds=300)["notifications"] == 1
+    assert flush_due(db, transport, now=later, window_seconds=300)["messages"] == 0
+    assert len(open(transport.path).readlines()) == 4
+    assert db.query(Notification).filter(Notification.status != "sent").count() == 0
+
+    # Deduplication covers undelivered rows only: a new update after the digest went out is delivered too
+    repeated = celery_jobs.send_email_notification(user_a, "Write report", "task_updated", task_id=1)
+    assert repeated["result"]["duplicate"] is False
+    report = flush_due(db, transport, now=later, window_seconds=300)
+    assert (report["messages"], report["notifications"]) == (1, 1)
+    assert "Task updated: Write report" in json.loads(open(transport.path).readlines()[-1])["body"]
+    db.close()